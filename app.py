@@ -1,23 +1,31 @@
 """
 Главное приложение Ростелеком.
 Подключается к базе данных через модуль database и маршрутизатор.
+Старт лёгкий: клиенты хранилища и ИИ-API, модуль прогноза загружаются при первом обращении,
+прогрев после fork — services/warmup.py (WARMUP=1), отчёт о старте — services/startup.py.
 """
-from dotenv import load_dotenv
+import time
+_import_started = time.perf_counter()
+
 import os
-load_dotenv()
 
 from flask import Flask
 from flask_login import LoginManager
 
+# database.connection загружает .env — до остальных модулей проекта
 from database.connection import init_db
 from database.models import get_user_by_id
+from services.startup import startup
+
+startup.record('import', time.perf_counter() - _import_started)
 
 # Импорт роутеров (после создания app)
 def create_app():
+    t0 = time.perf_counter()
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'rostelekom-secret-key-2024'
     
-    # Подключение к Supabase
+    # Подключение к Supabase (без запросов к нему при старте)
     init_db(app)
     
     # Flask-Login
@@ -31,14 +39,33 @@ def create_app():
         return get_user_by_id(user_id)
     
     # Регистрация blueprint'ов (роутеров)
+    t_routes = time.perf_counter()
     from routes.auth import auth_bp
     from routes.dashboard import dashboard_bp
     from routes.api import api_bp
+    from routes.metrics import metrics_bp
+    from routes.health import health_bp
     
     app.register_blueprint(auth_bp, url_prefix='/')
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
     app.register_blueprint(api_bp, url_prefix='/api')
-    
+    app.register_blueprint(metrics_bp, url_prefix='/')
+    app.register_blueprint(health_bp, url_prefix='/')
+    startup.record('routes', time.perf_counter() - t_routes)
+
+    # Метрики запросов (/metrics) и заголовок Server-Timing
+    from services.metrics import init_app as init_metrics
+    init_metrics(app)
+
+    # Архивация старой истории по расписанию (RETENTION_INTERVAL_HOURS)
+    from services.retention import start_scheduler
+    start_scheduler()
+
+    # Живое состояние по записям другого процесса (ingest_asgi.py), LIVE_TAIL_INTERVAL
+    from services.ingest_tail import start_tail
+    start_tail()
+
+    startup.record('create_app', time.perf_counter() - t0)
     return app
 
 
@@ -47,4 +74,7 @@ app = create_app()
 if __name__ == "__main__":
     host = os.environ.get("HOST", "127.0.0.1")
     port = int(os.environ.get("PORT", 10000))
+    # Под gunicorn прогрев запускает post_worker_init из gunicorn.conf.py
+    from services.warmup import start_warmup
+    start_warmup()
     app.run(host=host, port=port)
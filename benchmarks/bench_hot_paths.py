@@ -0,0 +1,204 @@
+"""
+Бенчмарки горячих путей приложения без Supabase: хранилище подменяется на SQLite в памяти.
+
+Случаи:
+  - ingest            — POST /api/robots/data (разбор, upsert робота, вставка сканирований);
+  - ingest_batch      — POST /api/robots/data/batch по 50 сообщений;
+  - ingest_batch_binary — та же пачка в двоичном формате services/wire.py с gzip;
+  - stock_rebuild     — полный пересчёт остатков по истории;
+  - stock_refresh     — инкрементальный пересчёт после 100 новых записей;
+  - data_warehouse    — сборка JSON для /dashboard/data/warehouse;
+  - data_logist       — сборка JSON для /dashboard/data/logist;
+  - generate_prognoz  — generate_ai_prognoz без ключей ИИ-API (кэш прогнозов сброшен);
+  - generate_prognoz_cached — повторный generate_ai_prognoz при неизменных остатках.
+Каждый случай прогоняется для всех размеров истории (--sizes) и числа роботов (--robots).
+Результат — JSON со временем (мс) и пиковой памятью Python (tracemalloc, КиБ).
+
+    python benchmarks/bench_hot_paths.py --sizes 1000,100000,10000000 --robots 50,500 --out bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['STORAGE_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = ':memory:'
+os.environ.pop('GROQ_API_KEY', None)
+os.environ.pop('DEEPSEEK_API_KEY', None)
+os.environ['INGEST_QUEUE'] = '0'
+
+from database.backends.sqlite_backend import SQLiteBackend  # noqa: E402
+from database.connection import set_backend  # noqa: E402
+from services.wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, encode_batch  # noqa: E402
+from database.models import (  # noqa: E402
+    create_user, insert_inventory_records, recompute_products_quantities_and_status, rebuild_products_quantities_and_status,
+)
+
+PRODUCT_IDS = ['TEL-4567', 'TEL-8901', 'TEL-2345', 'TEL-6789', 'TEL-3456']
+ZONES = 'ABCDE'
+SEED_CHUNK = 5000
+
+
+def seed_history(backend, size, robots, rng):
+    """Заполняет inventory_history size записями от robots роботов."""
+    start = datetime(2024, 1, 1)
+    for offset in range(0, size, SEED_CHUNK):
+        rows = []
+        for i in range(offset, min(offset + SEED_CHUNK, size)):
+            rows.append({
+                'robot_id': f'RB-{i % robots:05d}',
+                'product_id': PRODUCT_IDS[i % len(PRODUCT_IDS)],
+                'quantity': rng.randint(5, 100),
+                'zone': ZONES[i % len(ZONES)],
+                'row_number': i % 20 + 1,
+                'shelf_number': i % 10 + 1,
+                'status': 'OK',
+                'scanned_at': (start + timedelta(seconds=i * 10)).isoformat() + 'Z',
+            })
+        backend.insert_inventory(rows)
+    backend.rebuild_rollups()
+    backend.upsert_robots([
+        {'id': f'RB-{r:05d}', 'status': 'active', 'battery_level': 80, 'last_update': start.isoformat() + 'Z',
+         'current_zone': 'A', 'current_row': 1, 'current_shelf': 1}
+        for r in range(robots)
+    ])
+
+
+def robot_message(robot_id, rng):
+    return {
+        'robot_id': robot_id,
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'location': {'zone': rng.choice(ZONES), 'row': rng.randint(1, 20), 'shelf': rng.randint(1, 10)},
+        'scan_results': [
+            {'product_id': pid, 'quantity': rng.randint(5, 100), 'status': 'OK'}
+            for pid in rng.sample(PRODUCT_IDS, k=rng.randint(1, 3))
+        ],
+        'battery_level': round(rng.uniform(20, 100), 1),
+    }
+
+
+def measure(func, repeat):
+    """Время вызовов func (мс) и пиковая память Python за все повторы (КиБ)."""
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - t0) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'min_ms': round(timings[0], 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'max_ms': round(timings[-1], 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_case(app, size, robots, repeat, rng):
+    backend = SQLiteBackend(':memory:')
+    set_backend(backend)
+    seed_history(backend, size, robots, rng)
+    create_user('bench', 'bench', 'Логист')
+
+    client = app.test_client()
+    client.post('/login', data={'login': 'bench', 'password': 'bench'})
+    robot_ids = [f'RB-{r:05d}' for r in range(robots)]
+    results = []
+
+    def record(name, func, n=repeat):
+        result = {'name': name, 'history_size': size, 'robots': robots}
+        result.update(measure(func, n))
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    def ingest():
+        r = client.post('/api/robots/data', json=robot_message(rng.choice(robot_ids), rng))
+        assert r.status_code == 200, r.get_data(as_text=True)
+
+    def ingest_batch():
+        messages = [robot_message(rng.choice(robot_ids), rng) for _ in range(50)]
+        r = client.post('/api/robots/data/batch', json={'messages': messages})
+        assert r.status_code == 200, r.get_data(as_text=True)
+
+    def ingest_batch_binary():
+        messages = [robot_message(rng.choice(robot_ids), rng) for _ in range(50)]
+        r = client.post('/api/robots/data/batch', data=encode_batch(messages, compress=True),
+                        headers={'Content-Type': WIRE_CONTENT_TYPE, 'Content-Encoding': 'gzip'})
+        assert r.status_code == 200, r.get_data(as_text=True)
+
+    def stock_refresh():
+        insert_inventory_records([
+            {'robot_id': robot_ids[0], 'product_id': rng.choice(PRODUCT_IDS), 'quantity': 10, 'zone': 'A',
+             'row_number': 1, 'shelf_number': 1, 'status': 'OK', 'scanned_at': datetime.utcnow().isoformat() + 'Z'}
+            for _ in range(100)
+        ])
+        recompute_products_quantities_and_status()
+
+    def data_endpoint(path):
+        def call():
+            r = client.get(path)
+            assert r.status_code == 200, r.status_code
+        return call
+
+    def prognoz(cached):
+        def call():
+            from services.ai_prognoz import generate_ai_prognoz, forecast_cache
+            if not cached:
+                forecast_cache.invalidate()
+            _, error = generate_ai_prognoz()
+            assert error is None, error
+        return call
+
+    record('stock_rebuild', rebuild_products_quantities_and_status, max(1, min(repeat, 5)))
+    record('stock_refresh', stock_refresh)
+    record('ingest', ingest)
+    record('ingest_batch', ingest_batch)
+    record('ingest_batch_binary', ingest_batch_binary)
+    record('data_warehouse', data_endpoint('/dashboard/data/warehouse'))
+    record('data_logist', data_endpoint('/dashboard/data/logist'))
+    record('generate_prognoz', prognoz(False), max(1, min(repeat, 5)))
+    record('generate_prognoz_cached', prognoz(True))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки горячих путей (SQLite в памяти)')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='размеры inventory_history через запятую')
+    parser.add_argument('--robots', default='50', help='число роботов через запятую')
+    parser.add_argument('--repeat', type=int, default=20, help='повторов каждого случая')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_results.json', help='куда записать JSON с результатами')
+    args = parser.parse_args()
+
+    from app import app
+    rng = random.Random(args.seed)
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        for robots in [int(r) for r in args.robots.split(',')]:
+            results.extend(run_case(app, size, robots, args.repeat, rng))
+
+    report = {
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Реализации хранилища: supabase (по умолчанию) и sqlite
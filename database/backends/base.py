@@ -0,0 +1,200 @@
+"""
+Интерфейс хранилища. Репозитории database/models.py работают только через него,
+конкретная реализация выбирается переменной окружения STORAGE_BACKEND.
+Строки передаются и возвращаются как словари с именами колонок из supabase_init.sql.
+"""
+import sqlite3
+
+
+def to_int(q):
+    """quantity из строки базы как int (число, строка или мусор -> 0)."""
+    try:
+        if isinstance(q, int):
+            return q
+        if isinstance(q, float):
+            return int(q)
+        if isinstance(q, str):
+            return int(float(q))
+    except Exception:
+        pass
+    return 0
+
+
+# HTTP-ответы PostgREST на некорректное содержимое запроса
+DATA_ERROR_STATUSES = (400, 409, 422)
+
+
+def is_data_error(exc):
+    """
+    Хранилище отклонило сами данные (NOT NULL, тип, длина строки, ограничение, число вне диапазона):
+    повтор той же записи не поможет. Ошибки соединения, тайм-ауты, 5xx, блокировки SQLite, отказ
+    в доступе (401/403) и ошибки кода (TypeError, KeyError) — не данные (False): из-за них
+    сообщения не должны уходить в dead-letter.
+    """
+    # SQLite не может сохранить целое вне INTEGER
+    if isinstance(exc, OverflowError):
+        return True
+    if isinstance(exc, sqlite3.Error):
+        return isinstance(exc, (sqlite3.IntegrityError, sqlite3.DataError))
+    # PostgREST (postgrest.APIError): code — SQLSTATE; 22xxx — неверные данные, 23xxx — нарушено ограничение
+    code = getattr(exc, 'code', None)
+    if isinstance(code, str) and code[:2] in ('22', '23'):
+        return True
+    # httpx.HTTPStatusError: запрос отклонён из-за содержимого
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status in DATA_ERROR_STATUSES
+
+
+class StorageBackend:
+    """Операции над таблицами users, robots, products, inventory_history, inventory_rollups, ai_predictions."""
+
+    name = 'base'
+
+    def ping(self):
+        """Минимальный запрос к хранилищу (проверка готовности); при недоступности бросает исключение."""
+        raise NotImplementedError
+
+    # --- users ---
+
+    def get_user(self, column, value):
+        """Строка users, у которой column == value, или None."""
+        raise NotImplementedError
+
+    def create_user(self, row):
+        """Вставляет пользователя, возвращает строку с id."""
+        raise NotImplementedError
+
+    def list_users_except_role(self, role):
+        """Пользователи с role != role, по имени."""
+        raise NotImplementedError
+
+    # --- robots ---
+
+    def list_robots(self, ids=None):
+        """Все роботы или только с id из ids."""
+        raise NotImplementedError
+
+    def upsert_robots(self, rows):
+        """Вставляет или обновляет роботов по id."""
+        raise NotImplementedError
+
+    # --- inventory_history ---
+
+    def insert_inventory(self, rows):
+        """Вставляет записи одним запросом, возвращает их с id."""
+        raise NotImplementedError
+
+    def recent_inventory(self, limit, since=None):
+        """
+        Последние записи по scanned_at DESC.
+        since: int — только id > since, строка — только scanned_at > since.
+        """
+        raise NotImplementedError
+
+    def inventory_after_id(self, after_id, limit, full=False):
+        """Записи (id, product_id, quantity) с id > after_id по возрастанию id; full — строки целиком."""
+        raise NotImplementedError
+
+    def inventory_page(self, limit, cursor=None, descending=True, product_id=None, robot_id=None,
+                       zone=None, status=None, since=None, until=None):
+        """
+        Страница inventory_history по курсору id (keyset): descending — id < cursor по убыванию id,
+        иначе id > cursor по возрастанию. Фильтры — на равенство, since <= scanned_at < until.
+        """
+        raise NotImplementedError
+
+    def latest_scans(self):
+        """Последняя по scanned_at строка inventory_history для каждой ячейки (zone, row_number, shelf_number, product_id)."""
+        raise NotImplementedError
+
+    def product_totals(self):
+        """
+        Суммы quantity по product_id на момент вызова вместе с inventory_baseline (архив).
+        Возвращает (totals, max_id): учтены все записи с id <= max_id.
+        """
+        raise NotImplementedError
+
+    def hourly_inventory(self, since):
+        """
+        Сканирования с scanned_at >= since, сгруппированные по товару и часу:
+        [{'product_id', 'bucket': 'YYYY-MM-DDTHH', 'quantity': сумма, 'scans': число}].
+        """
+        raise NotImplementedError
+
+    # --- архив inventory_history (services/retention.py) ---
+
+    def archive_candidates(self, cutoff, after_id, limit):
+        """Полные строки inventory_history с scanned_at < cutoff и id > after_id по возрастанию id."""
+        raise NotImplementedError
+
+    def compact_inventory(self, ranges, cutoff):
+        """
+        Одной транзакцией прибавляет суммы строк с id из диапазонов ranges ([(первый, последний), ...]
+        включительно) и scanned_at < cutoff к inventory_baseline и удаляет эти строки.
+        Возвращает число удалённых строк.
+        """
+        raise NotImplementedError
+
+    def restore_inventory(self, rows):
+        """
+        Возвращает строки архива в inventory_history с исходными id (уже существующие пропускаются)
+        и вычитает их из inventory_baseline. Возвращает число восстановленных строк.
+        """
+        raise NotImplementedError
+
+    def inventory_baseline(self):
+        """Строки inventory_baseline: product_id, quantity, archived_rows, archived_until."""
+        raise NotImplementedError
+
+    # --- inventory_rollups ---
+
+    def merge_rollups(self, rows):
+        """Прибавляет приращения (database.rollups.rollup_rows) к inventory_rollups."""
+        raise NotImplementedError
+
+    def rollup_series(self, granularity, since=None, until=None, product_id=None, zone=None):
+        """
+        Строки inventory_rollups гранулярности granularity с since <= bucket < until по возрастанию bucket;
+        product_id и zone сужают выборку.
+        """
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        """
+        Пересобирает inventory_rollups по inventory_history — только корзины позже горизонта архива
+        (MAX(inventory_baseline.archived_until)): строки более ранних корзин уже удалены из истории.
+        """
+        raise NotImplementedError
+
+    # --- app_state ---
+
+    def get_state(self, key):
+        """Значение служебной отметки app_state или None (нет отметки или миграция 005 не применена)."""
+        raise NotImplementedError
+
+    def set_state(self, key, value):
+        """Записывает (вставляет или заменяет) отметку app_state."""
+        raise NotImplementedError
+
+    def delete_state(self, key):
+        """Удаляет отметку app_state."""
+        raise NotImplementedError
+
+    # --- products ---
+
+    def list_products(self):
+        raise NotImplementedError
+
+    def update_product_stock(self, product_id, quantity, status):
+        """Обновляет quantity и status товара."""
+        raise NotImplementedError
+
+    # --- ai_predictions ---
+
+    def recent_predictions(self, limit):
+        """Последние прогнозы по created_at DESC."""
+        raise NotImplementedError
+
+    def insert_predictions(self, rows):
+        """Вставляет прогнозы, возвращает их с id."""
+        raise NotImplementedError
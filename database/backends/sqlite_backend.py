@@ -0,0 +1,374 @@
+"""
+Локальное хранилище в SQLite: для нагрузочных тестов, бенчмарков и CI без Supabase.
+Схема берётся из supabase_init.sql и migrations/ (без RLS-политик и функций Postgres),
+агрегаты считаются SQL-запросами.
+Нужен SQLite 3.35+ (INSERT ... RETURNING).
+"""
+import glob
+import os
+import re
+import sqlite3
+import threading
+
+from database.backends.base import StorageBackend
+from database.rollups import GRANULARITIES
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCHEMA_PATH = os.path.join(PROJECT_DIR, 'supabase_init.sql')
+MIGRATIONS_DIR = os.path.join(PROJECT_DIR, 'migrations')
+
+# Лимит параметров в одном запросе SQLite (SQLITE_MAX_VARIABLE_NUMBER с версии 3.32)
+MAX_VARIABLES = 32000
+
+# Операторы supabase_init.sql, которые есть только в Postgres/Supabase
+_POSTGRES_ONLY = re.compile(r'^\s*(ALTER TABLE|DROP POLICY|CREATE POLICY|DROP FUNCTION)', re.IGNORECASE)
+# Функции Postgres (тело $$ ... $$ содержит ';') — в SQLite их роль играют методы бэкенда
+_POSTGRES_FUNCTION = re.compile(r'CREATE\s+(OR\s+REPLACE\s+)?FUNCTION\b.*?\$\$.*?\$\$\s*;', re.IGNORECASE | re.DOTALL)
+
+
+def sqlite_schema(path=SCHEMA_PATH):
+    """Операторы supabase_init.sql в диалекте SQLite."""
+    with open(path, encoding='utf-8') as f:
+        sql = '\n'.join(line for line in f if not line.lstrip().startswith('--'))
+    sql = _POSTGRES_FUNCTION.sub('', sql)
+    statements = []
+    for stmt in sql.split(';'):
+        if not stmt.strip() or _POSTGRES_ONLY.match(stmt):
+            continue
+        statements.append(re.sub(r'\bSERIAL PRIMARY KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT', stmt, flags=re.IGNORECASE))
+    return statements
+
+
+class SQLiteBackend(StorageBackend):
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._memory = None
+        if path == ':memory:':
+            # Одна общая база в памяти для всех потоков
+            self._memory = sqlite3.connect(path, check_same_thread=False)
+            self._memory.row_factory = sqlite3.Row
+            self._memory_lock = threading.RLock()
+        self._init_schema()
+
+    def _conn(self):
+        if self._memory is not None:
+            return self._memory
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        # supabase_init.sql, затем версионные миграции migrations/NNN_*.sql по порядку
+        paths = [SCHEMA_PATH] + sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '[0-9][0-9][0-9]_*.sql')))
+        with self._tx() as conn:
+            for path in paths:
+                for stmt in sqlite_schema(path):
+                    conn.execute(stmt)
+
+    def _tx(self):
+        return _Transaction(self)
+
+    def _query(self, sql, params=()):
+        with self._tx() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def _insert_many(self, table, rows):
+        """Вставляет строки multi-row INSERT ... RETURNING, возвращает их с присвоенными id."""
+        if not rows:
+            return []
+        columns = list(rows[0])
+        row_sql = f"({', '.join('?' for _ in columns)})"
+        chunk = max(1, MAX_VARIABLES // len(columns))
+        inserted = []
+        with self._tx() as conn:
+            for start in range(0, len(rows), chunk):
+                part = rows[start:start + chunk]
+                sql = (
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(row_sql for _ in part)} "
+                    f"RETURNING *"
+                )
+                params = [row.get(c) for row in part for c in columns]
+                inserted.extend(dict(row) for row in conn.execute(sql, params).fetchall())
+        return inserted
+
+    def ping(self):
+        self._query('SELECT 1')
+
+    # --- users ---
+
+    def get_user(self, column, value):
+        if column not in ('id', 'name'):
+            raise ValueError(f'unsupported users column: {column}')
+        rows = self._query(f'SELECT * FROM users WHERE {column} = ? LIMIT 1', (value,))
+        return rows[0] if rows else None
+
+    def create_user(self, row):
+        rows = self._insert_many('users', [row])
+        return rows[0] if rows else None
+
+    def list_users_except_role(self, role):
+        return self._query('SELECT * FROM users WHERE role != ? ORDER BY name', (role,))
+
+    # --- robots ---
+
+    def list_robots(self, ids=None):
+        if ids is None:
+            return self._query('SELECT * FROM robots')
+        ids = list(ids)
+        if not ids:
+            return []
+        return self._query(f"SELECT * FROM robots WHERE id IN ({', '.join('?' for _ in ids)})", ids)
+
+    def upsert_robots(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns if c != 'id')
+        sql = (
+            f"INSERT INTO robots ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (id) DO UPDATE SET {updates}"
+        )
+        with self._tx() as conn:
+            conn.executemany(sql, [tuple(row.get(c) for c in columns) for row in rows])
+
+    # --- inventory_history ---
+
+    def insert_inventory(self, rows):
+        return self._insert_many('inventory_history', rows)
+
+    def recent_inventory(self, limit, since=None):
+        if isinstance(since, int):
+            where, params = 'WHERE id > ?', (since,)
+        elif since:
+            where, params = 'WHERE scanned_at > ?', (since,)
+        else:
+            where, params = '', ()
+        return self._query(
+            f'SELECT * FROM inventory_history {where} ORDER BY scanned_at DESC LIMIT ?', params + (limit,)
+        )
+
+    def inventory_after_id(self, after_id, limit, full=False):
+        columns = '*' if full else 'id, product_id, quantity'
+        return self._query(
+            f'SELECT {columns} FROM inventory_history WHERE id > ? ORDER BY id LIMIT ?',
+            (after_id, limit)
+        )
+
+    def inventory_page(self, limit, cursor=None, descending=True, product_id=None, robot_id=None,
+                       zone=None, status=None, since=None, until=None):
+        where, params = [], []
+        for clause, value in (
+            ('id < ?' if descending else 'id > ?', cursor), ('product_id = ?', product_id),
+            ('robot_id = ?', robot_id), ('zone = ?', zone), ('status = ?', status),
+            ('scanned_at >= ?', since), ('scanned_at < ?', until),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sql = 'SELECT * FROM inventory_history'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f" ORDER BY id {'DESC' if descending else 'ASC'} LIMIT ?"
+        return self._query(sql, params + [limit])
+
+    def latest_scans(self):
+        # Голые колонки при MAX() в SQLite берутся из строки с максимумом
+        rows = self._query(
+            'SELECT *, MAX(scanned_at) AS _latest FROM inventory_history '
+            'GROUP BY zone, row_number, shelf_number, product_id'
+        )
+        for row in rows:
+            row.pop('_latest', None)
+        return rows
+
+    def product_totals(self):
+        with self._tx() as conn:
+            max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM inventory_history').fetchone()[0]
+            rows = conn.execute(
+                'SELECT product_id, SUM(quantity) FROM inventory_history '
+                'WHERE id <= ? AND product_id IS NOT NULL GROUP BY product_id',
+                (max_id,)
+            ).fetchall()
+            baseline = conn.execute('SELECT product_id, quantity FROM inventory_baseline').fetchall()
+        totals = {pid: int(total or 0) for pid, total in baseline}
+        for pid, total in rows:
+            totals[pid] = totals.get(pid, 0) + int(total or 0)
+        return totals, max_id
+
+    def hourly_inventory(self, since):
+        return self._query(
+            'SELECT product_id, substr(scanned_at, 1, 13) AS bucket, SUM(quantity) AS quantity, COUNT(*) AS scans '
+            'FROM inventory_history WHERE scanned_at >= ? AND product_id IS NOT NULL '
+            'GROUP BY product_id, bucket ORDER BY bucket',
+            (since,)
+        )
+
+    # --- архив inventory_history ---
+
+    def archive_candidates(self, cutoff, after_id, limit):
+        return self._query(
+            'SELECT * FROM inventory_history WHERE scanned_at < ? AND id > ? ORDER BY id LIMIT ?',
+            (cutoff, after_id, limit)
+        )
+
+    def compact_inventory(self, ranges, cutoff):
+        where = 'id BETWEEN ? AND ? AND scanned_at < ?'
+        with self._tx() as conn:
+            sums = {}
+            for first, last in ranges:
+                for pid, qty, n, until in conn.execute(
+                    'SELECT product_id, SUM(quantity), COUNT(*), MAX(scanned_at) FROM inventory_history '
+                    f'WHERE {where} AND product_id IS NOT NULL GROUP BY product_id',
+                    (first, last, cutoff)
+                ):
+                    total, count, latest = sums.get(pid, (0, 0, until))
+                    sums[pid] = (total + int(qty or 0), count + n, max(latest, until))
+            conn.executemany(
+                'INSERT INTO inventory_baseline (product_id, quantity, archived_rows, archived_until, updated_at) '
+                'VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP) ON CONFLICT (product_id) DO UPDATE SET '
+                'quantity = quantity + excluded.quantity, archived_rows = archived_rows + excluded.archived_rows, '
+                "archived_until = max(COALESCE(archived_until, ''), excluded.archived_until), updated_at = excluded.updated_at",
+                [(pid, *values) for pid, values in sums.items()]
+            )
+            return sum(
+                conn.execute(f'DELETE FROM inventory_history WHERE {where}', (first, last, cutoff)).rowcount
+                for first, last in ranges
+            )
+
+    def restore_inventory(self, rows):
+        columns = ['id', 'robot_id', 'product_id', 'quantity', 'zone', 'row_number', 'shelf_number', 'status',
+                   'scanned_at', 'created_at']
+        sql = (
+            f"INSERT INTO inventory_history ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            "ON CONFLICT (id) DO NOTHING RETURNING product_id, quantity"
+        )
+        sums = {}
+        restored = 0
+        with self._tx() as conn:
+            for row in rows:
+                for pid, qty in conn.execute(sql, [row.get(c) for c in columns]).fetchall():
+                    restored += 1
+                    if pid:
+                        total, n = sums.get(pid, (0, 0))
+                        sums[pid] = (total + int(qty or 0), n + 1)
+            conn.executemany(
+                'UPDATE inventory_baseline SET quantity = quantity - ?, archived_rows = archived_rows - ?, '
+                'updated_at = CURRENT_TIMESTAMP WHERE product_id = ?',
+                [(total, n, pid) for pid, (total, n) in sums.items()]
+            )
+        return restored
+
+    def inventory_baseline(self):
+        return self._query('SELECT * FROM inventory_baseline ORDER BY product_id')
+
+    # --- inventory_rollups ---
+
+    def merge_rollups(self, rows):
+        if not rows:
+            return
+        columns = ['granularity', 'bucket', 'product_id', 'zone', 'quantity_sum', 'quantity_min', 'quantity_max', 'scans']
+        sql = (
+            f"INSERT INTO inventory_rollups ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            "ON CONFLICT (granularity, bucket, product_id, zone) DO UPDATE SET "
+            "quantity_sum = quantity_sum + excluded.quantity_sum, "
+            "quantity_min = min(quantity_min, excluded.quantity_min), "
+            "quantity_max = max(quantity_max, excluded.quantity_max), "
+            "scans = scans + excluded.scans"
+        )
+        with self._tx() as conn:
+            conn.executemany(sql, [tuple(row[c] for c in columns) for row in rows])
+
+    def rollup_series(self, granularity, since=None, until=None, product_id=None, zone=None):
+        where, params = ['granularity = ?'], [granularity]
+        for clause, value in (('bucket >= ?', since), ('bucket < ?', until), ('product_id = ?', product_id), ('zone = ?', zone)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        return self._query(
+            f"SELECT * FROM inventory_rollups WHERE {' AND '.join(where)} ORDER BY bucket, product_id, zone", params
+        )
+
+    def rebuild_rollups(self):
+        with self._tx() as conn:
+            horizon = conn.execute(
+                "SELECT replace(MAX(archived_until), ' ', 'T') FROM inventory_baseline"
+            ).fetchone()[0]
+            for granularity, length in GRANULARITIES.items():
+                # Корзины до горизонта архива (включительно) из истории уже не восстановить
+                after = horizon[:length] if horizon else ''
+                conn.execute('DELETE FROM inventory_rollups WHERE granularity = ? AND bucket > ?', (granularity, after))
+                # strftime переводит метки со смещением в UTC, как bucket_of
+                conn.execute(
+                    'INSERT INTO inventory_rollups '
+                    '(granularity, bucket, product_id, zone, quantity_sum, quantity_min, quantity_max, scans) '
+                    "SELECT ?, substr(strftime('%Y-%m-%dT%H:%M', scanned_at), 1, ?) AS b, product_id, COALESCE(zone, ''), "
+                    'SUM(quantity), MIN(quantity), MAX(quantity), COUNT(*) '
+                    'FROM inventory_history WHERE product_id IS NOT NULL AND b > ? GROUP BY 2, 3, 4',
+                    (granularity, length, after)
+                )
+
+    # --- app_state ---
+
+    def get_state(self, key):
+        rows = self._query('SELECT value FROM app_state WHERE key = ?', (key,))
+        return rows[0]['value'] if rows else None
+
+    def set_state(self, key, value):
+        with self._tx() as conn:
+            conn.execute(
+                'INSERT INTO app_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
+                (key, value)
+            )
+
+    def delete_state(self, key):
+        with self._tx() as conn:
+            conn.execute('DELETE FROM app_state WHERE key = ?', (key,))
+
+    # --- products ---
+
+    def list_products(self):
+        return self._query('SELECT * FROM products')
+
+    def update_product_stock(self, product_id, quantity, status):
+        with self._tx() as conn:
+            conn.execute('UPDATE products SET quantity = ?, status = ? WHERE id = ?', (quantity, status, product_id))
+
+    # --- ai_predictions ---
+
+    def recent_predictions(self, limit):
+        return self._query('SELECT * FROM ai_predictions ORDER BY created_at DESC, id DESC LIMIT ?', (limit,))
+
+    def insert_predictions(self, rows):
+        return self._insert_many('ai_predictions', rows)
+
+
+class _Transaction:
+    """Транзакция на соединении потока (для :memory: — под общей блокировкой)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __enter__(self):
+        if self.backend._memory is not None:
+            self.backend._memory_lock.acquire()
+        self.conn = self.backend._conn()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            if self.backend._memory is not None:
+                self.backend._memory_lock.release()
@@ -0,0 +1,294 @@
+"""
+Хранилище в Supabase (PostgREST) — реализация по умолчанию.
+"""
+from datetime import datetime
+
+from database.backends.base import StorageBackend, to_int
+from database.connection import get_supabase
+
+# Размер страницы при чтении (PostgREST по умолчанию отдаёт не больше 1000 строк)
+PAGE_SIZE = 1000
+# Без RPC inventory_latest_scans последние сканирования ячеек ищутся в стольких последних строках
+LATEST_SCANS_FALLBACK_ROWS = 50000
+# Коды PostgREST/Postgres «таблицы нет» (миграция не применена)
+MISSING_TABLE_CODES = ('PGRST205', '42P01')
+
+
+class SupabaseBackend(StorageBackend):
+    name = 'supabase'
+
+    def __init__(self):
+        # Суммы по товарам через RPC inventory_product_totals (migrations/002), пока оно есть в базе
+        self._rpc_totals = True
+
+    def ping(self):
+        get_supabase().table('products').select('id').limit(1).execute()
+
+    # --- users ---
+
+    def get_user(self, column, value):
+        r = get_supabase().table('users').select('*').eq(column, value).limit(1).execute()
+        return r.data[0] if r.data else None
+
+    def create_user(self, row):
+        r = get_supabase().table('users').insert(row).execute()
+        return r.data[0] if r.data else None
+
+    def list_users_except_role(self, role):
+        r = get_supabase().table('users').select('*').neq('role', role).order('name').execute()
+        return r.data or []
+
+    # --- robots ---
+
+    def list_robots(self, ids=None):
+        q = get_supabase().table('robots').select('*')
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return []
+            q = q.in_('id', ids)
+        r = q.execute()
+        return r.data or []
+
+    def upsert_robots(self, rows):
+        get_supabase().table('robots').upsert(rows, on_conflict='id').execute()
+
+    # --- inventory_history ---
+
+    def insert_inventory(self, rows):
+        r = get_supabase().table('inventory_history').insert(rows).execute()
+        return r.data or []
+
+    def recent_inventory(self, limit, since=None):
+        q = get_supabase().table('inventory_history').select('*')
+        if isinstance(since, int):
+            q = q.gt('id', since)
+        elif since:
+            q = q.gt('scanned_at', since)
+        r = q.order('scanned_at', desc=True).limit(limit).execute()
+        return r.data or []
+
+    def inventory_after_id(self, after_id, limit, full=False):
+        r = (
+            get_supabase().table('inventory_history')
+            .select('*' if full else 'id, product_id, quantity')
+            .gt('id', after_id)
+            .order('id')
+            .limit(limit)
+            .execute()
+        )
+        return r.data or []
+
+    def inventory_page(self, limit, cursor=None, descending=True, product_id=None, robot_id=None,
+                       zone=None, status=None, since=None, until=None):
+        q = get_supabase().table('inventory_history').select('*')
+        if cursor is not None:
+            q = q.lt('id', cursor) if descending else q.gt('id', cursor)
+        for column, value in (('product_id', product_id), ('robot_id', robot_id), ('zone', zone), ('status', status)):
+            if value is not None:
+                q = q.eq(column, value)
+        if since is not None:
+            q = q.gte('scanned_at', since)
+        if until is not None:
+            q = q.lt('scanned_at', until)
+        r = q.order('id', desc=descending).limit(limit).execute()
+        return r.data or []
+
+    def latest_scans(self):
+        try:
+            result = []
+            while True:
+                r = (
+                    get_supabase().rpc('inventory_latest_scans', {})
+                    .order('id')
+                    .range(len(result), len(result) + PAGE_SIZE - 1)
+                    .execute()
+                )
+                rows = r.data or []
+                result.extend(rows)
+                if len(rows) < PAGE_SIZE:
+                    return result
+        except Exception as e:
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+        # Миграция 003 не применена: ячейки из хвоста истории
+        latest = {}
+        before = None
+        scanned = 0
+        while scanned < LATEST_SCANS_FALLBACK_ROWS:
+            q = get_supabase().table('inventory_history').select('*')
+            if before is not None:
+                q = q.lt('id', before)
+            rows = q.order('id', desc=True).limit(PAGE_SIZE).execute().data or []
+            for row in rows:
+                key = (row.get('zone'), row.get('row_number'), row.get('shelf_number'), row.get('product_id'))
+                if key not in latest or str(row.get('scanned_at')) > str(latest[key].get('scanned_at')):
+                    latest[key] = row
+            scanned += len(rows)
+            if len(rows) < PAGE_SIZE:
+                break
+            before = rows[-1]['id']
+        return list(latest.values())
+
+    def product_totals(self):
+        if self._rpc_totals:
+            try:
+                r = get_supabase().rpc('inventory_product_totals', {}).execute()
+            except Exception as e:
+                if getattr(e, 'code', None) != 'PGRST202':
+                    raise
+                self._rpc_totals = False  # миграция 002 не применена
+            else:
+                data = r.data or {}
+                totals = {pid: to_int(q) for pid, q in (data.get('totals') or {}).items()}
+                return totals, to_int(data.get('max_id'))
+        # Без RPC PostgREST не умеет GROUP BY — суммируем постранично по id поверх архивных сумм
+        totals = {row['product_id']: to_int(row.get('quantity')) for row in self.inventory_baseline()}
+        max_id = 0
+        while True:
+            rows = self.inventory_after_id(max_id, PAGE_SIZE)
+            for row in rows:
+                pid = row.get('product_id')
+                if pid:
+                    totals[pid] = totals.get(pid, 0) + to_int(row.get('quantity'))
+            if rows:
+                max_id = rows[-1]['id']
+            if len(rows) < PAGE_SIZE:
+                return totals, max_id
+
+    def hourly_inventory(self, since):
+        buckets = {}
+        after_id = 0
+        while True:
+            r = (
+                get_supabase().table('inventory_history')
+                .select('id, product_id, quantity, scanned_at')
+                .gte('scanned_at', since)
+                .gt('id', after_id)
+                .order('id')
+                .limit(PAGE_SIZE)
+                .execute()
+            )
+            rows = r.data or []
+            for row in rows:
+                pid = row.get('product_id')
+                if not pid or not row.get('scanned_at'):
+                    continue
+                key = (pid, str(row['scanned_at'])[:13])
+                total, scans = buckets.get(key, (0, 0))
+                buckets[key] = (total + to_int(row.get('quantity')), scans + 1)
+            if len(rows) < PAGE_SIZE:
+                break
+            after_id = rows[-1]['id']
+        return [
+            {'product_id': pid, 'bucket': bucket, 'quantity': total, 'scans': scans}
+            for (pid, bucket), (total, scans) in sorted(buckets.items(), key=lambda item: item[0][1])
+        ]
+
+    # --- архив inventory_history ---
+
+    def archive_candidates(self, cutoff, after_id, limit):
+        r = (
+            get_supabase().table('inventory_history')
+            .select('*')
+            .lt('scanned_at', cutoff)
+            .gt('id', after_id)
+            .order('id')
+            .limit(limit)
+            .execute()
+        )
+        return r.data or []
+
+    def compact_inventory(self, ranges, cutoff):
+        r = get_supabase().rpc(
+            'compact_inventory_ranges', {'p_ranges': [list(r) for r in ranges], 'p_cutoff': cutoff}
+        ).execute()
+        return to_int(r.data)
+
+    def restore_inventory(self, rows):
+        restored = 0
+        for start in range(0, len(rows), PAGE_SIZE):
+            r = get_supabase().rpc('restore_inventory_rows', {'p_rows': rows[start:start + PAGE_SIZE]}).execute()
+            restored += to_int(r.data)
+        return restored
+
+    def inventory_baseline(self):
+        r = get_supabase().table('inventory_baseline').select('*').order('product_id').execute()
+        return r.data or []
+
+    # --- inventory_rollups ---
+
+    def merge_rollups(self, rows):
+        if rows:
+            get_supabase().rpc('merge_inventory_rollups', {'rows': rows}).execute()
+
+    def rollup_series(self, granularity, since=None, until=None, product_id=None, zone=None):
+        result = []
+        while True:
+            q = get_supabase().table('inventory_rollups').select('*').eq('granularity', granularity)
+            if since is not None:
+                q = q.gte('bucket', since)
+            if until is not None:
+                q = q.lt('bucket', until)
+            if product_id is not None:
+                q = q.eq('product_id', product_id)
+            if zone is not None:
+                q = q.eq('zone', zone)
+            r = (
+                q.order('bucket').order('product_id').order('zone')
+                .range(len(result), len(result) + PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = r.data or []
+            result.extend(rows)
+            if len(rows) < PAGE_SIZE:
+                return result
+
+    def rebuild_rollups(self):
+        get_supabase().rpc('rebuild_inventory_rollups', {}).execute()
+
+    # --- app_state ---
+
+    def get_state(self, key):
+        try:
+            r = get_supabase().table('app_state').select('value').eq('key', key).limit(1).execute()
+        except Exception as e:
+            if getattr(e, 'code', None) in MISSING_TABLE_CODES:
+                return None  # миграция 005 не применена
+            raise
+        return r.data[0]['value'] if r.data else None
+
+    def set_state(self, key, value):
+        get_supabase().table('app_state').upsert(
+            {'key': key, 'value': value, 'updated_at': datetime.utcnow().isoformat()}, on_conflict='key'
+        ).execute()
+
+    def delete_state(self, key):
+        get_supabase().table('app_state').delete().eq('key', key).execute()
+
+    # --- products ---
+
+    def list_products(self):
+        r = get_supabase().table('products').select('*').execute()
+        return r.data or []
+
+    def update_product_stock(self, product_id, quantity, status):
+        supabase = get_supabase()
+        payload = {'quantity': quantity, 'status': status}
+        r = supabase.table('products').update(payload).eq('id', product_id).execute()
+        if not r.data:
+            try:
+                supabase.table('products').update(payload).eq('product_id', product_id).execute()
+            except Exception:
+                pass
+
+    # --- ai_predictions ---
+
+    def recent_predictions(self, limit):
+        r = get_supabase().table('ai_predictions').select('*').order('created_at', desc=True).limit(limit).execute()
+        return r.data or []
+
+    def insert_predictions(self, rows):
+        r = get_supabase().table('ai_predictions').insert(rows).execute()
+        return r.data or []
+
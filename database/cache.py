@@ -0,0 +1,332 @@
+"""
+Кэш чтения (read-through) для редко меняющихся таблиц: каталог товаров, роботы, пользователи.
+Значение живёт ttl секунд; пути записи обновляют или сбрасывают кэш сразу.
+Счётчики hits/misses показывают, сколько запросов к Supabase удалось избежать.
+
+При SHARED_STATE=1 каталог товаров (с остатками), роботы и последние прогнозы хранятся
+в общей памяти хоста (database/shared_state.py): все воркеры gunicorn читают одну копию,
+промах загружает значение из хранилища один раз на хост, а запись в одном воркере
+сразу видна остальным по номеру версии.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database.connection import SQLITE_PATH, STORAGE_BACKEND, SUPABASE_URL
+from database.shared_state import SLOTS, get_store
+
+PRODUCTS_CACHE_TTL = float(os.environ.get('PRODUCTS_CACHE_TTL', 60))
+ROBOTS_CACHE_TTL = float(os.environ.get('ROBOTS_CACHE_TTL', 5))
+USERS_CACHE_TTL = float(os.environ.get('USERS_CACHE_TTL', 60))
+USERS_CACHE_SIZE = int(os.environ.get('USERS_CACHE_SIZE', 1024))
+PREDICTIONS_CACHE_TTL = float(os.environ.get('PREDICTIONS_CACHE_TTL', 30))
+# Как долго процесс доверяет прочитанной отметке «агрегаты устарели» из app_state (секунды)
+ROLLUPS_STATE_TTL = float(os.environ.get('ROLLUPS_STATE_TTL', 5))
+# Общие для воркеров кэши в памяти хоста (несколько воркеров gunicorn)
+SHARED_STATE = os.environ.get('SHARED_STATE', '0') == '1'
+# Разные базы на одном хосте получают разные каталоги общей памяти
+STORAGE_ID = f'{STORAGE_BACKEND}:{os.path.abspath(SQLITE_PATH) if STORAGE_BACKEND == "sqlite" else SUPABASE_URL}'
+
+log = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш значений по ключу с временем жизни.
+    При заданном maxsize хранит не больше maxsize ключей, вытесняя давно не читавшиеся (LRU).
+    """
+
+    def __init__(self, name, ttl, maxsize=None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def get_or_load(self, key, loader):
+        """Значение из кэша или результат loader(), который сохраняется на ttl секунд."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def get(self, key):
+        """Живое значение или None (учитывается в hits/misses)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._version += 1
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def update(self, key, func):
+        """Заменяет живое значение на func(value); устаревшее или отсутствующее не трогает."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._version += 1
+                self._data[key] = (entry[0], func(entry[1]))
+
+    def invalidate(self, key=None):
+        """Сбрасывает ключ или весь кэш."""
+        with self._lock:
+            self._version += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def version(self, key):
+        """
+        Номер, который меняется при каждой записи и сбросе кэша (ETag без чтения значения; только
+        в этом процессе), или None, если живого значения key нет.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            return self._version if entry and entry[0] > time.monotonic() else None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+
+class SharedCache:
+    """
+    Кэш с тем же интерфейсом, что TTLCache, но значения лежат в общей памяти хоста.
+    Чтение сверяет номер версии ключа и кэша из общей памяти с версией своей копии и
+    десериализует значение только после чужой записи. Промах загружается под межпроцессной
+    блокировкой ключа: пока один воркер читает хранилище, остальные ждут его результат.
+    """
+
+    def __init__(self, name, ttl, storage_id=STORAGE_ID):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = None
+        self.storage_id = storage_id
+        self._local = {}  # key -> (версия кэша, версия ключа, expires_at, value)
+        self._key_names = {}  # key -> (файл значения, слот версии)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0  # значений, прочитанных из общей памяти (записаны другим процессом или потоком)
+        self.writes = 0
+        self.name_slot = _slot(name)
+        get_store(storage_id)  # каталог недоступен — ошибка сразу, при создании кэша
+        _registry[name] = self
+
+    def get_or_load(self, key, loader):
+        value, found, _ = self._lookup(key)
+        if found:
+            return value
+        store = get_store(self.storage_id)
+        with store.lock(self._file(key)):
+            # Пока ждали блокировку, значение мог загрузить другой воркер
+            value, found, _ = self._lookup(key, count=False)
+            if found:
+                return value
+            # Версия кэша до загрузки: сброс во время загрузки сделает значение недействительным
+            name_version = store.version(self.name_slot)
+            value = loader()
+            self._store(store, key, value, time.time() + self.ttl, name_version)
+        return value
+
+    def get(self, key):
+        value, _, _ = self._lookup(key)
+        return value
+
+    def set(self, key, value):
+        store = get_store(self.storage_id)
+        with store.lock(self._file(key)):
+            self._store(store, key, value, time.time() + self.ttl, store.version(self.name_slot))
+
+    def update(self, key, func):
+        """Заменяет живое значение на func(value) во всех процессах; устаревшее или отсутствующее не трогает."""
+        store = get_store(self.storage_id)
+        with store.lock(self._file(key)):
+            name_version = store.version(self.name_slot)
+            value, found, expires_at = self._lookup(key, count=False, name_version=name_version)
+            if found:
+                # Сброс всего кэша (invalidate() без ключа не берёт блокировку ключа) после чтения
+                # оставит записанному файлу старую версию кэша — читатели его не примут
+                self._store(store, key, func(value), expires_at, name_version)
+
+    def invalidate(self, key=None):
+        """Сбрасывает ключ или весь кэш во всех процессах."""
+        store = get_store(self.storage_id)
+        if key is None:
+            # Сначала версия: файлы, которые допишутся после удаления, уже недействительны
+            store.bump(self.name_slot)
+            store.remove_prefix(f'{self.name}-', '.bin')
+            with self._lock:
+                self._local.clear()
+            return
+        with store.lock(self._file(key)):
+            store.remove(self._file(key))
+            store.bump(self._key_slot(key))
+        with self._lock:
+            self._local.pop(key, None)
+
+    def version(self, key):
+        """
+        Версии кэша и ключа из общей памяти (меняются при записи и сбросе в любом процессе)
+        или None, если копии значения в процессе нет или срок жизни истёк.
+        """
+        store = get_store(self.storage_id)
+        versions = store.version(self.name_slot), store.version(self._key_slot(key))
+        with self._lock:
+            entry = self._local.get(key)
+        if entry is None or entry[:2] != versions or entry[2] <= time.time():
+            return None
+        return versions
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'size': len(self._local),
+                'maxsize': None,
+                'ttl': self.ttl,
+                'shared': True,
+                'shared_loads': self.loads,
+                'shared_writes': self.writes,
+            }
+
+    def _lookup(self, key, count=True, name_version=None):
+        """(value, found, expires_at) по версиям из общей памяти; копия процесса обновляется после чужой записи."""
+        store = get_store(self.storage_id)
+        # Версии читаются до файла: запись после этого момента сменит версию, и копия перечитается
+        if name_version is None:
+            name_version = store.version(self.name_slot)
+        key_version = store.version(self._key_slot(key))
+        with self._lock:
+            entry = self._local.get(key)
+        if entry is None or entry[0] != name_version or entry[1] != key_version:
+            loaded = store.read(self._file(key))
+            with self._lock:
+                # Файл, записанный до сброса всего кэша, недействителен
+                if loaded is None or loaded[0] != name_version:
+                    self._local.pop(key, None)
+                    entry = None
+                else:
+                    entry = (name_version, key_version, loaded[2], loaded[3])
+                    self._local[key] = entry
+                    self.loads += 1
+        found = entry is not None and entry[2] > time.time()
+        if count:
+            with self._lock:
+                if found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return (entry[3], True, entry[2]) if found else (None, False, None)
+
+    def _store(self, store, key, value, expires_at, name_version):
+        """
+        Пишет значение (блокировка ключа уже взята) и запоминает его как копию процесса.
+        name_version — версия кэша, при которой значение прочитано или загружено.
+        """
+        version = store.next_version()
+        store.write(self._file(key), name_version, version, expires_at, value)
+        store.set_version(self._key_slot(key), version)
+        with self._lock:
+            self._local[key] = (name_version, version, expires_at, value)
+            self.writes += 1
+
+    def _file(self, key):
+        return self._names(key)[0]
+
+    def _key_slot(self, key):
+        return self._names(key)[1]
+
+    def _names(self, key):
+        names = self._key_names.get(key)
+        if names is None:
+            digest = _digest(self.name, key)
+            names = self._key_names[key] = (f'{self.name}-{digest}.bin', 1 + int(digest, 16) % (SLOTS - 1))
+        return names
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def _slot(*parts):
+    # Слот 0 — общий счётчик версий
+    return 1 + int(_digest(*parts), 16) % (SLOTS - 1)
+
+
+def make_cache(name, ttl):
+    """SharedCache при SHARED_STATE=1 (если каталог общей памяти доступен), иначе TTLCache процесса."""
+    if SHARED_STATE:
+        try:
+            return SharedCache(name, ttl)
+        except OSError:
+            log.exception('Общий кэш %s недоступен, используется кэш процесса', name)
+    return TTLCache(name, ttl)
+
+
+def cache_stats():
+    """Счётчики всех кэшей: {имя: {hits, misses, hit_rate, size, maxsize, ttl}}."""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+def invalidate_all():
+    """Сбрасывает все кэши процесса (например, при смене хранилища)."""
+    for cache in _registry.values():
+        cache.invalidate()
+
+
+def merge_rows(rows, changes, key='id', append=True):
+    """
+    Новый список строк, в котором строки с совпадающим key дополнены полями из changes.
+    Строки changes без пары добавляются в конец, если append=True.
+    """
+    by_key = {c[key]: c for c in changes}
+    merged = [dict(row, **by_key.pop(row.get(key))) if row.get(key) in by_key else row for row in rows]
+    return merged + list(by_key.values()) if append else merged
+
+
+products_cache = make_cache('products', PRODUCTS_CACHE_TTL)
+robots_cache = make_cache('robots', ROBOTS_CACHE_TTL)
+predictions_cache = make_cache('predictions', PREDICTIONS_CACHE_TTL)
+rollups_state_cache = make_cache('rollups_state', ROLLUPS_STATE_TTL)
+# Пользователи (с хэшами паролей) в общую память не попадают
+users_cache = TTLCache('users', USERS_CACHE_TTL, maxsize=USERS_CACHE_SIZE)
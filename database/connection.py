@@ -1,8 +1,12 @@
 """
-Подключение к Supabase через URL и API key.
+Подключение к Supabase через URL и API key и выбор хранилища (STORAGE_BACKEND).
+Переменные из .env загружаются здесь, один раз на процесс: модуль импортируется раньше
+остальных модулей проекта. Клиент supabase (и его httpx, pydantic) импортируется при первом
+обращении к Supabase, а не при старте воркера.
 """
 import os
-from supabase import create_client, Client
+import threading
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,26 +20,95 @@ SUPABASE_KEY = os.environ.get(
     "sb_publishable_yUGmf-IJm411Pp3aT-_cng_agoXT3Pw"
 )
 
-_supabase: Client | None = None
+# Хранилище: supabase (по умолчанию) или sqlite — локальная база по схеме supabase_init.sql
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'supabase').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'rostelekom.db')
+
+_supabase = None
+_supabase_pid = None
+_supabase_lock = threading.Lock()
+_backend = None
 
 
-def get_supabase() -> Client:
-    """Возвращает клиент Supabase (singleton)."""
-    global _supabase
-    if _supabase is None:
-        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+def get_supabase():
+    """
+    Клиент Supabase текущего процесса: создаётся при первом обращении и заново после fork
+    воркера gunicorn, со своим пулом соединений (services/http_clients.py).
+    """
+    global _supabase, _supabase_pid
+    if _supabase is None or _supabase_pid != os.getpid():
+        with _supabase_lock:
+            if _supabase is None or _supabase_pid != os.getpid():
+                from supabase import ClientOptions, create_client
+                from services.http_clients import supabase_http_client
+                from services.metrics import instrument_http_client
+                client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=supabase_http_client()))
+                instrument_http_client(client.postgrest.session)
+                _supabase, _supabase_pid = client, os.getpid()
     return _supabase
 
 
+def get_backend():
+    """Возвращает хранилище, выбранное STORAGE_BACKEND (singleton)."""
+    global _backend
+    if _backend is None:
+        from services.metrics import instrument_backend
+        if STORAGE_BACKEND == 'sqlite':
+            from database.backends.sqlite_backend import SQLiteBackend
+            _backend = instrument_backend(SQLiteBackend(SQLITE_PATH))
+        elif STORAGE_BACKEND == 'supabase':
+            from database.backends.supabase_backend import SupabaseBackend
+            _backend = instrument_backend(SupabaseBackend())
+        else:
+            raise ValueError(f'Неизвестный STORAGE_BACKEND: {STORAGE_BACKEND}')
+    return _backend
+
+
+def set_backend(backend):
+    """Подменяет хранилище (бенчмарки, нагрузочные тесты) и сбрасывает производное состояние процесса."""
+    global _backend, _admin_ready
+    from services.metrics import instrument_backend
+    _backend = instrument_backend(backend)
+    _admin_ready = False
+    from database.cache import invalidate_all
+    from database.live_state import live_state
+    from database.models import rollup_state
+    from database.stock import stock_aggregator
+    invalidate_all()
+    live_state.reset()
+    rollup_state['unmarked'] = False
+    stock_aggregator.reset()
+
+
+_admin_ready = False
+_admin_lock = threading.Lock()
+
+
 def init_db(app):
     """
-    Инициализация подключения к Supabase.
-    Таблицы создаются через SQL-скрипт supabase_init.sql в дашборде Supabase.
+    Инициализация подключения к хранилищу — без обращений к нему при старте воркера:
+    клиент создаётся при первом запросе (get_supabase, get_backend), пользователь admin
+    проверяется при первом входе или прогреве (ensure_admin).
+    Таблицы Supabase создаются через SQL-скрипт supabase_init.sql в дашборде Supabase,
+    для STORAGE_BACKEND=sqlite схема создаётся автоматически.
     """
-    try:
-        from database.models import get_user_by_name, create_user
-        admin = get_user_by_name('admin')
-        if not admin:
-            create_user('admin', '15801580', 'admin')
-    except Exception:
-        pass  # Таблицы могут ещё не существовать — выполните supabase_init.sql в Supabase SQL Editor
+    app.config.setdefault('STORAGE_BACKEND', STORAGE_BACKEND)
+
+
+def ensure_admin():
+    """Создаёт пользователя admin, если его нет. Один раз на процесс; после ошибки — снова при следующем вызове."""
+    global _admin_ready
+    if _admin_ready:
+        return
+    with _admin_lock:
+        if _admin_ready:
+            return
+        try:
+            from database.models import get_user_by_name, create_user
+            if not get_user_by_name('admin'):
+                create_user('admin', '15801580', 'admin')
+            _admin_ready = True
+        except Exception:
+            # Таблицы могут ещё не существовать — выполните supabase_init.sql в Supabase SQL Editor
+            from services.metrics import report_error
+            report_error('init_db', 'Не удалось проверить пользователя admin')
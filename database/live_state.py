@@ -0,0 +1,462 @@
+"""
+Живое состояние склада в памяти процесса: роботы и последнее сканирование каждой ячейки
+(зона, ряд, полка, товар). Обновляется при каждой записи данных роботов (database/models.py),
+поэтому дашборды получают текущее состояние без запросов к хранилищу.
+
+Хранение колоночное: строки — индексы в массивах NumPy, строковые значения (зоны, товары,
+статусы) заменены кодами, время — микросекунды UTC в int64. Ячейка ищется по одному
+целому ключу, упакованному из кодов. Индекс мест хранения: полка (зона, ряд, полка) -> её ячейки,
+и агрегаты по зонам и рядам (сумма остатков, число ячеек по статусам сканирования), которые
+обновляются на каждом сканировании за постоянное время, независимо от длины истории.
+При первом обращении в процессе состояние восстанавливается из хранилища (роботы, последние сканирования ячеек, хвост истории).
+"""
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+LIVE_STATE_ENABLED = os.environ.get('LIVE_STATE', '1') == '1'
+# Сколько последних сканирований держать для ленты дашбордов
+LIVE_RECENT = int(os.environ.get('LIVE_RECENT', 200))
+
+# Значение «нет времени» в колонках с микросекундами
+NO_TIME = np.iinfo(np.int64).min
+# Бит на поле в ключе ячейки (ряд и полка — до миллиона)
+KEY_BITS = 20
+# Наибольший ряд и полка, которые помещаются в ключ (в ключе хранится значение + 1, -1 — нет значения)
+LOCATION_MAX = 2 ** KEY_BITS - 2
+# Заряд батареи, %: telemetry принимает 0..100; в колонке int16 значения вне диапазона — «нет данных»
+BATTERY_MAX = 100
+# Статусы сканирования, которые считаются в агрегатах отдельно; остальные — в other
+STATUS_COLUMNS = {'OK': 'ok', 'LOW_STOCK': 'low_stock', 'CRITICAL': 'critical'}
+_AGGREGATE_DTYPES = {
+    'zone': np.int32, 'row': np.int32, 'cells': np.int32, 'quantity': np.int64,
+    'ok': np.int32, 'low_stock': np.int32, 'critical': np.int32, 'other': np.int32, 'scanned': np.int64,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_micros(value):
+    """ISO-строка или datetime -> микросекунды UTC (NO_TIME, если не разобрать)."""
+    if not value:
+        return NO_TIME
+    try:
+        dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return NO_TIME
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(micros):
+    """Микросекунды UTC -> ISO-строка с Z (как пишет приложение) или None."""
+    if micros == NO_TIME:
+        return None
+    seconds, us = divmod(int(micros), 1_000_000)
+    return datetime.utcfromtimestamp(seconds).replace(microsecond=us).isoformat() + 'Z'
+
+
+class _Codes:
+    """Строка <-> небольшой целый код; код 0 — None."""
+
+    def __init__(self):
+        self.values = [None]
+        self.index = {None: 0}
+
+    def code(self, value):
+        c = self.index.get(value)
+        if c is None:
+            c = self.index[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+
+class _Columns:
+    """Набор массивов одинаковой длины с удвоением ёмкости."""
+
+    def __init__(self, dtypes, capacity=64):
+        self.size = 0
+        self.arrays = {name: np.zeros(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self):
+        if self.size == len(next(iter(self.arrays.values()))):
+            for name, arr in self.arrays.items():
+                grown = np.zeros(len(arr) * 2, dtype=arr.dtype)
+                grown[:self.size] = arr[:self.size]
+                self.arrays[name] = grown
+        self.size += 1
+        return self.size - 1
+
+    def view(self, name):
+        return self.arrays[name][:self.size]
+
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self.arrays.values())
+
+
+class LiveState:
+    """Роботы, последние сканирования ячеек и лента последних сканирований."""
+
+    def __init__(self, recent_size=LIVE_RECENT):
+        self.recent_size = recent_size
+        self._lock = threading.RLock()
+        self._version = 0
+        # id строк, записанных этим процессом, для догонялки (services/ingest_tail.py); None — не нужны
+        self._applied = None
+        self._clear()
+
+    def _clear(self):
+        self._loaded = False
+        self._version += 1
+        self._zones = _Codes()
+        self._products = _Codes()
+        self._statuses = _Codes()
+        self._robot_ids = []
+        self._robot_slot = {}
+        self._robots = _Columns({
+            'battery': np.int16, 'status': np.int16, 'zone': np.int32,
+            'row': np.int32, 'shelf': np.int32, 'updated': np.int64,
+        })
+        self._cell_slot = {}
+        self._cells = _Columns({
+            'zone': np.int32, 'row': np.int32, 'shelf': np.int32, 'product': np.int32,
+            'quantity': np.int32, 'status': np.int16, 'robot': np.int32, 'scanned': np.int64, 'id': np.int64,
+        })
+        self._shelf_cells = {}  # ключ полки -> слоты её ячеек
+        self._zone_slot = {}
+        self._zone_agg = _Columns(_AGGREGATE_DTYPES)
+        self._row_slot = {}
+        self._row_agg = _Columns(_AGGREGATE_DTYPES)
+        self._recent = deque(maxlen=self.recent_size)
+        self._recent_ids = set()
+
+    # --- загрузка ---
+
+    def ensure_loaded(self, backend):
+        """Восстанавливает состояние из хранилища при первом обращении."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._clear()
+            self._apply_robots(backend.list_robots())
+            self._apply_cells(backend.latest_scans())
+            self._apply_recent(sorted(backend.recent_inventory(self.recent_size), key=lambda r: r.get('id') or 0))
+            self._loaded = True
+
+    @classmethod
+    def from_scans(cls, rows):
+        """Разовое состояние только из строк latest_scans (индекс мест и агрегаты при LIVE_STATE=0)."""
+        state = cls(recent_size=0)
+        state._apply_cells(rows)
+        return state
+
+    def version(self):
+        """
+        Номер версии роботов и ленты сканирований (ETag дашбордов): растёт, когда меняется
+        что-то, кроме одного last_update робота. Номер действует только в этом процессе.
+        """
+        return self._version
+
+    def reset(self):
+        """Забывает состояние; следующее обращение загрузит его заново (смена хранилища)."""
+        with self._lock:
+            self._clear()
+
+    # --- обновление при записи ---
+
+    def apply_robots(self, rows):
+        """Строки robots, только что записанные в хранилище."""
+        if not self._loaded or not rows:
+            return
+        with self._lock:
+            self._apply_robots(rows)
+
+    def apply_inventory(self, rows):
+        """
+        Строки inventory_history (с id), только что записанные в хранилище.
+        Возвращает строки, которых ещё не было в ленте последних сканирований (до загрузки — все).
+        """
+        if not rows:
+            return []
+        with self._lock:
+            if self._applied is not None:
+                self._applied.update(row.get('id') for row in rows)
+            if not self._loaded:
+                return list(rows)
+            self._apply_cells(rows)
+            return self._apply_recent(rows)
+
+    def track_applied(self):
+        """Начинает запоминать id применённых строк (для take_applied)."""
+        with self._lock:
+            if self._applied is None:
+                self._applied = set()
+
+    def take_applied(self):
+        """id строк, применённых после предыдущего вызова (после track_applied)."""
+        with self._lock:
+            ids = self._applied or set()
+            if self._applied is not None:
+                self._applied = set()
+            return ids
+
+    def _apply_robots(self, rows):
+        cols = self._robots.arrays
+        for row in rows:
+            robot_id = row.get('id')
+            if robot_id is None:
+                continue
+            slot = self._robot_slot.get(robot_id)
+            if slot is None:
+                slot = self._robots.append()
+                cols = self._robots.arrays
+                self._robot_slot[robot_id] = slot
+                self._robot_ids.append(robot_id)
+                self._version += 1
+            values = (
+                _bounded(row.get('battery_level'), BATTERY_MAX), self._statuses.code(row.get('status')),
+                self._zones.code(row.get('current_zone')), _int_or(row.get('current_row'), -1),
+                _int_or(row.get('current_shelf'), -1),
+            )
+            if values != (cols['battery'][slot], cols['status'][slot], cols['zone'][slot],
+                          cols['row'][slot], cols['shelf'][slot]):
+                cols['battery'][slot], cols['status'][slot], cols['zone'][slot], cols['row'][slot], \
+                    cols['shelf'][slot] = values
+                self._version += 1
+            cols['updated'][slot] = to_micros(row.get('last_update'))
+
+    def _apply_cells(self, rows):
+        cols = self._cells.arrays
+        for row in rows:
+            zone = self._zones.code(row.get('zone'))
+            product = self._products.code(row.get('product_id'))
+            row_number = _int_or(row.get('row_number'), -1)
+            shelf = _int_or(row.get('shelf_number'), -1)
+            if not (-1 <= row_number <= LOCATION_MAX and -1 <= shelf <= LOCATION_MAX):
+                continue  # старая строка вне диапазона ключа: ключ совпал бы с ключом другой ячейки
+            scanned = to_micros(row.get('scanned_at'))
+            shelf_key = location_key(zone, row_number, shelf)
+            key = shelf_key << KEY_BITS | product
+            slot = self._cell_slot.get(key)
+            quantity = _int_or(row.get('quantity'), 0)
+            status = row.get('status')
+            if slot is None:
+                slot = self._cells.append()
+                cols = self._cells.arrays
+                self._cell_slot[key] = slot
+                self._shelf_cells.setdefault(shelf_key, []).append(slot)
+                cols['zone'][slot] = zone
+                cols['row'][slot] = row_number
+                cols['shelf'][slot] = shelf
+                cols['product'][slot] = product
+                self._aggregate(zone, row_number, None, status, quantity, scanned)
+            elif cols['scanned'][slot] > scanned:
+                continue  # пришло более старое сканирование этой ячейки
+            else:
+                previous = (self._statuses.values[cols['status'][slot]], int(cols['quantity'][slot]))
+                self._aggregate(zone, row_number, previous, status, quantity, scanned)
+            cols['quantity'][slot] = quantity
+            cols['status'][slot] = self._statuses.code(status)
+            cols['robot'][slot] = self._robot_slot.get(row.get('robot_id'), -1)
+            cols['scanned'][slot] = scanned
+            cols['id'][slot] = _int_or(row.get('id'), 0)
+
+    def _aggregate(self, zone, row_number, previous, status, quantity, scanned):
+        """Переносит вклад ячейки в агрегатах её зоны и ряда: previous — (статус, остаток) или None для новой."""
+        for slots, columns, key, agg_row in (
+            (self._zone_slot, self._zone_agg, zone, -1),
+            (self._row_slot, self._row_agg, zone << KEY_BITS | (row_number + 1), row_number),
+        ):
+            slot = slots.get(key)
+            if slot is None:
+                slot = slots[key] = columns.append()
+                columns.arrays['zone'][slot] = zone
+                columns.arrays['row'][slot] = agg_row
+                columns.arrays['scanned'][slot] = NO_TIME
+            cols = columns.arrays
+            if previous is None:
+                cols['cells'][slot] += 1
+            else:
+                cols[STATUS_COLUMNS.get(previous[0], 'other')][slot] -= 1
+                cols['quantity'][slot] -= previous[1]
+            cols[STATUS_COLUMNS.get(status, 'other')][slot] += 1
+            cols['quantity'][slot] += quantity
+            if scanned > cols['scanned'][slot]:
+                cols['scanned'][slot] = scanned
+
+    def _apply_recent(self, rows):
+        fresh = []
+        for row in rows:
+            rid = row.get('id')
+            if rid in self._recent_ids:
+                continue
+            fresh.append(row)
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_ids.discard(self._recent[0].get('id'))
+            self._recent.append(dict(row))
+            self._recent_ids.add(rid)
+            self._version += 1
+        return fresh
+
+    # --- чтение ---
+
+    def robots(self):
+        """Роботы в формате строк таблицы robots."""
+        with self._lock:
+            n = self._robots.size
+            cols = {name: arr[:n].tolist() for name, arr in self._robots.arrays.items()}
+            return [
+                {
+                    'id': robot_id,
+                    'status': self._statuses.values[cols['status'][i]],
+                    'battery_level': None if cols['battery'][i] < 0 else cols['battery'][i],
+                    'last_update': from_micros(cols['updated'][i]),
+                    'current_zone': self._zones.values[cols['zone'][i]],
+                    'current_row': None if cols['row'][i] < 0 else cols['row'][i],
+                    'current_shelf': None if cols['shelf'][i] < 0 else cols['shelf'][i],
+                }
+                for i, robot_id in enumerate(self._robot_ids)
+            ]
+
+    def recent_inventory(self, limit, since=None):
+        """Последние сканирования по scanned_at DESC; since — как у get_inventory_history."""
+        with self._lock:
+            rows = list(self._recent)
+        if isinstance(since, int):
+            rows = [r for r in rows if (r.get('id') or 0) > since]
+        elif since:
+            rows = [r for r in rows if str(r.get('scanned_at') or '') > since]
+        rows.sort(key=lambda r: (str(r.get('scanned_at') or ''), r.get('id') or 0), reverse=True)
+        return [dict(r) for r in rows[:limit]]
+
+    def shelf(self, zone, row, shelf):
+        """Что лежит на полке: последние сканирования её ячеек по индексу мест хранения."""
+        with self._lock:
+            zone_code = self._zones.index.get(zone)
+            row, shelf = int(row), int(shelf)
+            if zone_code is None or not (0 <= row <= LOCATION_MAX and 0 <= shelf <= LOCATION_MAX):
+                return []
+            slots = self._shelf_cells.get(location_key(zone_code, row, shelf), [])
+            return [self._cell_row(slot) for slot in slots]
+
+    def heatmap(self, zone=None, status=None):
+        """
+        Заполненность по зонам и рядам из агрегатов: {'zones': [...], 'rows': [...]}.
+        status (OK, LOW_STOCK, CRITICAL) — только зоны и ряды, где есть ячейки с этим статусом.
+        """
+        column = STATUS_COLUMNS.get(status, 'other') if status else None
+        with self._lock:
+            zone_code = None
+            if zone is not None:
+                zone_code = self._zones.index.get(zone)
+                if zone_code is None:
+                    return {'zones': [], 'rows': []}
+            return {
+                'zones': self._aggregate_rows(self._zone_agg, zone_code, column),
+                'rows': self._aggregate_rows(self._row_agg, zone_code, column),
+            }
+
+    def _aggregate_rows(self, columns, zone_code, column):
+        n = columns.size
+        mask = np.ones(n, dtype=bool)
+        if zone_code is not None:
+            mask &= columns.view('zone') == zone_code
+        if column:
+            mask &= columns.view(column) > 0
+        idx = np.flatnonzero(mask)
+        cols = {name: arr[:n][idx].tolist() for name, arr in columns.arrays.items()}
+        result = []
+        for i in range(len(idx)):
+            item = {'zone': self._zones.values[cols['zone'][i]]}
+            if columns is self._row_agg:
+                item['row_number'] = None if cols['row'][i] < 0 else cols['row'][i]
+            item.update({
+                'cells': cols['cells'][i],
+                'quantity': cols['quantity'][i],
+                'ok': cols['ok'][i],
+                'low_stock': cols['low_stock'][i],
+                'critical': cols['critical'][i],
+                'other': cols['other'][i],
+                'last_scan': from_micros(cols['scanned'][i]),
+            })
+            result.append(item)
+        result.sort(key=lambda r: (str(r['zone'] or ''), r.get('row_number') or 0))
+        return result
+
+    def _cell_row(self, slot):
+        cols = self._cells.arrays
+        robot = int(cols['robot'][slot])
+        return {
+            'id': int(cols['id'][slot]),
+            'zone': self._zones.values[cols['zone'][slot]],
+            'row_number': None if cols['row'][slot] < 0 else int(cols['row'][slot]),
+            'shelf_number': None if cols['shelf'][slot] < 0 else int(cols['shelf'][slot]),
+            'product_id': self._products.values[cols['product'][slot]],
+            'quantity': int(cols['quantity'][slot]),
+            'status': self._statuses.values[cols['status'][slot]],
+            'robot_id': self._robot_ids[robot] if robot >= 0 else None,
+            'scanned_at': from_micros(cols['scanned'][slot]),
+        }
+
+    def shelf_scans(self, zone=None, row=None, shelf=None, product_id=None):
+        """Последние сканирования ячеек (зона, ряд, полка, товар) с фильтрами."""
+        with self._lock:
+            n = self._cells.size
+            mask = np.ones(n, dtype=bool)
+            for name, value, codes in (('zone', zone, self._zones), ('product', product_id, self._products)):
+                if value is not None:
+                    code = codes.index.get(value)
+                    if code is None:
+                        return []
+                    mask &= self._cells.view(name) == code
+            for name, value in (('row', row), ('shelf', shelf)):
+                if value is not None:
+                    mask &= self._cells.view(name) == int(value)
+            return [self._cell_row(slot) for slot in np.flatnonzero(mask).tolist()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'robots': self._robots.size,
+                'cells': self._cells.size,
+                'shelves': len(self._shelf_cells),
+                'zones': self._zone_agg.size,
+                'rows': self._row_agg.size,
+                'recent': len(self._recent),
+                'array_bytes': (self._robots.nbytes() + self._cells.nbytes()
+                                + self._zone_agg.nbytes() + self._row_agg.nbytes()),
+            }
+
+
+def location_key(zone_code, row, shelf):
+    """Целый ключ полки из кода зоны, ряда и полки (-1 — нет значения; ряд и полка — до LOCATION_MAX)."""
+    return (zone_code << KEY_BITS | (row + 1)) << KEY_BITS | (shelf + 1)
+
+
+def cell_key(zone_code, row, shelf, product_code):
+    """Целый ключ ячейки: ключ полки и код товара."""
+    return location_key(zone_code, row, shelf) << KEY_BITS | product_code
+
+
+def _bounded(value, maximum):
+    """Целое 0..maximum или -1 (нет значения или вне диапазона колонки)."""
+    value = _int_or(value, -1)
+    return value if 0 <= value <= maximum else -1
+
+
+def _int_or(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return default
+
+
+live_state = LiveState()
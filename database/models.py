@@ -1,11 +1,16 @@
 """
-Модели и репозитории для Supabase.
-Таблицы: users, robots, products, inventory_history, ai_predictions
+Модели и репозитории. Работают через хранилище get_backend() (Supabase или SQLite).
+Таблицы: users, robots, products, inventory_history, inventory_rollups, ai_predictions
 """
+import json
 from datetime import datetime, date
 from flask_login import UserMixin
 
-from database.connection import get_supabase
+from database.cache import predictions_cache, products_cache, robots_cache, rollups_state_cache, users_cache, merge_rows
+from database.connection import get_backend
+from database.live_state import LIVE_STATE_ENABLED, LiveState, live_state
+from database.rollups import ROLLUPS_ENABLED, GRANULARITIES, rollup_rows, sum_zones
+from database.stock import IDEAL_QUANTITY, stock_aggregator
 
 
 # --- User ---
@@ -45,40 +50,47 @@ def _user_from_row(row):
     )
 
 
-def get_user_by_id(user_id):
+def _load_user(column, value):
     try:
-        supabase = get_supabase()
-        r = supabase.table('users').select('*').eq('id', int(user_id)).limit(1).execute()
-        return _user_from_row(r.data[0]) if r.data and len(r.data) > 0 else None
+        return _user_from_row(get_backend().get_user(column, value))
     except Exception as e:
         if '204' in str(e) or 'Missing response' in str(e):
             return None
         raise
 
 
+def _cached_user(column, value):
+    """
+    Пользователь из кэша или хранилища. Промахи не кэшируются: пользователь, созданный в другом
+    воркере, находится сразу, а не через USERS_CACHE_TTL секунд.
+    """
+    user = users_cache.get((column, value))
+    if user is None:
+        user = _load_user(column, value)
+        if user is not None:
+            users_cache.set((column, value), user)
+    return user
+
+
+def get_user_by_id(user_id):
+    """Загрузка пользователя по id (user_loader Flask-Login; LRU-кэш на USERS_CACHE_TTL секунд)."""
+    return _cached_user('id', int(user_id))
+
+
 def get_user_by_name(name):
-    """Загрузка пользователя по имени (для входа)."""
-    try:
-        supabase = get_supabase()
-        r = supabase.table('users').select('*').eq('name', name).limit(1).execute()
-        return _user_from_row(r.data[0]) if r.data and len(r.data) > 0 else None
-    except Exception as e:
-        if '204' in str(e) or 'Missing response' in str(e):
-            return None
-        raise
+    """Загрузка пользователя по имени (для входа; LRU-кэш на USERS_CACHE_TTL секунд)."""
+    return _cached_user('name', name)
 
 
 def create_user(name, password, role):
-    supabase = get_supabase()
     data = {'name': name, 'password': password, 'role': role}
-    r = supabase.table('users').insert(data).execute()
-    return _user_from_row(r.data[0]) if r.data and len(r.data) > 0 else None
+    row = get_backend().create_user(data)
+    users_cache.invalidate()
+    return _user_from_row(row)
 
 
 def get_users_except_admin():
-    supabase = get_supabase()
-    r = supabase.table('users').select('*').neq('role', 'admin').order('name').execute()
-    return [_user_from_row(row) for row in (r.data or [])]
+    return [_user_from_row(row) for row in get_backend().list_users_except_role('admin')]
 
 
 def user_exists(name):
@@ -88,14 +100,12 @@ def user_exists(name):
 # --- Robot ---
 
 def get_robots():
-    supabase = get_supabase()
-    r = supabase.table('robots').select('*').execute()
-    return r.data or []
+    """Все роботы (кэш на ROBOTS_CACHE_TTL секунд, обновляется при upsert_robot)."""
+    return list(robots_cache.get_or_load('all', lambda: get_backend().list_robots()))
 
 
-def upsert_robot(robot_id, status='active', battery_level=None, current_zone=None, current_row=None, current_shelf=None):
-    supabase = get_supabase()
-    data = {
+def _robot_row(robot_id, status='active', battery_level=None, current_zone=None, current_row=None, current_shelf=None):
+    return {
         'id': robot_id,
         'status': status,
         'battery_level': int(battery_level) if battery_level is not None else None,
@@ -104,14 +114,50 @@ def upsert_robot(robot_id, status='active', battery_level=None, current_zone=Non
         'current_row': current_row,
         'current_shelf': current_shelf
     }
-    supabase.table('robots').upsert(data, on_conflict='id').execute()
+
+
+def upsert_robot(robot_id, status='active', battery_level=None, current_zone=None, current_row=None, current_shelf=None):
+    data = _robot_row(robot_id, status, battery_level, current_zone, current_row, current_shelf)
+    get_backend().upsert_robots([data])
+    robots_cache.update('all', lambda rows: merge_rows(rows, [data]))
+    live_state.apply_robots([data])
+    return data
+
+
+def upsert_robots(rows):
+    """
+    Обновляет несколько роботов одним запросом.
+    rows — словари с ключами upsert_robot; для одного robot_id остаётся последнее состояние.
+    Возвращает записанные строки robots.
+    """
+    data = robot_rows(rows)
+    if not data:
+        return []
+    get_backend().upsert_robots(data)
+    robots_cache.update('all', lambda rows: merge_rows(rows, data))
+    live_state.apply_robots(data)
+    return data
+
+
+def robot_rows(rows):
+    """Строки robots для upsert из словарей с ключами upsert_robot (по одной на robot_id — последняя)."""
+    latest = {}
+    for row in rows:
+        latest[row['robot_id']] = _robot_row(
+            row['robot_id'],
+            status=row.get('status', 'active'),
+            battery_level=row.get('battery_level'),
+            current_zone=row.get('current_zone'),
+            current_row=row.get('current_row'),
+            current_shelf=row.get('current_shelf')
+        )
+    return list(latest.values())
 
 
 # --- Inventory history ---
 
-def insert_inventory_record(robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at):
-    supabase = get_supabase()
-    data = {
+def _inventory_row(robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at):
+    return {
         'robot_id': robot_id,
         'product_id': product_id,
         'quantity': quantity,
@@ -121,82 +167,328 @@ def insert_inventory_record(robot_id, product_id, quantity, zone, row_number, sh
         'status': status,
         'scanned_at': scanned_at
     }
-    r = supabase.table('inventory_history').insert(data).execute()
-    return r.data[0] if r.data and len(r.data) > 0 else None
 
 
-def get_inventory_history(limit=50):
-    supabase = get_supabase()
-    r = supabase.table('inventory_history').select('*').order('scanned_at', desc=True).limit(limit).execute()
-    return r.data or []
+def insert_inventory_record(robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at):
+    data = _inventory_row(robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at)
+    rows = get_backend().insert_inventory([data])
+    _merge_rollups(rows)
+    live_state.apply_inventory(rows)
+    return rows[0] if rows else None
+
+
+def insert_inventory_records(records):
+    """
+    Вставляет все записи сканирования одним multi-row insert (один round trip).
+    records — словари с ключами insert_inventory_record.
+    """
+    rows = inventory_rows(records)
+    if not rows:
+        return []
+    inserted = get_backend().insert_inventory(rows)
+    _merge_rollups(inserted)
+    live_state.apply_inventory(inserted)
+    return inserted
+
+
+def record_telemetry(robots, records):
+    """
+    Запись данных роботов: сначала сканирования (одним insert) и их агрегаты, затем состояние роботов.
+    Живое состояние и кэш роботов обновляются только после записи в хранилище. Если роботы не
+    записались, а сканирования уже записаны, ошибка только логируется: повтор запроса задублировал бы
+    историю, а состояние робота обновит его следующее сообщение. Возвращает (строки robots, строки истории).
+    """
+    rows = inventory_rows(records)
+    inserted = get_backend().insert_inventory(rows) if rows else []
+    _merge_rollups(inserted)
+    data = robot_rows(robots)
+    try:
+        if data:
+            get_backend().upsert_robots(data)
+    except Exception:
+        if not inserted:
+            raise
+        from services.metrics import report_error
+        report_error('telemetry.robots', 'Состояние роботов не записано, сканирования записаны')
+        data = []
+    if data:
+        robots_cache.update('all', lambda rows: merge_rows(rows, data))
+        live_state.apply_robots(data)
+    live_state.apply_inventory(inserted)
+    return data, inserted
+
+
+def inventory_rows(records):
+    """Строки inventory_history для вставки из словарей с ключами insert_inventory_record."""
+    return [
+        _inventory_row(
+            rec['robot_id'], rec['product_id'], rec['quantity'], rec['zone'],
+            rec['row_number'], rec['shelf_number'], rec['status'], rec['scanned_at']
+        )
+        for rec in records
+    ]
+
+
+def get_inventory_history(limit=50, since=None):
+    """
+    Последние записи инвентаризации.
+    since — курсор клиента: id последней полученной записи (int) или scanned_at (строка ISO);
+    тогда возвращаются только более новые записи.
+    """
+    return get_backend().recent_inventory(limit, since=since)
+
+
+# Фильтры истории (inventory_page): /dashboard/data/history и выгрузка
+HISTORY_FILTERS = ('product_id', 'robot_id', 'zone', 'status', 'since', 'until')
+
+
+def get_history_page(limit=100, cursor=None, descending=True, **filters):
+    """
+    Страница истории по курсору id (keyset): cursor — next_cursor предыдущей страницы.
+    Возвращает {'rows', 'next_cursor'}; next_cursor None — страниц больше нет.
+    Стоимость запроса не зависит от номера страницы, в отличие от OFFSET.
+    """
+    rows = get_backend().inventory_page(limit, cursor=cursor, descending=descending, **filters)
+    next_cursor = rows[-1]['id'] if len(rows) == limit else None
+    return {'rows': rows, 'next_cursor': next_cursor}
+
+
+def iter_inventory_history(chunk_size=1000, **filters):
+    """
+    Строки истории по возрастанию id, по chunk_size строк за запрос к хранилищу (генератор):
+    в памяти только текущая пачка, первые строки доступны после первого запроса.
+    """
+    cursor = None
+    while True:
+        rows = get_backend().inventory_page(chunk_size, cursor=cursor, descending=False, **filters)
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        cursor = rows[-1]['id']
+
+
+def get_hourly_inventory(since):
+    """
+    Сканирования с scanned_at >= since по товарам и часам (ряды для прогноза).
+    Читает часовые агрегаты inventory_rollups; если их запись где-либо сбоила (rollups_stale) — сырую историю.
+    """
+    if ROLLUPS_ENABLED and not rollups_stale():
+        return sum_zones(get_backend().rollup_series('hour', since=since))
+    return get_backend().hourly_inventory(since)
+
+
+# --- Live state ---
+
+def get_live_robots():
+    """Роботы из живого состояния процесса (без запроса к хранилищу); при LIVE_STATE=0 — get_robots()."""
+    if not LIVE_STATE_ENABLED:
+        return get_robots()
+    live_state.ensure_loaded(get_backend())
+    return live_state.robots()
+
+
+def get_live_inventory(limit=50, since=None):
+    """Лента последних сканирований из живого состояния; при LIVE_STATE=0 — get_inventory_history()."""
+    if not LIVE_STATE_ENABLED or limit > live_state.recent_size:
+        return get_inventory_history(limit, since=since)
+    live_state.ensure_loaded(get_backend())
+    return live_state.recent_inventory(limit, since=since)
+
+
+def live_version(limit=50):
+    """
+    Версия роботов и ленты из limit сканирований в живом состоянии (для ETag дашбордов)
+    или None, если лента читается из хранилища.
+    """
+    if not LIVE_STATE_ENABLED or limit > live_state.recent_size:
+        return None
+    live_state.ensure_loaded(get_backend())
+    return live_state.version()
+
+
+def get_shelf_scans(zone=None, row=None, shelf=None, product_id=None):
+    """Последнее сканирование каждой ячейки (зона, ряд, полка, товар) с фильтрами."""
+    if not LIVE_STATE_ENABLED:
+        return [
+            r for r in get_backend().latest_scans()
+            if (zone is None or r.get('zone') == zone) and (row is None or r.get('row_number') == row)
+            and (shelf is None or r.get('shelf_number') == shelf) and (product_id is None or r.get('product_id') == product_id)
+        ]
+    live_state.ensure_loaded(get_backend())
+    return live_state.shelf_scans(zone=zone, row=row, shelf=shelf, product_id=product_id)
+
+
+def get_shelf(zone, row, shelf):
+    """Что лежит на полке (зона, ряд, полка): последнее сканирование каждого товара на ней."""
+    if not LIVE_STATE_ENABLED:
+        return LiveState.from_scans(get_backend().latest_scans()).shelf(zone, row, shelf)
+    live_state.ensure_loaded(get_backend())
+    return live_state.shelf(zone, row, shelf)
+
+
+def get_location_heatmap(zone=None, status=None):
+    """Заполненность по зонам и рядам; status — только места, где есть ячейки с этим статусом сканирования."""
+    if not LIVE_STATE_ENABLED:
+        return LiveState.from_scans(get_backend().latest_scans()).heatmap(zone, status)
+    live_state.ensure_loaded(get_backend())
+    return live_state.heatmap(zone, status)
+
+
+# --- Inventory rollups ---
+
+# Отметка в app_state (migrations/005): приращения агрегатов не записались, пока не выполнен
+# rebuild_inventory_rollups. Отметка общая для всех процессов; unmarked — сбой в этом процессе,
+# который не удалось отметить в хранилище (отметка повторяется при следующей записи).
+ROLLUPS_STALE_KEY = 'inventory_rollups_stale'
+rollup_state = {'errors': 0, 'last_error': None, 'unmarked': False}
+
+
+def rollups_stale_marker(error):
+    """Значение отметки app_state для ROLLUPS_STALE_KEY (его же пишет ingest_asgi.py)."""
+    return json.dumps({'since': datetime.utcnow().isoformat() + 'Z', 'error': error}, ensure_ascii=False)
+
+
+def _merge_rollups(inventory_rows):
+    """
+    Добавляет записанные сканирования в inventory_rollups.
+    Ошибка не прерывает запись истории (повтор записи задублировал бы сканирования):
+    агрегаты помечаются устаревшими, чтение идёт по сырой истории до пересборки.
+    """
+    if not ROLLUPS_ENABLED or not inventory_rows:
+        return
+    try:
+        get_backend().merge_rollups(rollup_rows(inventory_rows))
+    except Exception as e:
+        rollup_state['errors'] += 1
+        rollup_state['last_error'] = str(e)
+        mark_rollups_stale(str(e))
+        return
+    if rollup_state['unmarked']:
+        mark_rollups_stale(rollup_state['last_error'])
+
+
+def mark_rollups_stale(error):
+    """Ставит в хранилище отметку «агрегаты неполны»; если хранилище недоступно — помнит сбой в процессе."""
+    rollup_state['unmarked'] = True
+    try:
+        get_backend().set_state(ROLLUPS_STALE_KEY, rollups_stale_marker(error))
+    except Exception:
+        from services.metrics import report_error
+        report_error('rollups.mark_stale', 'Не удалось отметить агрегаты устаревшими')
+    else:
+        rollup_state['unmarked'] = False
+    rollups_state_cache.invalidate()
+
+
+def rollups_stale():
+    """
+    Агрегаты неполны: отметка в app_state от любого процесса (читается не чаще раза в
+    ROLLUPS_STATE_TTL секунд) или сбой этого процесса, ещё не записанный в хранилище.
+    """
+    if rollup_state['unmarked']:
+        return True
+    marker = rollups_state_cache.get_or_load('stale', lambda: get_backend().get_state(ROLLUPS_STALE_KEY))
+    return marker is not None
+
+
+def get_inventory_rollups(granularity='hour', since=None, until=None, product_id=None, zone=None):
+    """Агрегаты inventory_rollups (minute, hour, day) с since <= bucket < until по возрастанию bucket."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'unknown granularity: {granularity}')
+    return get_backend().rollup_series(granularity, since=since, until=until, product_id=product_id, zone=zone)
+
+
+def rebuild_inventory_rollups():
+    """
+    Пересобирает inventory_rollups по истории и снимает отметку «агрегаты неполны».
+    Отметка снимается до пересборки: сбой записи агрегатов во время неё поставит её снова.
+    """
+    backend = get_backend()
+    marker = backend.get_state(ROLLUPS_STALE_KEY)
+    backend.delete_state(ROLLUPS_STALE_KEY)
+    rollup_state['unmarked'] = False
+    rollups_state_cache.invalidate()
+    try:
+        backend.rebuild_rollups()
+    except Exception:
+        if marker is not None:
+            backend.set_state(ROLLUPS_STALE_KEY, marker)
+            rollups_state_cache.invalidate()
+        raise
 
 
 # --- Products ---
 
 def get_products():
-    supabase = get_supabase()
-    r = supabase.table('products').select('*').execute()
-    return r.data or []
+    """Каталог товаров (кэш на PRODUCTS_CACHE_TTL секунд, обновляется при пересчёте остатков)."""
+    return list(products_cache.get_or_load('all', lambda: get_backend().list_products()))
 
-def recompute_products_quantities_and_status(ideal_quantity=8750):
+
+def products_version():
+    """Версия кэша каталога товаров или None, если его нужно загрузить (для ETag дашбордов)."""
+    return products_cache.version('all')
+
+
+def recompute_products_quantities_and_status(ideal_quantity=IDEAL_QUANTITY):
     """
-    Агрегирует суммы quantity из inventory_history по product_id
-    и обновляет таблицу products: quantity и status.
+    Инкрементально обновляет таблицу products: quantity и status.
+    Учитываются только строки inventory_history, появившиеся с прошлого вызова;
+    products обновляется только при изменении суммы или статуса.
     Пороговые значения статуса:
       - quantity > ideal_quantity => "OK"
       - 3900 < quantity <= ideal_quantity => "LOW_STOCK"
       - quantity <= 3900 => "CRITICAL"
     """
-    supabase = get_supabase()
-    r = supabase.table('inventory_history').select('product_id, quantity').execute()
-    rows = r.data or []
-    totals = {}
-    for row in rows:
-        pid = row.get('product_id')
-        q = row.get('quantity')
-        if not pid:
-            continue
-        try:
-            if isinstance(q, int):
-                qv = q
-            elif isinstance(q, float):
-                qv = int(q)
-            elif isinstance(q, str):
-                qv = int(float(q))
-            else:
-                qv = 0
-        except Exception:
-            qv = 0
-        totals[pid] = totals.get(pid, 0) + qv
-    for pid, total in totals.items():
-        status = 'OK' if total > ideal_quantity else ('LOW_STOCK' if total > 3900 else 'CRITICAL')
-        payload = {'quantity': int(total), 'status': status}
-        try:
-            supabase.table('products').update(payload).eq('id', pid).execute()
-        except Exception:
-            pass
-        try:
-            supabase.table('products').update(payload).eq('product_id', pid).execute()
-        except Exception:
-            pass
+    return stock_aggregator.refresh(ideal_quantity)
+
+
+def rebuild_products_quantities_and_status(ideal_quantity=IDEAL_QUANTITY):
+    """Полный пересчёт сумм quantity по всей inventory_history (явная операция, GROUP BY в хранилище)."""
+    return stock_aggregator.rebuild(ideal_quantity)
+
 
 # --- AI Predictions ---
 
 def get_ai_predictions(limit=20):
-    supabase = get_supabase()
-    r = supabase.table('ai_predictions').select('*').order('created_at', desc=True).limit(limit).execute()
-    return r.data or []
+    """Последние прогнозы (кэш на PREDICTIONS_CACHE_TTL секунд, сбрасывается при записи прогнозов)."""
+    return list(predictions_cache.get_or_load(limit, lambda: get_backend().recent_predictions(limit)))
 
 
-def insert_ai_prediction(product_id, prediction_date, days_until_stockout=None, recommended_order=None, confidence_score=None):
-    supabase = get_supabase()
+def _prediction_row(product_id, prediction_date, days_until_stockout=None, recommended_order=None, confidence_score=None):
     pred_date = prediction_date.isoformat() if isinstance(prediction_date, date) else str(prediction_date)
-    data = {
+    return {
         'product_id': product_id,
         'prediction_date': pred_date,
         'days_until_stockout': days_until_stockout,
         'recommended_order': recommended_order,
         'confidence_score': float(confidence_score) if confidence_score is not None else None
     }
-    r = supabase.table('ai_predictions').insert(data).execute()
-    return r.data[0] if r.data and len(r.data) > 0 else None
+
+
+def insert_ai_prediction(product_id, prediction_date, days_until_stockout=None, recommended_order=None, confidence_score=None):
+    rows = insert_ai_predictions([{
+        'product_id': product_id,
+        'prediction_date': prediction_date,
+        'days_until_stockout': days_until_stockout,
+        'recommended_order': recommended_order,
+        'confidence_score': confidence_score,
+    }])
+    return rows[0] if rows else None
+
+
+def predictions_version(limit=20):
+    """Версия кэша последних прогнозов или None, если его нужно загрузить (для ETag дашбордов)."""
+    return predictions_cache.version(limit)
+
+
+def insert_ai_predictions(predictions):
+    """
+    Вставляет прогнозы одним запросом.
+    predictions — словари с ключами аргументов insert_ai_prediction. Возвращает строки с id.
+    """
+    rows = [_prediction_row(**p) for p in predictions]
+    if not rows:
+        return []
+    inserted = get_backend().insert_predictions(rows)
+    predictions_cache.invalidate()
+    return inserted
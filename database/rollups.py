@@ -0,0 +1,78 @@
+"""
+Агрегаты inventory_history по времени (таблица inventory_rollups).
+Для каждой минуты, часа и дня хранится по товару и зоне: сумма, минимум и максимум
+quantity и число сканирований. Агрегаты пополняются при каждой записи сканирований,
+поэтому прогнозы и графики читают сотни строк агрегатов вместо всей сырой истории.
+"""
+import os
+from datetime import datetime, timezone
+
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS', '1') == '1'
+
+# Гранулярность -> длина префикса scanned_at ('YYYY-MM-DDTHH:MI')
+GRANULARITIES = {'minute': 16, 'hour': 13, 'day': 10}
+
+
+def _utc_minute(scanned_at):
+    """
+    scanned_at (ISO-строка или datetime) -> 'YYYY-MM-DDTHH:MI' в UTC: метка со смещением попадает
+    в ту же корзину, что и в Postgres. Неразборчивая строка — как есть.
+    """
+    try:
+        dt = scanned_at if isinstance(scanned_at, datetime) else datetime.fromisoformat(str(scanned_at).replace('Z', '+00:00'))
+    except ValueError:
+        return str(scanned_at).replace(' ', 'T')
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M')
+
+
+def bucket_of(scanned_at, granularity):
+    """Корзина времени для scanned_at: префикс метки UTC нужной длины."""
+    return _utc_minute(scanned_at)[:GRANULARITIES[granularity]]
+
+
+def rollup_rows(inventory_rows, granularities=tuple(GRANULARITIES)):
+    """
+    Агрегаты пачки записей inventory_history (по одной строке на гранулярность, корзину, товар и зону) —
+    приращения для inventory_rollups.
+    """
+    acc = {}
+    for row in inventory_rows:
+        pid = row.get('product_id')
+        scanned_at = row.get('scanned_at')
+        if not pid or not scanned_at:
+            continue
+        qty = int(row.get('quantity') or 0)
+        zone = row.get('zone') or ''
+        minute = _utc_minute(scanned_at)
+        for granularity in granularities:
+            key = (granularity, minute[:GRANULARITIES[granularity]], pid, zone)
+            entry = acc.get(key)
+            if entry is None:
+                acc[key] = [qty, qty, qty, 1]
+            else:
+                entry[0] += qty
+                entry[1] = min(entry[1], qty)
+                entry[2] = max(entry[2], qty)
+                entry[3] += 1
+    return [
+        {
+            'granularity': granularity, 'bucket': bucket, 'product_id': pid, 'zone': zone,
+            'quantity_sum': total, 'quantity_min': low, 'quantity_max': high, 'scans': scans,
+        }
+        for (granularity, bucket, pid, zone), (total, low, high, scans) in acc.items()
+    ]
+
+
+def sum_zones(rollups):
+    """Строки rollup_series, сложенные по зонам: [{'product_id', 'bucket', 'quantity', 'scans'}] по bucket."""
+    acc = {}
+    for row in rollups:
+        key = (row['product_id'], row['bucket'])
+        total, scans = acc.get(key, (0, 0))
+        acc[key] = (total + int(row.get('quantity_sum') or 0), scans + int(row.get('scans') or 0))
+    return [
+        {'product_id': pid, 'bucket': bucket, 'quantity': total, 'scans': scans}
+        for (pid, bucket), (total, scans) in sorted(acc.items(), key=lambda item: item[0][1])
+    ]
@@ -0,0 +1,171 @@
+"""
+Общее для всех воркеров gunicorn на хосте хранилище значений кэшей чтения (SHARED_STATE=1).
+
+Каталог в /dev/shm (оперативная память): каждое значение — файл с заголовком и pickle,
+который пишется целиком во временный файл и подменяется атомарным rename, поэтому читатель
+никогда не видит половину записи. Читается значение через mmap, десериализуется один раз
+на версию и дальше отдаётся из памяти процесса.
+
+Версии — таблица счётчиков u64 в файле versions, отображённом в память всех процессов
+(MAP_SHARED). Каждая запись получает новый уникальный номер из общего счётчика (слот 0)
+и кладёт его в слот ключа; проверка свежести на чтении — два числа из общей памяти,
+без системных вызовов. Сброс всего кэша меняет слот имени кэша; файл помнит версию кэша,
+при которой его записали, и после сброса считается отсутствующим, даже если запись,
+начатая до сброса, закончилась после него.
+"""
+import fcntl
+import functools
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+
+# Каталог общего состояния; по умолчанию /dev/shm/rostelekom-<uid>-<хранилище>
+SHARED_STATE_DIR = os.environ.get('SHARED_STATE_DIR', '')
+
+SLOTS = 4096
+_VERSION = struct.Struct('<Q')
+# magic, версия кэша при записи, версия записи, срок жизни (time.time()), длина pickle
+_HEADER = struct.Struct('<4sQQdQ')
+_MAGIC = b'RSS2'
+
+
+@functools.lru_cache(maxsize=8)
+def default_directory(storage_id):
+    """Каталог для хранилища storage_id (разные базы на одном хосте не смешиваются)."""
+    if SHARED_STATE_DIR:
+        return SHARED_STATE_DIR
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    digest = hashlib.sha1(storage_id.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base, f'rostelekom-{os.getuid()}-{digest}')
+
+
+class SharedStore:
+    """Файлы значений и таблица версий в общем каталоге. Потокобезопасен; в процессе берётся через get_store()."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+        # В файлах pickle: каталог должен принадлежать нам и быть закрыт для остальных
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError(f'shared state directory {directory} must be private to uid {os.getuid()}')
+        fd = os.open(os.path.join(directory, 'versions'), os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < SLOTS * _VERSION.size:
+            os.ftruncate(fd, SLOTS * _VERSION.size)
+        self._versions_fd = fd
+        self._versions = mmap.mmap(fd, SLOTS * _VERSION.size)
+        self._counter_lock = threading.Lock()
+
+    # --- версии ---
+
+    def version(self, slot):
+        return _VERSION.unpack_from(self._versions, slot * _VERSION.size)[0]
+
+    def set_version(self, slot, version):
+        _VERSION.pack_into(self._versions, slot * _VERSION.size, version)
+
+    def bump(self, slot):
+        """Записывает в слот новый, ещё не встречавшийся номер версии и возвращает его."""
+        version = self.next_version()
+        self.set_version(slot, version)
+        return version
+
+    def next_version(self):
+        """Следующий номер из общего счётчика (слот 0): номера версий не повторяются."""
+        # flock исключает другие процессы, threading.Lock — потоки этого (у них общий дескриптор)
+        with self._counter_lock:
+            fcntl.flock(self._versions_fd, fcntl.LOCK_EX)
+            try:
+                version = self.version(0) + 1
+                _VERSION.pack_into(self._versions, 0, version)
+            finally:
+                fcntl.flock(self._versions_fd, fcntl.LOCK_UN)
+        return version
+
+    # --- значения ---
+
+    def read(self, name):
+        """(версия кэша, версия, срок жизни, значение) из файла name или None, если его нет."""
+        try:
+            f = open(os.path.join(self.directory, name), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, name_version, version, expires_at, length = _HEADER.unpack_from(mm, 0)
+                if magic != _MAGIC or _HEADER.size + length > len(mm):
+                    return None
+                with memoryview(mm) as view, view[_HEADER.size:_HEADER.size + length] as payload:
+                    value = pickle.loads(payload)
+        return name_version, version, expires_at, value
+
+    def write(self, name, name_version, version, expires_at, value):
+        """Атомарно заменяет файл name (запись во временный файл и rename)."""
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = os.path.join(self.directory, name)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, name_version, version, expires_at, len(payload)))
+            f.write(payload)
+        os.replace(tmp, path)
+        return len(payload)
+
+    def remove(self, name):
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def remove_prefix(self, prefix, suffix):
+        """Удаляет файлы значений prefix*suffix (файлы блокировок и незаконченные записи не трогает)."""
+        for entry in os.listdir(self.directory):
+            if entry.startswith(prefix) and entry.endswith(suffix):
+                self.remove(entry)
+
+    def lock(self, name):
+        """Межпроцессная блокировка name (flock на своём дескрипторе: исключает и потоки процесса)."""
+        return _FileLock(os.path.join(self.directory, f'{name}.lock'))
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store(storage_id):
+    """
+    Общее хранилище процесса для storage_id. После fork открывается заново:
+    flock на унаследованном дескрипторе не исключал бы родителя и потомка.
+    """
+    global _store, _store_pid
+    store = _store
+    if store is not None and _store_pid == os.getpid() and store.directory == default_directory(storage_id):
+        return store
+    with _store_lock:
+        directory = default_directory(storage_id)
+        if _store is None or _store_pid != os.getpid() or _store.directory != directory:
+            _store = SharedStore(directory)
+            _store_pid = os.getpid()
+        return _store
@@ -0,0 +1,135 @@
+"""
+Инкрементальная агрегация остатков товаров по inventory_history.
+Держит текущие суммы quantity по product_id и курсор по inventory_history.id:
+при обновлении дочитываются только новые строки, а products обновляется
+только для товаров, у которых изменилась сумма или статус.
+"""
+import threading
+
+from database.backends.base import to_int
+from database.cache import products_cache, merge_rows
+from database.connection import get_backend
+
+IDEAL_QUANTITY = 8750
+CRITICAL_QUANTITY = 3900
+
+# Размер страницы при чтении inventory_history (PostgREST по умолчанию отдаёт не больше 1000 строк)
+FETCH_CHUNK = 1000
+# Сколько последних id перечитывать повторно: строки, закоммиченные не по порядку id, не потеряются
+CURSOR_OVERLAP = 200
+
+
+def stock_status(total, ideal_quantity=IDEAL_QUANTITY):
+    """Статус товара по суммарному остатку."""
+    if total > ideal_quantity:
+        return 'OK'
+    if total > CRITICAL_QUANTITY:
+        return 'LOW_STOCK'
+    return 'CRITICAL'
+
+
+class StockAggregator:
+    """Текущие суммы по товарам с применением только новых строк inventory_history."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._written = {}  # product_id -> (quantity, status), последнее записанное в products
+        self._cursor = None  # None — полного пересчёта ещё не было
+        self._recent_ids = set()
+        self._ideal_quantity = IDEAL_QUANTITY
+
+    def refresh(self, ideal_quantity=IDEAL_QUANTITY):
+        """
+        Применяет строки, появившиеся после курсора, и синхронизирует products.
+        При первом вызове выполняет полный пересчёт.
+        Возвращает список обновлённых товаров: [{'id', 'quantity', 'status'}].
+        """
+        with self._lock:
+            if self._cursor is None:
+                return self._rebuild_locked(ideal_quantity)
+            changed = self._apply_new_rows()
+            if ideal_quantity != self._ideal_quantity:
+                self._ideal_quantity = ideal_quantity
+                changed = set(self._totals)
+            return self._sync(changed)
+
+    def rebuild(self, ideal_quantity=IDEAL_QUANTITY):
+        """Полный пересчёт сумм по всей inventory_history (запускается отдельно и явно)."""
+        with self._lock:
+            return self._rebuild_locked(ideal_quantity)
+
+    def reset(self):
+        """Забывает суммы и курсор; следующий refresh выполнит полный пересчёт (смена хранилища)."""
+        with self._lock:
+            self._totals = {}
+            self._written = {}
+            self._cursor = None
+            self._recent_ids = set()
+
+    def totals(self):
+        """Копия текущих сумм по товарам."""
+        with self._lock:
+            return dict(self._totals)
+
+    def _rebuild_locked(self, ideal_quantity):
+        backend = get_backend()
+        self._totals, self._cursor = backend.product_totals()
+        self._ideal_quantity = ideal_quantity
+        # id из окна перекрытия уже учтены в суммах — при следующем refresh их надо пропустить
+        tail = backend.inventory_after_id(max(self._cursor - CURSOR_OVERLAP, 0), CURSOR_OVERLAP)
+        self._recent_ids = {row['id'] for row in tail if row['id'] <= self._cursor}
+
+        self._written = {}
+        for p in backend.list_products():
+            pid = p.get('id') or p.get('product_id')
+            if pid and p.get('quantity') is not None:
+                self._written[pid] = (to_int(p.get('quantity')), p.get('status'))
+        return self._sync(set(self._totals))
+
+    def _apply_new_rows(self):
+        """Дочитывает строки с id > курсор - CURSOR_OVERLAP, пропуская уже учтённые."""
+        backend = get_backend()
+        changed = set()
+        start = max(self._cursor - CURSOR_OVERLAP, 0)
+        while True:
+            rows = backend.inventory_after_id(start, FETCH_CHUNK)
+            for row in rows:
+                rid = row.get('id')
+                if rid in self._recent_ids:
+                    continue
+                self._recent_ids.add(rid)
+                self._cursor = max(self._cursor, rid)
+                pid = row.get('product_id')
+                if not pid:
+                    continue
+                self._totals[pid] = self._totals.get(pid, 0) + to_int(row.get('quantity'))
+                changed.add(pid)
+            if len(rows) < FETCH_CHUNK:
+                break
+            start = rows[-1]['id']
+        floor = self._cursor - CURSOR_OVERLAP
+        self._recent_ids = {rid for rid in self._recent_ids if rid > floor}
+        return changed
+
+    def _sync(self, product_ids):
+        """Записывает в products суммы и статусы, отличающиеся от последних записанных."""
+        backend = get_backend()
+        updated = []
+        for pid in product_ids:
+            total = int(self._totals.get(pid, 0))
+            status = stock_status(total, self._ideal_quantity)
+            if self._written.get(pid) == (total, status):
+                continue
+            try:
+                backend.update_product_stock(pid, total, status)
+            except Exception:
+                continue  # повторим при следующем обновлении
+            self._written[pid] = (total, status)
+            updated.append({'id': pid, 'quantity': total, 'status': status})
+        if updated:
+            products_cache.update('all', lambda rows: merge_rows(rows, updated, append=False))
+        return updated
+
+
+stock_aggregator = StockAggregator()
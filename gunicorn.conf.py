@@ -0,0 +1,9 @@
+"""
+Хуки gunicorn (файл подхватывается автоматически из рабочего каталога; настройки запуска — в start.sh).
+"""
+
+
+def post_worker_init(worker):
+    # Воркер загрузил приложение: при WARMUP=1 прогреваем соединения и кэши в фоне (services/warmup.py)
+    from services.warmup import start_warmup
+    start_warmup()
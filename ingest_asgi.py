@@ -0,0 +1,162 @@
+"""
+Асинхронный приём телеметрии роботов (ASGI) — отдельная точка входа рядом с Flask-дашбордом:
+    uvicorn ingest_asgi:app --host 0.0.0.0 --port 10001
+
+Те же POST /api/robots/data и /api/robots/data/batch с тем же контрактом (services/telemetry.py:
+JSON или двоичный формат services/wire.py, по желанию gzip),
+но запрос, ожидающий записи, не занимает поток: тысячи роботов обслуживаются одним процессом,
+а сообщения всех одновременных запросов пишутся общими пачками (services/async_ingest.py).
+Ответ 200 отдаётся после записи в хранилище; при переполнении — 429 с Retry-After.
+Дашборд (app.py) видит записанное через LIVE_TAIL_INTERVAL (services/ingest_tail.py).
+"""
+import json
+import os
+
+# .env загружается в database.connection (его импортирует services.async_ingest)
+from services.async_ingest import IngestBatcher, IngestBusy, make_writer
+from services.metrics import metrics
+from services.telemetry import (
+    PayloadError, batch_messages, batch_summary, decode_body, fail_parsed, parse_batch, parse_message,
+)
+
+# Максимальный размер тела запроса, байты
+INGEST_ASGI_MAX_BODY = int(os.environ.get('INGEST_ASGI_MAX_BODY', 2 * 1024 * 1024))
+# Через сколько секунд роботу повторить отправку, если очередь заполнена
+QUEUE_FULL_RETRY_AFTER = 2
+
+
+class IngestApp:
+    """ASGI-приложение: маршруты приёма телеметрии, /healthz и lifespan (запуск и остановка пачек)."""
+
+    def __init__(self, writer_factory=make_writer):
+        self.writer_factory = writer_factory
+        self.batcher = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        routes = {
+            '/api/robots/data': self.robots_data,
+            '/api/robots/data/batch': self.robots_data_batch,
+        }
+        path = scope['path'].rstrip('/') or '/'
+        if path == '/healthz' and scope['method'] in ('GET', 'HEAD'):
+            await _send_json(send, 200, self.health())
+            return
+        handler = routes.get(path)
+        if handler is None:
+            await _send_json(send, 404, {'error': 'not found'})
+            return
+        if scope['method'] != 'POST':
+            await _send_json(send, 405, {'error': 'method not allowed'}, {'allow': 'POST'})
+            return
+        body = await _read_body(receive, INGEST_ASGI_MAX_BODY)
+        if body is None:
+            await _send_json(send, 413, {'error': f'body too large (max {INGEST_ASGI_MAX_BODY} bytes)'})
+            return
+        request_headers = dict(scope.get('headers') or [])
+        try:
+            data = decode_body(body, request_headers.get(b'content-type', b'').decode('latin-1'),
+                               request_headers.get(b'content-encoding', b'').decode('latin-1'),
+                               batch=handler == self.robots_data_batch)
+        except PayloadError as e:
+            await _send_json(send, e.status, {'error': str(e)})
+            return
+        except ValueError as e:
+            await _send_json(send, 400, {'error': str(e)})
+            return
+        self._ensure_batcher()
+        status, payload, headers = await handler(data)
+        await _send_json(send, status, payload, headers)
+
+    async def robots_data(self, data):
+        """Одно сообщение робота; 200 после записи."""
+        try:
+            robot, records = parse_message(data)
+        except ValueError as e:
+            return 400, {'error': str(e)}, None
+        try:
+            await self.batcher.submit([robot], records)
+        except IngestBusy:
+            return _queue_full()
+        except Exception as e:
+            return 500, {'error': str(e)}, None
+        return 200, {'status': 'ok', 'robot_id': robot['robot_id']}, None
+
+    async def robots_data_batch(self, data):
+        """Пачка сообщений; результат по каждому сообщению, как у Flask API."""
+        try:
+            messages = batch_messages(data)
+        except PayloadError as e:
+            return e.status, {'error': str(e)}, None
+        results, parsed = parse_batch(messages)
+        status = 200
+        if parsed:
+            try:
+                await self.batcher.submit([robot for _, robot, _ in parsed], [rec for _, _, recs in parsed for rec in recs])
+            except IngestBusy:
+                return _queue_full()
+            except Exception as e:
+                status = 500
+                fail_parsed(results, parsed, str(e))
+        return status, batch_summary(results), None
+
+    def health(self):
+        stats = dict(self.batcher.stats, pending=self.batcher.pending()) if self.batcher else None
+        return {'status': 'ok', 'pid': os.getpid(), 'ingest': stats, 'payloads': metrics.payload_stats()}
+
+    def _ensure_batcher(self):
+        # Без lifespan (сервер его не поддерживает) пачки запускаются при первом запросе
+        if self.batcher is None:
+            self.batcher = IngestBatcher(self.writer_factory())
+            self.batcher.start()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._ensure_batcher()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.batcher is not None:
+                    await self.batcher.close()
+                    self.batcher = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def _queue_full():
+    return 429, {'error': 'ingest queue is full, retry later'}, {'retry-after': str(QUEUE_FULL_RETRY_AFTER)}
+
+
+async def _read_body(receive, limit):
+    """Тело запроса целиком или None, если оно больше limit."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _send_json(send, status, payload, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    raw_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.encode(), value.encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+app = IngestApp()
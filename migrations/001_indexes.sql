@@ -0,0 +1,28 @@
+-- 001: индексы под запросы приложения.
+-- Применяется после supabase_init.sql (Supabase SQL Editor или psql), повторный запуск безопасен.
+-- На большой живой таблице в psql можно заменить CREATE INDEX на CREATE INDEX CONCURRENTLY (вне транзакции).
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(20) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Дашборды: последние сканирования (ORDER BY scanned_at DESC LIMIT 50),
+-- ряды прогноза и архивация (scanned_at >= / < граница)
+CREATE INDEX IF NOT EXISTS inventory_history_scanned_at_idx ON inventory_history (scanned_at DESC);
+
+-- Суммы по товарам (SUM(quantity) GROUP BY product_id): покрывающий индекс, без чтения строк таблицы
+CREATE INDEX IF NOT EXISTS inventory_history_product_quantity_idx ON inventory_history (product_id, quantity);
+
+-- Последние прогнозы (ORDER BY created_at DESC, id DESC LIMIT 20)
+CREATE INDEX IF NOT EXISTS ai_predictions_created_at_idx ON ai_predictions (created_at DESC, id DESC);
+
+-- Вход и загрузка пользователя по имени; имя должно быть уникальным.
+-- Если индекс не создаётся из-за дублей, найдите их:
+--   SELECT name, COUNT(*) FROM users GROUP BY name HAVING COUNT(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS users_name_key ON users (name);
+
+-- Агрегаты одного товара (?product_id= в /dashboard/data/rollups)
+CREATE INDEX IF NOT EXISTS inventory_rollups_product_idx ON inventory_rollups (granularity, product_id, bucket);
+
+INSERT INTO schema_migrations (version) VALUES ('001') ON CONFLICT (version) DO NOTHING;
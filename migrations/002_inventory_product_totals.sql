@@ -0,0 +1,26 @@
+-- 002: суммы quantity по товарам на стороне базы (одно RPC вместо постраничного чтения всей истории).
+-- Возвращает {"max_id": N, "totals": {"TEL-4567": 123, ...}} — суммы строк с id <= max_id
+-- плюс архивные суммы inventory_baseline, снятые одним снимком данных.
+
+CREATE OR REPLACE FUNCTION inventory_product_totals() RETURNS jsonb
+LANGUAGE sql STABLE AS $$
+    WITH m AS (
+        SELECT COALESCE(MAX(id), 0) AS max_id FROM inventory_history
+    ), sums AS (
+        SELECT h.product_id, SUM(h.quantity) AS quantity
+        FROM inventory_history h, m
+        WHERE h.id <= m.max_id AND h.product_id IS NOT NULL
+        GROUP BY h.product_id
+        UNION ALL
+        SELECT product_id, quantity FROM inventory_baseline
+    )
+    SELECT jsonb_build_object(
+        'max_id', (SELECT max_id FROM m),
+        'totals', COALESCE((
+            SELECT jsonb_object_agg(product_id, total)
+            FROM (SELECT product_id, SUM(quantity) AS total FROM sums GROUP BY product_id) t
+        ), '{}'::jsonb)
+    );
+$$;
+
+INSERT INTO schema_migrations (version) VALUES ('002') ON CONFLICT (version) DO NOTHING;
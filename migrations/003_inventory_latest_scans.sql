@@ -0,0 +1,11 @@
+-- 003: последнее сканирование каждой ячейки (зона, ряд, полка, товар) одним запросом —
+-- для восстановления живого состояния склада при старте воркера (database/live_state.py).
+
+CREATE OR REPLACE FUNCTION inventory_latest_scans() RETURNS SETOF inventory_history
+LANGUAGE sql STABLE AS $$
+    SELECT DISTINCT ON (zone, row_number, shelf_number, product_id) *
+    FROM inventory_history
+    ORDER BY zone, row_number, shelf_number, product_id, scanned_at DESC, id DESC;
+$$;
+
+INSERT INTO schema_migrations (version) VALUES ('003') ON CONFLICT (version) DO NOTHING;
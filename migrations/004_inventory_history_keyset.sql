@@ -0,0 +1,10 @@
+-- 004: постраничный просмотр и выгрузка истории по курсору id (/dashboard/data/history).
+-- Без фильтров страница идёт по первичному ключу; с фильтром по товару или роботу —
+-- по составному индексу (фильтр, id), без сортировки и без чтения предыдущих страниц.
+-- Зона и статус малоселективны: для них достаточно обхода первичного ключа с фильтром.
+
+CREATE INDEX IF NOT EXISTS inventory_history_product_id_idx ON inventory_history (product_id, id);
+
+CREATE INDEX IF NOT EXISTS inventory_history_robot_id_idx ON inventory_history (robot_id, id);
+
+INSERT INTO schema_migrations (version) VALUES ('004') ON CONFLICT (version) DO NOTHING;
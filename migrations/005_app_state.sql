@@ -0,0 +1,16 @@
+-- 005: служебные отметки приложения, общие для всех процессов (ключ -> значение JSON).
+-- inventory_rollups_stale — запись приращений inventory_rollups сбоила в каком-либо процессе
+-- (воркер gunicorn или ingest_asgi.py): агрегаты неполны, прогнозы читают сырую историю,
+-- пока администратор не пересоберёт агрегаты.
+
+CREATE TABLE IF NOT EXISTS app_state (
+    key VARCHAR(100) PRIMARY KEY,
+    value TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE app_state ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all" ON app_state;
+CREATE POLICY "Allow all" ON app_state FOR ALL USING (true) WITH CHECK (true);
+
+INSERT INTO schema_migrations (version) VALUES ('005') ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,61 @@
+-- 006: архивация не теряет агрегаты и строки.
+-- rebuild_inventory_rollups пересобирает только корзины позже горизонта архива (раньше пересборка
+-- удаляла все агрегаты и теряла заархивированные периоды); compact_inventory_ranges удаляет ровно
+-- выгруженные в архив id вместо всех строк с id <= max_id (вместо compact_inventory_history).
+-- Те же определения — в supabase_init.sql.
+
+-- Пересобирает inventory_rollups по истории (после восстановления данных или сбоя записи агрегатов).
+-- Заархивированные строки (services/retention.py) из истории удалены, поэтому пересобираются только
+-- корзины позже горизонта архива — последнего scanned_at в inventory_baseline; более ранние
+-- агрегаты (в том числе корзина самого горизонта) остаются как есть.
+CREATE OR REPLACE FUNCTION rebuild_inventory_rollups() RETURNS void
+LANGUAGE sql AS $$
+    DELETE FROM inventory_rollups r
+    USING (VALUES ('minute', 16), ('hour', 13), ('day', 10)) AS g(granularity, len)
+    WHERE r.granularity = g.granularity
+      AND r.bucket > COALESCE((SELECT left(to_char(MAX(archived_until), 'YYYY-MM-DD"T"HH24:MI'), g.len) FROM inventory_baseline), '');
+    INSERT INTO inventory_rollups (granularity, bucket, product_id, zone, quantity_sum, quantity_min, quantity_max, scans)
+    SELECT g.granularity, left(to_char(h.scanned_at, 'YYYY-MM-DD"T"HH24:MI'), g.len), h.product_id, COALESCE(h.zone, ''),
+           SUM(h.quantity), MIN(h.quantity), MAX(h.quantity), COUNT(*)
+    FROM inventory_history h
+    CROSS JOIN (VALUES ('minute', 16), ('hour', 13), ('day', 10)) AS g(granularity, len)
+    WHERE h.product_id IS NOT NULL
+      AND left(to_char(h.scanned_at, 'YYYY-MM-DD"T"HH24:MI'), g.len)
+          > COALESCE((SELECT left(to_char(MAX(archived_until), 'YYYY-MM-DD"T"HH24:MI'), g.len) FROM inventory_baseline), '')
+    GROUP BY 1, 2, 3, 4;
+$$;
+
+-- Переносит суммы выгруженных в архив строк в inventory_baseline и удаляет их одной транзакцией.
+-- p_ranges — [[первый id, последний id], ...] подряд идущих выгруженных id: строка, закоммиченная
+-- позже с id внутри уже прочитанного диапазона, в архив не попала и не удаляется.
+CREATE OR REPLACE FUNCTION compact_inventory_ranges(p_ranges jsonb, p_cutoff timestamp) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    removed integer;
+BEGIN
+    WITH deleted AS (
+        DELETE FROM inventory_history h
+        USING jsonb_array_elements(p_ranges) AS r
+        WHERE h.id BETWEEN (r->>0)::bigint AND (r->>1)::bigint AND h.scanned_at < p_cutoff
+        RETURNING h.product_id, h.quantity, h.scanned_at
+    ), sums AS (
+        SELECT product_id, SUM(quantity) AS quantity, COUNT(*) AS n, MAX(scanned_at) AS last_at
+        FROM deleted WHERE product_id IS NOT NULL GROUP BY product_id
+    ), merged AS (
+        INSERT INTO inventory_baseline AS b (product_id, quantity, archived_rows, archived_until, updated_at)
+        SELECT product_id, quantity, n, last_at, now() FROM sums
+        ON CONFLICT (product_id) DO UPDATE SET
+            quantity = b.quantity + EXCLUDED.quantity,
+            archived_rows = b.archived_rows + EXCLUDED.archived_rows,
+            archived_until = GREATEST(b.archived_until, EXCLUDED.archived_until),
+            updated_at = now()
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO removed FROM deleted;
+    RETURN removed;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS compact_inventory_history(bigint, timestamp);
+
+INSERT INTO schema_migrations (version) VALUES ('006') ON CONFLICT (version) DO NOTHING;
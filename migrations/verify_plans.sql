@@ -0,0 +1,116 @@
+-- Проверка планов запросов приложения на локальном Postgres при большой истории.
+-- Всё создаётся в отдельной схеме plan_check, рабочие таблицы не затрагиваются:
+--
+--   docker run -d --name pg -e POSTGRES_PASSWORD=pg -p 5432:5432 postgres:16
+--   psql postgresql://postgres:pg@localhost:5432/postgres -v rows=10000000 -f migrations/verify_plans.sql
+--
+-- rows — число строк inventory_history (по умолчанию 10 000 000). В выводе у каждого запроса
+-- должен быть Index Scan / Index Only Scan по индексу из 001_indexes.sql, а не Seq Scan + Sort.
+
+\set ON_ERROR_STOP on
+\if :{?rows}
+\else
+    \set rows 10000000
+\endif
+
+DROP SCHEMA IF EXISTS plan_check CASCADE;
+CREATE SCHEMA plan_check;
+SET search_path TO plan_check;
+
+\echo '== схема (supabase_init.sql)'
+\ir ../supabase_init.sql
+
+\echo '== данные:' :rows 'строк inventory_history'
+INSERT INTO inventory_history (robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at)
+SELECT 'RB-' || lpad((g % 500)::text, 5, '0'),
+       (ARRAY['TEL-4567', 'TEL-8901', 'TEL-2345', 'TEL-6789', 'TEL-3456'])[1 + g % 5],
+       5 + g % 96,
+       substr('ABCDE', 1 + g % 5, 1),
+       1 + g % 20,
+       1 + g % 10,
+       'OK',
+       timestamp '2024-01-01' + g * interval '3 seconds'
+FROM generate_series(1, :rows) AS g;
+
+INSERT INTO ai_predictions (product_id, prediction_date, days_until_stockout, recommended_order, confidence_score, created_at)
+SELECT (ARRAY['TEL-4567', 'TEL-8901', 'TEL-2345', 'TEL-6789', 'TEL-3456'])[1 + g % 5],
+       date '2024-01-01' + g / 5, 7, 100, 0.8, timestamp '2024-01-01' + g * interval '1 minute'
+FROM generate_series(1, 100000) AS g;
+
+INSERT INTO users (name, password, role)
+SELECT 'user' || g, 'x', 'Логист' FROM generate_series(1, 10000) AS g;
+
+SELECT rebuild_inventory_rollups();
+
+\echo '== миграции'
+\ir 001_indexes.sql
+\ir 002_inventory_product_totals.sql
+\ir 004_inventory_history_keyset.sql
+ANALYZE;
+
+\echo '== /dashboard/data/*: последние 50 сканирований'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history ORDER BY scanned_at DESC LIMIT 50;
+
+\echo '== /dashboard/data/*?since=<scanned_at>: только новые сканирования'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history WHERE scanned_at > timestamp '2024-01-01' + (:rows - 1000) * interval '3 seconds'
+ORDER BY scanned_at DESC LIMIT 50;
+
+\echo '== /dashboard/data/*?since=<id>: только новые сканирования по курсору id'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history WHERE id > :rows - 1000 ORDER BY scanned_at DESC LIMIT 50;
+
+\echo '== история по курсору: страница после id (новые сначала)'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history WHERE id < :rows / 2 ORDER BY id DESC LIMIT 100;
+
+\echo '== история по курсору: страница одного товара'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history WHERE id < :rows / 2 AND product_id = 'TEL-4567' ORDER BY id DESC LIMIT 100;
+
+\echo '== выгрузка истории робота за период: пачка по возрастанию id'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history WHERE id > 0 AND robot_id = 'RB-00007'
+    AND scanned_at >= timestamp '2024-01-01' AND scanned_at < timestamp '2024-02-01' ORDER BY id LIMIT 1000;
+
+\echo '== пересчёт остатков: дочитывание после курсора (inventory_after_id)'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT id, product_id, quantity FROM inventory_history WHERE id > :rows - 1000 ORDER BY id LIMIT 1000;
+
+\echo '== полный пересчёт остатков: RPC inventory_product_totals (SUM по product_id)'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT h.product_id, SUM(h.quantity) FROM inventory_history h
+WHERE h.id <= :rows AND h.product_id IS NOT NULL GROUP BY h.product_id;
+SELECT inventory_product_totals();
+
+\echo '== архивация: строки старше границы по id'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_history WHERE scanned_at < timestamp '2024-01-02' AND id > 0 ORDER BY id LIMIT 1000;
+
+\echo '== прогноз: часовые агрегаты за 14 дней'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_rollups
+WHERE granularity = 'hour' AND bucket >= to_char(timestamp '2024-01-01' + :rows * interval '3 seconds' - interval '14 days', 'YYYY-MM-DD"T"HH24')
+ORDER BY bucket, product_id, zone;
+
+\echo '== агрегаты одного товара'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM inventory_rollups WHERE granularity = 'day' AND product_id = 'TEL-4567' ORDER BY bucket;
+
+\echo '== последние 20 прогнозов'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM ai_predictions ORDER BY created_at DESC, id DESC LIMIT 20;
+
+\echo '== вход: пользователь по имени'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT * FROM users WHERE name = 'user5000' LIMIT 1;
+
+\echo '== приём данных: вставка 3 сканирований (стоимость поддержки индексов)'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+INSERT INTO inventory_history (robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at)
+VALUES ('RB-00001', 'TEL-4567', 10, 'A', 1, 1, 'OK', now()),
+       ('RB-00001', 'TEL-8901', 12, 'A', 1, 1, 'OK', now()),
+       ('RB-00001', 'TEL-2345', 14, 'A', 1, 1, 'OK', now());
+
+DROP SCHEMA plan_check CASCADE;
@@ -1,18 +1,38 @@
 """
 Эмулятор роботов склада. Отправляет данные сканирования на API и сохраняет в БД.
+
+Нагрузочный режим (--load): тысячи роботов в одном asyncio-цикле, пул keep-alive
+соединений, поток сообщений с заданной интенсивностью (пуассоновский) и всплесками,
+воспроизводимый через --seed. В конце пишет JSON-отчёт: пропускная способность,
+задержка p50/p95/p99 и ошибки — для сравнения между релизами.
+
+--format binary (или TELEMETRY_FORMAT=binary) отправляет сообщения в компактном двоичном
+формате services/wire.py, --gzip (TELEMETRY_GZIP=1) сжимает тело; если сервер ответил 415,
+эмулятор возвращается к JSON.
 """
+import argparse
+import asyncio
+import gzip
 import json
+import ssl
 import time
 import random
 import requests
+import urllib.parse
+from collections import Counter
 from datetime import datetime
 import os
 
+from services.wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, encode_batch
+
 
 class RobotEmulator:
-    def __init__(self, robot_id, api_url):
+    def __init__(self, robot_id, api_url, rng=None, fmt='json', compress=False):
         self.robot_id = robot_id
         self.api_url = api_url
+        self.rng = rng or random  # random.Random(seed) для воспроизводимых прогонов
+        self.fmt = fmt  # json или binary (services/wire.py)
+        self.compress = compress
         self.battery = 100
         self.current_zone = 'A'
         self.current_row = 1
@@ -28,11 +48,11 @@ class RobotEmulator:
 
     def generate_scan_data(self):
         """Генерация данных сканирования"""
-        scanned_products = random.sample(self.products, k=random.randint(1, 3))
+        scanned_products = self.rng.sample(self.products, k=self.rng.randint(1, 3))
         scan_results = []
 
         for product in scanned_products:
-            quantity = random.randint(5, 100)
+            quantity = self.rng.randint(5, 100)
             status = "OK" if quantity > 20 else ("LOW_STOCK" if quantity > 10 else "CRITICAL")
 
             scan_results.append({
@@ -58,13 +78,13 @@ class RobotEmulator:
                     self.current_zone = 'A'
 
         # Расход батареи
-        self.battery -= random.uniform(0.1, 0.5)
+        self.battery -= self.rng.uniform(0.1, 0.5)
         if self.battery < 20:
             self.battery = 100  # Симуляция зарядки
 
-    def send_data(self):
-        """Отправка данных на сервер (сохраняется в БД)"""
-        data = {
+    def build_payload(self):
+        """Сообщение робота для /api/robots/data"""
+        return {
             "robot_id": self.robot_id,
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "location": {
@@ -77,17 +97,36 @@ class RobotEmulator:
             "next_checkpoint": f"{self.current_zone}-{self.current_row+1}-{self.current_shelf}"
         }
 
+    def encode_payload(self, payload):
+        """Тело запроса и заголовки в выбранном формате (json/binary, по желанию gzip)"""
+        headers = {"Authorization": f"Bearer robot_token_{self.robot_id}"}
+        if self.fmt == 'binary':
+            body = encode_batch([payload])
+            headers["Content-Type"] = WIRE_CONTENT_TYPE
+        else:
+            body = json.dumps(payload).encode('utf-8')
+            headers["Content-Type"] = "application/json"
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    def fallback_to_json(self):
+        """Сервер не принимает формат (415): дальше — несжатый JSON"""
+        self.fmt, self.compress = 'json', False
+
+    def send_data(self):
+        """Отправка данных на сервер (сохраняется в БД)"""
+        data = self.build_payload()
         try:
-            response = requests.post(
-                f"{self.api_url}/api/robots/data",
-                json=data,
-                headers={
-                    "Authorization": f"Bearer robot_token_{self.robot_id}",
-                    "Content-Type": "application/json"
-                },
-                timeout=10
-            )
-            if response.status_code == 200:
+            body, headers = self.encode_payload(data)
+            response = requests.post(f"{self.api_url}/api/robots/data", data=body, headers=headers, timeout=10)
+            if response.status_code == 415 and self.fmt != 'json':
+                print(f"[{self.robot_id}] Server rejected {self.fmt} payload, falling back to JSON")
+                self.fallback_to_json()
+                body, headers = self.encode_payload(data)
+                response = requests.post(f"{self.api_url}/api/robots/data", data=body, headers=headers, timeout=10)
+            if response.status_code in (200, 202):
                 print(f"[{self.robot_id}] Data sent successfully")
             else:
                 print(f"[{self.robot_id}] Error: {response.status_code} - {response.text[:100]}")
@@ -102,15 +141,241 @@ class RobotEmulator:
             time.sleep(int(os.getenv('UPDATE_INTERVAL', 10)))
 
 
+# --- Нагрузочный режим ---
+
+class HttpPool:
+    """Пул keep-alive соединений HTTP/1.1 поверх asyncio streams."""
+
+    def __init__(self, base_url, size, timeout):
+        url = urllib.parse.urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == 'https' else None
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def post(self, path, body, headers):
+        """POST с телом body (bytes); возвращает HTTP-статус."""
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            reused = conn is not None
+            while True:
+                if conn is None:
+                    conn = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout
+                    )
+                    self.connections_opened += 1
+                reader, writer = conn
+                try:
+                    status, keep_alive = await asyncio.wait_for(
+                        self._request(reader, writer, path, body, headers), self.timeout
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if not reused:
+                        raise
+                    conn, reused = None, False  # сервер закрыл простаивающее соединение — повторяем на новом
+                    continue
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self._idle.append(conn)
+                else:
+                    writer.close()
+                return status
+
+    async def _request(self, reader, writer, path, body, headers):
+        head = [f"POST {self.prefix}{path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        version, status = status_line.split()[:2]
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == b'HTTP/1.1' and response_headers.get('connection', '').lower() != 'close'
+        if 'content-length' in response_headers:
+            await reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.read()
+            keep_alive = False
+        return int(status), keep_alive
+
+
+def build_schedule(rate, duration, seed, burst_every=0.0, burst_size=0):
+    """
+    Моменты отправки (секунды от старта): пуассоновский поток с интенсивностью rate
+    плюс всплески по burst_size сообщений каждые burst_every секунд.
+    """
+    rng = random.Random(seed)
+    times = []
+    t = rng.expovariate(rate) if rate > 0 else duration
+    while t < duration:
+        times.append(t)
+        t += rng.expovariate(rate)
+    if burst_every > 0 and burst_size > 0:
+        k = 1
+        while k * burst_every < duration:
+            times.extend([k * burst_every] * burst_size)
+            k += 1
+    return sorted(times)
+
+
+def percentile(sorted_values, p):
+    """Перцентиль p (0–100) по методу ближайшего ранга."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_load(api_url, robots=1000, rate=200.0, duration=30.0, seed=42,
+                   burst_every=0.0, burst_size=0, connections=64, timeout=10.0, fmt='json', compress=False):
+    """
+    Прогон нагрузки на /api/robots/data. Задержка считается от запланированного момента
+    отправки, поэтому ожидание свободного соединения тоже попадает в p95/p99.
+    """
+    rng = random.Random(seed)
+    emulators = [RobotEmulator(f"RB-{i:05d}", api_url, rng=rng, fmt=fmt, compress=compress)
+                 for i in range(1, robots + 1)]
+    schedule = build_schedule(rate, duration, seed, burst_every, burst_size)
+    pool = HttpPool(api_url, connections, timeout)
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    bytes_sent = 0
+    readings = 0
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def fire(index, at):
+        nonlocal bytes_sent, readings
+        robot = emulators[index % robots]
+        payload = robot.build_payload()
+        body, headers = robot.encode_payload(payload)
+        robot.move_to_next_location()
+        bytes_sent += len(body)
+        readings += len(payload['scan_results'])
+        try:
+            status = await pool.post('/api/robots/data', body, headers)
+            if status == 415 and robot.fmt != 'json':
+                robot.fallback_to_json()
+                errors['fallback_to_json'] += 1
+                body, headers = robot.encode_payload(payload)
+                bytes_sent += len(body)
+                status = await pool.post('/api/robots/data', body, headers)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+            return
+        statuses[status] += 1
+        if status in (200, 202):
+            latencies.append(loop.time() - start - at)
+        else:
+            errors[f"HTTP {status}"] += 1
+
+    tasks = []
+    for index, at in enumerate(schedule):
+        delay = start + at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(index, at)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+
+    latencies.sort()
+    ok = len(latencies)
+    return {
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'config': {
+            'api_url': api_url, 'robots': robots, 'rate': rate, 'duration': duration, 'seed': seed,
+            'burst_every': burst_every, 'burst_size': burst_size, 'connections': connections, 'timeout': timeout,
+            'format': fmt, 'gzip': compress,
+        },
+        'sent': len(schedule),
+        'ok': ok,
+        'errors': dict(errors),
+        'statuses': {str(k): v for k, v in statuses.items()},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(ok / elapsed, 2) if elapsed else None,
+        'bytes_sent': bytes_sent,
+        'readings': readings,
+        'bytes_per_reading': round(bytes_sent / readings, 1) if readings else None,
+        'connections_opened': pool.connections_opened,
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 50)),
+            'p95': _ms(percentile(latencies, 95)),
+            'p99': _ms(percentile(latencies, 99)),
+            'max': _ms(latencies[-1] if latencies else None),
+            'mean': _ms(sum(latencies) / ok if ok else None),
+        },
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Эмулятор роботов склада и генератор нагрузки')
+    parser.add_argument('--load', action='store_true', help='нагрузочный прогон вместо бесконечной эмуляции')
+    parser.add_argument('--robots', type=int, default=1000, help='число роботов')
+    parser.add_argument('--rate', type=float, default=200.0, help='сообщений в секунду (среднее)')
+    parser.add_argument('--duration', type=float, default=30.0, help='длительность прогона, секунды')
+    parser.add_argument('--seed', type=int, default=42, help='seed генератора случайных чисел')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='период всплесков, секунды (0 — без всплесков)')
+    parser.add_argument('--burst-size', type=int, default=0, help='сообщений в одном всплеске')
+    parser.add_argument('--connections', type=int, default=64, help='размер пула keep-alive соединений')
+    parser.add_argument('--timeout', type=float, default=10.0, help='таймаут запроса, секунды')
+    parser.add_argument('--format', choices=('json', 'binary'), default=os.getenv('TELEMETRY_FORMAT', 'json'),
+                        help='формат тела: json или компактный двоичный (services/wire.py)')
+    parser.add_argument('--gzip', action='store_true', default=os.getenv('TELEMETRY_GZIP', '0') == '1',
+                        help='сжимать тело gzip (Content-Encoding: gzip)')
+    parser.add_argument('--out', default='loadtest_report.json', help='куда записать JSON-отчёт')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     api_url = os.getenv('API_URL', 'http://127.0.0.1:10000')
     robots_count = int(os.getenv('ROBOTS_COUNT', 5))
+    args = _parse_args()
+
+    if args.load:
+        report = asyncio.run(run_load(
+            api_url, robots=args.robots, rate=args.rate, duration=args.duration, seed=args.seed,
+            burst_every=args.burst_every, burst_size=args.burst_size,
+            connections=args.connections, timeout=args.timeout, fmt=args.format, compress=args.gzip
+        ))
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        raise SystemExit(0)
 
     # Запуск эмуляторов роботов
     import threading
 
     for i in range(1, robots_count + 1):
-        robot = RobotEmulator(f"RB-{i:03d}", api_url)
+        robot = RobotEmulator(f"RB-{i:03d}", api_url, fmt=args.format, compress=args.gzip)
         thread = threading.Thread(target=robot.run)
         thread.daemon = True
         thread.start()
@@ -3,63 +3,95 @@ API для приёма данных от роботов склада. Сохр
 """
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from database.models import upsert_robot, insert_inventory_record
+from database.models import record_telemetry
+from services.events import publish_ingested
+from services.ingest_queue import INGEST_QUEUE_ENABLED, get_ingest_queue
+from services.telemetry import (
+    PayloadError, batch_messages, batch_summary, decode_body, fail_parsed, parse_batch, parse_message,
+)
 
 api_bp = Blueprint('api', __name__)
 
+# Через сколько секунд роботу повторить отправку, если очередь заполнена
+QUEUE_FULL_RETRY_AFTER = 2
+
 
 @api_bp.route('/robots/data', methods=['POST'])
 def robots_data():
     """
     Принимает данные от эмулятора робота.
-    Обновляет robots, добавляет записи в inventory_history.
+    Обновляет robots, добавляет записи в inventory_history одним запросом.
+    При INGEST_QUEUE=1 сообщение ставится в очередь отложенной записи (ответ 202).
     """
-    data = request.get_json()
-    if not data:
-        return jsonify({'error': 'JSON required'}), 400
+    try:
+        robot, records = parse_message(_request_data(batch=False))
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    robot_id = data.get('robot_id')
-    timestamp = data.get('timestamp')
-    location = data.get('location', {})
-    scan_results = data.get('scan_results', [])
-    battery_level = data.get('battery_level')
-    next_checkpoint = data.get('next_checkpoint')
+    if INGEST_QUEUE_ENABLED:
+        if not get_ingest_queue().put(robot, records):
+            return _queue_full_response()
+        return jsonify({'status': 'queued', 'robot_id': robot['robot_id']}), 202
 
-    if not robot_id or not timestamp:
-        return jsonify({'error': 'robot_id and timestamp required'}), 400
+    try:
+        written_robots, inserted = record_telemetry([robot], records)
+        publish_ingested(written_robots, inserted)
+        return jsonify({'status': 'ok', 'robot_id': robot['robot_id']}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-    zone = location.get('zone', 'A')
-    row = location.get('row', 1)
-    shelf = location.get('shelf', 1)
 
+@api_bp.route('/robots/data/batch', methods=['POST'])
+def robots_data_batch():
+    """
+    Принимает пачку сообщений роботов: {"messages": [...]} или JSON-массив.
+    Все роботы обновляются одним upsert, все сканирования — одним insert.
+    В ответе — результат по каждому сообщению (index, robot_id, status, error).
+    При INGEST_QUEUE=1 сообщения ставятся в очередь отложенной записи (ответ 202).
+    """
     try:
-        # Обновляем робота
-        upsert_robot(
-            robot_id=robot_id,
-            status='active',
-            battery_level=battery_level,
-            current_zone=str(zone),
-            current_row=int(row),
-            current_shelf=int(shelf)
-        )
+        messages = batch_messages(_request_data(batch=True))
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    results, parsed = parse_batch(messages)
 
-        # Добавляем записи инвентаризации
-        scanned_at = timestamp
-        for scan in scan_results:
-            product_id = scan.get('product_id', scan.get('product_name', 'UNKNOWN'))
-            quantity = scan.get('quantity', 0)
-            status = scan.get('status', 'OK')
-            insert_inventory_record(
-                robot_id=robot_id,
-                product_id=product_id,
-                quantity=quantity,
-                zone=str(zone),
-                row_number=int(row),
-                shelf_number=int(shelf),
-                status=status,
-                scanned_at=scanned_at
+    status_code = 200
+    if parsed and INGEST_QUEUE_ENABLED:
+        queue = get_ingest_queue()
+        for i, robot, message_records in parsed:
+            if queue.put(robot, message_records):
+                results[i]['status'] = 'queued'
+            else:
+                results[i]['status'] = 'error'
+                results[i]['error'] = 'queue full'
+        if all(results[i]['status'] == 'error' for i, _, _ in parsed):
+            return _queue_full_response()
+        status_code = 202
+    elif parsed:
+        try:
+            written_robots, inserted = record_telemetry(
+                [robot for _, robot, _ in parsed], [rec for _, _, recs in parsed for rec in recs]
             )
+            publish_ingested(written_robots, inserted)
+        except Exception as e:
+            status_code = 500
+            fail_parsed(results, parsed, str(e))
 
-        return jsonify({'status': 'ok', 'robot_id': robot_id}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return jsonify(batch_summary(results)), status_code
+
+
+def _request_data(batch):
+    """Тело запроса: JSON или двоичный формат services/wire.py, по желанию gzip (Content-Encoding)."""
+    return decode_body(request.get_data(cache=False), request.content_type,
+                       request.headers.get('Content-Encoding'), batch=batch)
+
+
+def _queue_full_response():
+    response = jsonify({'error': 'ingest queue is full, retry later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER)
+    return response
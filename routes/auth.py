@@ -4,6 +4,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 
+from database.connection import ensure_admin
 from database.models import get_user_by_name
 
 auth_bp = Blueprint('auth', __name__)
@@ -18,6 +19,7 @@ def login():
         name_input = request.form.get('login', '').strip()  # поле "логин" = name в БД
         password = request.form.get('password', '')
         remember = request.form.get('remember') == 'on'
+        ensure_admin()
         
         user = get_user_by_name(name_input)
         
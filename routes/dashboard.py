@@ -2,18 +2,38 @@
 Роутер главной страницы (dashboard) - шаблоны по ролям.
 Роли: admin, Начальник склада, Менеджер по продажам, Приёмщик товаров, Логист
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import hashlib
+import os
+import queue
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
 from flask_login import login_required, current_user
 
 from database.models import (
     User,
-    get_robots, get_inventory_history, get_ai_predictions, get_products,
-    get_users_except_admin, create_user, user_exists, recompute_products_quantities_and_status,
+    get_live_robots, get_live_inventory, get_ai_predictions, get_products,
+    get_users_except_admin, create_user, user_exists,
+    rebuild_products_quantities_and_status, get_inventory_rollups, rebuild_inventory_rollups,
+    get_shelf, get_location_heatmap, get_history_page, HISTORY_FILTERS,
+    live_version, predictions_version, products_version, rollups_stale,
 )
-from services.ai_prognoz import generate_ai_prognoz
+from database.cache import cache_stats
+from database.live_state import live_state
+from services.events import STREAM_MAX_CLIENTS, broadcaster, request_stock_refresh, sse_format
+from services.history_export import FORMATS as EXPORT_FORMATS, export_history
+from services.jobs import get_job_runner
+from services.metrics import report_error
+from services.retention import retention_state, status as retention_status
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Пауза между keep-alive комментариями в потоке событий (секунды)
+STREAM_HEARTBEAT = 15
+# Максимальная длительность одного потока; браузер переподключится сам (секунды)
+STREAM_MAX_SECONDS = 300
+
 
 @dashboard_bp.route('/')
 @login_required
@@ -31,19 +51,79 @@ def main():
         return render_template('dashboard/user.html', apps=['inventory'])
 
 
+PROGNOZ_ROLES = ('Менеджер по продажам', 'Логист')
+
+
+def _wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+
 @dashboard_bp.route('/generate-prognoz', methods=['POST'])
 @login_required
 def generate_prognoz():
-    """Запрос к ИИ API и сохранение прогноза в ai_predictions (Менеджер по продажам, Логист)"""
-    if current_user.role not in ('Менеджер по продажам', 'Логист'):
+    """
+    Ставит формирование прогноза в фоновую задачу (Менеджер по продажам, Логист).
+    Запросу с Accept: application/json отвечает 202 с задачей, форме — редиректом.
+    Пока прогноз считается, повторные запросы получают ту же задачу.
+    """
+    if current_user.role not in PROGNOZ_ROLES:
+        if _wants_json():
+            return jsonify({'error': 'Доступ запрещён'}), 403
         flash('Доступ запрещён', 'error')
         return redirect(url_for('dashboard.main'))
-    
-    prognoz, error = generate_ai_prognoz()
-    if error:
-        flash(f'Ошибка: {error}', 'error')
+
+    # Прогноз (numpy-модель, клиент ИИ-API) импортируется при первом запуске, не при старте воркера
+    from services.ai_prognoz import prognoz_job
+    job, created = get_job_runner().submit('prognoz', prognoz_job, requested_by=current_user.login)
+    if _wants_json():
+        response = jsonify(job)
+        response.status_code = 202
+        response.headers['Location'] = url_for('dashboard.job_status', job_id=job['id'])
+        return response
+    if created:
+        flash('Прогноз формируется, результаты появятся автоматически', 'success')
+    else:
+        flash('Прогноз уже формируется', 'success')
+    return redirect(url_for('dashboard.main'))
+
+
+@dashboard_bp.route('/jobs')
+@login_required
+def jobs_list():
+    """Последние фоновые задачи (?kind=prognoz)"""
+    if not current_user.is_admin and current_user.role not in PROGNOZ_ROLES:
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    kind = request.args.get('kind') or None
+    return jsonify({'jobs': get_job_runner().history(kind=kind)})
+
+
+@dashboard_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Статус фоновой задачи: queued, running, done или error"""
+    if not current_user.is_admin and current_user.role not in PROGNOZ_ROLES:
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    job = get_job_runner().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(job)
+
+
+@dashboard_bp.route('/rebuild-stock', methods=['POST'])
+@login_required
+def rebuild_stock():
+    """Полный пересчёт остатков товаров и агрегатов inventory_rollups по всей истории (только для админа)"""
+    if not current_user.is_admin:
+        flash('Доступ запрещён', 'error')
+        return redirect(url_for('dashboard.main'))
+
+    try:
+        updated = rebuild_products_quantities_and_status()
+        rebuild_inventory_rollups()
+    except Exception as e:
+        flash(f'Ошибка пересчёта остатков: {e}', 'error')
     else:
-        flash('Прогноз успешно сформирован', 'success')
+        flash(f'Остатки пересчитаны, обновлено товаров: {len(updated)}', 'success')
     return redirect(url_for('dashboard.main'))
 
 
@@ -89,37 +169,308 @@ def create_account():
     return redirect(url_for('dashboard.main'))
 
 
+def _with_product_names(rows, products):
+    """Копии строк с product_name; строки из кэшей и живого состояния не изменяются"""
+    return [dict(row, product_name=products.get(row.get('product_id'), row.get('product_id'))) for row in rows]
+
+
+def _since_cursor():
+    """Параметр ?since=: id последней полученной записи inventory_history или scanned_at."""
+    since = request.args.get('since', '').strip()
+    if not since:
+        return None
+    return int(since) if since.isdigit() else since
+
+
+_etag_token = (None, None)
+
+
+def _state_etag(*versions):
+    """
+    Слабый ETag из номеров версий данных, известных до сборки ответа, или None, если хоть
+    одной версии нет. Метка процесса: версии живого состояния у каждого воркера свои.
+    """
+    global _etag_token
+    if any(v is None for v in versions):
+        return None
+    if _etag_token[0] != os.getpid():
+        _etag_token = (os.getpid(), os.urandom(8).hex())
+    raw = repr((_etag_token[1], request.full_path, versions))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+
+def _not_modified(etag):
+    """304 без сборки и сериализации данных, если клиент прислал этот ETag; иначе None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _conditional_json(payload, inventory, since, etag=None):
+    """
+    JSON-ответ с курсором для следующего запроса и ETag (по версиям данных, если они известны,
+    иначе по телу): при совпадении If-None-Match возвращается 304 без тела.
+    """
+    ids = [inv['id'] for inv in inventory if isinstance(inv.get('id'), int)]
+    payload['cursor'] = max(ids) if ids else (since if isinstance(since, int) else None)
+    response = jsonify(payload)
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
 @dashboard_bp.route('/data/warehouse')
 @login_required
 def data_warehouse():
-    try:
-        recompute_products_quantities_and_status()
-    except Exception:
-        pass
-    robots = get_robots()
-    inventory = get_inventory_history(50)
+    """Роботы и лента сканирований из живого состояния процесса (без запросов к хранилищу)"""
+    since = _since_cursor()
+    # Версии читаются до данных: запись между ними даст лишний ответ 200, но не устаревший 304
+    etag = _state_etag('warehouse', live_version(50), products_version())
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    robots = get_live_robots()
+    inventory = get_live_inventory(50, since=since)
     products = {p['id']: p.get('name', p['id']) for p in get_products()}
-    for inv in inventory:
-        inv['product_name'] = products.get(inv.get('product_id'), inv.get('product_id'))
-    return jsonify({'robots': robots, 'inventory': inventory})
+    inventory = _with_product_names(inventory, products)
+    return _conditional_json({'robots': robots, 'inventory': inventory}, inventory, since, etag)
 
 
 @dashboard_bp.route('/data/logist')
 @login_required
 def data_logist():
-    try:
-        recompute_products_quantities_and_status()
-    except Exception:
-        pass
-    inventory = get_inventory_history(50)
+    # Остатки пересчитывает фоновый поток; изменившийся каталог сменит ETag следующего опроса
+    request_stock_refresh()
+    since = _since_cursor()
+    etag = _state_etag('logist', live_version(50), products_version(), predictions_version(20))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    inventory = get_live_inventory(50, since=since)
     predictions = get_ai_predictions(20)
     products_list = get_products()
     products = {p['id']: p.get('name', p['id']) for p in products_list}
-    for inv in inventory:
-        inv['product_name'] = products.get(inv.get('product_id'), inv.get('product_id'))
-    for p in predictions:
-        p['product_name'] = products.get(p.get('product_id'), p.get('product_id'))
-    return jsonify({'inventory': inventory, 'predictions': predictions, 'products': products_list})
+    inventory = _with_product_names(inventory, products)
+    predictions = _with_product_names(predictions, products)
+    payload = {'inventory': inventory, 'predictions': predictions, 'products': products_list}
+    return _conditional_json(payload, inventory, since, etag)
+
+
+# Окно агрегатов по умолчанию, если ?since= не задан
+ROLLUP_DEFAULT_WINDOW = {'minute': timedelta(hours=2), 'hour': timedelta(days=7), 'day': timedelta(days=90)}
+
+
+@dashboard_bp.route('/data/rollups')
+@login_required
+def data_rollups():
+    """
+    Агрегаты истории по времени: ?granularity=minute|hour|day, ?since=, ?until= (префиксы scanned_at),
+    ?product_id=, ?zone=. Без since — последние 2 часа / 7 дней / 90 дней.
+    """
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ROLLUP_DEFAULT_WINDOW:
+        return jsonify({'error': 'granularity: minute, hour или day'}), 400
+    since = request.args.get('since') or (datetime.utcnow() - ROLLUP_DEFAULT_WINDOW[granularity]).strftime('%Y-%m-%dT%H:%M')
+    rollups = get_inventory_rollups(
+        granularity, since=since, until=request.args.get('until') or None,
+        product_id=request.args.get('product_id') or None, zone=request.args.get('zone') or None,
+    )
+    # stale: запись агрегатов где-то сбоила, до пересборки они неполны
+    response = jsonify({'granularity': granularity, 'since': since, 'stale': rollups_stale(), 'rollups': rollups})
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+@dashboard_bp.route('/data/heatmap')
+@login_required
+def data_heatmap():
+    """
+    Заполненность склада по зонам и рядам: число ячеек, сумма остатков и ячейки по статусам
+    последнего сканирования. ?zone= — одна зона, ?status=CRITICAL — только зоны и ряды с такими ячейками.
+    """
+    status = request.args.get('status') or None
+    if status is not None:
+        status = status.upper()
+    heatmap = get_location_heatmap(zone=request.args.get('zone') or None, status=status)
+    response = jsonify(heatmap)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+@dashboard_bp.route('/data/shelf/<location>')
+@login_required
+def data_shelf(location):
+    """Что лежит на полке: location в формате зона-ряд-полка, как checkpoint робота (например, B-7-3)"""
+    try:
+        zone, row, shelf = location.rsplit('-', 2)
+        row, shelf = int(row), int(shelf)
+    except ValueError:
+        return jsonify({'error': 'Формат места: зона-ряд-полка, например B-7-3'}), 400
+    cells = get_shelf(zone, row, shelf)
+    products = {p['id']: p.get('name', p['id']) for p in get_products()}
+    cells = _with_product_names(cells, products)
+    return jsonify({'zone': zone, 'row_number': row, 'shelf_number': shelf, 'cells': cells})
+
+
+# Строк на странице истории: по умолчанию и максимум
+HISTORY_PAGE_SIZE = 100
+HISTORY_PAGE_MAX = 1000
+
+
+def _history_filters():
+    """
+    Фильтры истории из ?product_id=, ?robot_id=, ?zone=, ?status=, ?since=, ?until= (since <= scanned_at < until).
+    since и until — дата или дата и время ISO 8601 (со смещением — переводятся в UTC); иначе ValueError.
+    """
+    filters = {name: request.args[name] for name in HISTORY_FILTERS if request.args.get(name)}
+    for name in ('since', 'until'):
+        if name in filters:
+            filters[name] = _iso_datetime(name, filters[name])
+    return filters
+
+
+def _iso_datetime(name, value):
+    try:
+        dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name}: дата или дата и время ISO 8601, например 2024-01-31T12:00:00') from None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+
+@dashboard_bp.route('/data/history')
+@login_required
+def data_history():
+    """
+    История сканирований по страницам: ?cursor= — next_cursor предыдущей страницы, ?limit= (до 1000),
+    ?order=desc|asc (по id, по умолчанию новые сначала) и фильтры _history_filters.
+    """
+    try:
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'cursor и limit — целые числа'}), 400
+    if not 1 <= limit <= HISTORY_PAGE_MAX:
+        return jsonify({'error': f'limit: от 1 до {HISTORY_PAGE_MAX}'}), 400
+    order = request.args.get('order', 'desc')
+    if order not in ('desc', 'asc'):
+        return jsonify({'error': 'order: desc или asc'}), 400
+    try:
+        filters = _history_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page = get_history_page(limit, cursor=cursor, descending=order == 'desc', **filters)
+    products = {p['id']: p.get('name', p['id']) for p in get_products()}
+    page['rows'] = _with_product_names(page['rows'], products)
+    page.update(limit=limit, order=order, filters=filters)
+    return jsonify(page)
+
+
+@dashboard_bp.route('/data/history/export')
+@login_required
+def data_history_export():
+    """
+    Выгрузка истории с фильтрами _history_filters: ?format=csv|jsonl, по возрастанию id (только для админа).
+    Ответ идёт потоком по мере чтения пачек из хранилища (services/history_export.py).
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'format: csv или jsonl'}), 400
+    try:
+        filters = _history_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filename = f"inventory_history_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{fmt}"
+    return Response(stream_with_context(export_history(fmt, **filters)), content_type=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@dashboard_bp.route('/data/cache')
+@login_required
+def data_cache():
+    """Счётчики попаданий/промахов кэша товаров и роботов (только для админа)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    return jsonify(cache_stats())
+
+
+@dashboard_bp.route('/data/live')
+@login_required
+def data_live():
+    """Размер живого состояния склада в памяти процесса (только для админа)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    return jsonify(live_state.stats())
+
+
+@dashboard_bp.route('/data/retention')
+@login_required
+def data_retention():
+    """Архив истории: дни в архиве, архивные суммы и последний запуск по расписанию (только для админа)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Доступ запрещён'}), 403
+    payload = retention_status()
+    payload['scheduler'] = retention_state
+    return jsonify(payload)
+
+
+@dashboard_bp.route('/stream')
+@login_required
+def stream():
+    """
+    Поток Server-Sent Events с изменениями склада: robots, inventory, products, job.
+    Клиент получает только новые события; начальное состояние берётся из /data/*.
+    """
+    subscription = broadcaster.subscribe(STREAM_MAX_CLIENTS)
+    if subscription is None:
+        # Потоков уже STREAM_MAX_CLIENTS: браузер получит ошибку и перейдёт на опрос /data/*
+        return Response('too many event streams\n', status=503, mimetype='text/plain',
+                        headers={'Retry-After': str(STREAM_HEARTBEAT)})
+    try:
+        products = {p['id']: p.get('name', p['id']) for p in get_products()}
+    except Exception:
+        broadcaster.unsubscribe(subscription)
+        raise
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event, data = subscription.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if event is None:
+                    break  # клиент не успевал читать — пусть переподключится
+                if event == 'inventory':
+                    data = _with_product_names(data, products)
+                yield sse_format(event, data)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Если ответ закрыт до первой итерации, finally генератора не выполнится
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscription))
+    return response
 
 
 @dashboard_bp.route('/apps/<app_name>')
@@ -132,32 +483,28 @@ def app_page(app_name):
         if app_name not in ('robots', 'inventory'):
             flash('Доступ запрещён', 'error')
             return redirect(url_for('dashboard.main'))
-        robots = get_robots()
-        inventory = get_inventory_history(50)
+        robots = get_live_robots()
+        inventory = get_live_inventory(50)
         products_map = {p['id']: p.get('name', p['id']) for p in get_products()}
-        for inv in inventory:
-            inv['product_name'] = products_map.get(inv.get('product_id'), inv.get('product_id'))
+        inventory = _with_product_names(inventory, products_map)
         return render_template('dashboard/warehouse.html', robots=robots, inventory=inventory, view=app_name)
     if current_user.role == 'Приёмщик товаров':
         if app_name != 'inventory':
             flash('Доступ запрещён', 'error')
             return redirect(url_for('dashboard.main'))
-        inventory = get_inventory_history(50)
+        inventory = get_live_inventory(50)
         products_map = {p['id']: p.get('name', p['id']) for p in get_products()}
-        for inv in inventory:
-            inv['product_name'] = products_map.get(inv.get('product_id'), inv.get('product_id'))
+        inventory = _with_product_names(inventory, products_map)
         return render_template('dashboard/receiver.html', inventory=inventory, view=app_name)
     if current_user.role in ('Менеджер по продажам', 'Логист'):
         if app_name not in ('inventory', 'products', 'ai'):
             flash('Доступ запрещён', 'error')
             return redirect(url_for('dashboard.main'))
-        inventory = get_inventory_history(50)
+        inventory = get_live_inventory(50)
         predictions = get_ai_predictions(20)
         products_list = get_products()
         products = {p['id']: p.get('name', p['id']) for p in products_list}
-        for inv in inventory:
-            inv['product_name'] = products.get(inv.get('product_id'), inv.get('product_id'))
-        for p in predictions:
-            p['product_name'] = products.get(p.get('product_id'), p.get('product_id'))
+        inventory = _with_product_names(inventory, products)
+        predictions = _with_product_names(predictions, products)
         return render_template('dashboard/logist.html', inventory=inventory, predictions=predictions, products_list=products_list, view=app_name)
     return render_template('dashboard/user.html')
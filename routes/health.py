@@ -0,0 +1,39 @@
+"""
+Роутер проверок здоровья для балансировщика и оркестратора:
+/healthz — процесс жив (без обращений к хранилищу), /readyz — хранилище отвечает
+(и отчёт о старте воркера: время импорта, create_app, прогрева).
+"""
+import os
+import time
+
+from flask import Blueprint, jsonify
+
+from database.connection import get_backend
+from services.metrics import report_error
+from services.startup import startup
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+@health_bp.route('/readyz')
+def readyz():
+    """Запрос к хранилищу с ограниченными тайм-аутами; 503, если хранилище не ответило"""
+    backend = get_backend()
+    storage = {'backend': backend.name}
+    t0 = time.perf_counter()
+    try:
+        backend.ping()
+        storage['ok'] = True
+    except Exception as e:
+        report_error('readyz', 'Хранилище не отвечает')
+        storage.update(ok=False, error=str(e) or e.__class__.__name__)
+    storage['ms'] = round((time.perf_counter() - t0) * 1000, 1)
+    from services.http_clients import status as http_clients_status
+    payload = {'status': 'ok' if storage['ok'] else 'error', 'storage': storage, 'clients': http_clients_status(),
+               'startup': startup.report()}
+    return jsonify(payload), 200 if storage['ok'] else 503
@@ -0,0 +1,26 @@
+"""
+Роутер метрик: /metrics в текстовом формате Prometheus (services/metrics.py).
+"""
+import hmac
+
+from flask import Blueprint, Response, request
+from flask_login import current_user
+
+from services.metrics import METRICS_TOKEN, metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics')
+def prometheus_metrics():
+    """
+    С METRICS_TOKEN — по заголовку Authorization: Bearer <токен>, без него — только админу.
+    Адрес клиента не проверяется: за reverse proxy remote_addr у всех запросов — адрес прокси.
+    """
+    if METRICS_TOKEN:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    else:
+        allowed = current_user.is_authenticated and current_user.is_admin
+    if not allowed:
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
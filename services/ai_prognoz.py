@@ -1,27 +1,40 @@
 """
-Сервис получения ИИ-прогнозов. Использует inventory_history и products.
+Сервис прогнозов по товарам. Использует inventory_history и products.
 Сохраняет в ai_predictions (структурированные прогнозы по товарам).
+По умолчанию прогноз считает локальная модель services.forecast;
+при AI_PROGNOZ_LLM=1 и ключе Groq/DeepSeek ИИ уточняет локальные оценки.
 """
 import os
 import json
+import hashlib
 import requests
 from datetime import datetime, date, timedelta
-from dotenv import load_dotenv
 
-from database.models import get_inventory_history, get_products, insert_ai_prediction, recompute_products_quantities_and_status
-
-load_dotenv()
+from database.cache import TTLCache
+from database.models import get_products, get_hourly_inventory, insert_ai_predictions, recompute_products_quantities_and_status
+from services.forecast import forecast_products, forecast_window_start
+from services.http_clients import AI_TIMEOUT, ai_session
 
 GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
 GROQ_MODEL = "llama-3.3-70b-versatile"
 DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
 DEEPSEEK_MODEL = "deepseek-chat"
 
+AI_PROGNOZ_LLM = os.getenv("AI_PROGNOZ_LLM", "0") == "1"
+
+# Кэш готовых прогнозов по отпечатку остатков: тот же склад в тот же день не пересчитывается
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", 6 * 3600))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 16))
+forecast_cache = TTLCache('forecasts', FORECAST_CACHE_TTL, maxsize=FORECAST_CACHE_SIZE)
+
 
 def generate_ai_prognoz():
     """
-    Получает данные из inventory_history и products, отправляет в ИИ-API,
-    сохраняет прогнозы в ai_predictions.
+    Считает прогнозы по всем товарам локальной моделью по рядам inventory_history,
+    при включённом AI_PROGNOZ_LLM уточняет их через ИИ-API, сохраняет в ai_predictions одним запросом.
+    Если остатки с прошлого расчёта за сегодня не изменились, берёт прогноз из forecast_cache
+    без модели, ИИ-API и повторной записи.
+    Возвращает ({'predictions', 'cached', 'fingerprint'[, 'cached_at', 'hits']}, None) или (None, текст ошибки).
     """
     recompute_products_quantities_and_status()
     products = get_products()
@@ -29,22 +42,84 @@ def generate_ai_prognoz():
     if not products:
         return None, "Нет данных о товарах для прогноза"
 
+    pred_date = date.today()
+    fingerprint = stock_fingerprint(products, pred_date)
+    entry = forecast_cache.get(fingerprint)
+    if entry is not None:
+        forecast_cache.update(fingerprint, lambda e: dict(e, hits=e['hits'] + 1))
+        return {
+            'predictions': len(entry['forecasts']), 'cached': True, 'fingerprint': fingerprint,
+            'cached_at': entry['created_at'], 'hits': entry['hits'] + 1,
+        }, None
+
+    forecasts = forecast_products(products, get_hourly_inventory(forecast_window_start()))
+    if AI_PROGNOZ_LLM:
+        forecasts = _enrich_with_llm(products, forecasts)
+
+    insert_ai_predictions([
+        {
+            'product_id': f['product_id'],
+            'prediction_date': pred_date,
+            'days_until_stockout': f['days_until_stockout'],
+            'recommended_order': f['recommended_order'],
+            'confidence_score': f['confidence'],
+        }
+        for f in forecasts
+    ])
+    forecast_cache.set(fingerprint, {
+        'forecasts': forecasts,
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'hits': 0,
+    })
+    return {'predictions': len(forecasts), 'cached': False, 'fingerprint': fingerprint}, None
+
+
+def stock_fingerprint(products, pred_date):
+    """Отпечаток остатков товаров (id и quantity), даты прогноза и режима ИИ."""
+    items = sorted(
+        (str(p.get('id') or p.get('product_id')), int(p.get('quantity') or 0))
+        for p in products if p.get('id') or p.get('product_id')
+    )
+    payload = json.dumps([pred_date.isoformat(), AI_PROGNOZ_LLM, items], separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def prognoz_job():
+    """generate_ai_prognoz для фоновой задачи: ошибка — исключение, результат — сводка расчёта."""
+    summary, error = generate_ai_prognoz()
+    if error:
+        raise RuntimeError(error)
+    return summary
+
+
+def _enrich_with_llm(products, forecasts):
+    """
+    Отправляет остатки и локальные оценки в ИИ-API и подставляет его уточнения.
+    При отсутствии ключей, ошибке API или непарсируемом ответе возвращает локальные прогнозы.
+    """
+    local = {f['product_id']: f for f in forecasts}
     lines = []
     for p in products:
         pid = p.get('id') or p.get('product_id')
+        if pid not in local:
+            continue
         name = p.get('name') or pid
         qty = p.get('quantity', 0)
         status = p.get('status', 'UNKNOWN')
-        lines.append(f"- {pid} ({name}): {qty} шт., статус: {status}")
+        f = local[pid]
+        lines.append(
+            f"- {pid} ({name}): {qty} шт., статус: {status}; локальная оценка: "
+            f"{f['days_until_stockout']} дн. до исчерпания, заказ {f['recommended_order']}, уверенность {f['confidence']}"
+        )
     data_text = "\n".join(lines)
 
     user_input = (
         "Ты — аналитик логистики. На основе агрегированных остатков товаров на складе (таблица products) "
-        "дай прогноз по каждому товару: сколько дней до исчерпания запаса, "
+        "и локальной статистической оценки уточни прогноз по каждому товару: сколько дней до исчерпания запаса, "
         "рекомендуемый объём заказа, уверенность прогноза (0.0–1.0). "
         "Отвечай ТОЛЬКО в формате JSON-массива, каждый элемент: "
         '{"product_id": "TEL-4567", "days_until_stockout": 14, "recommended_order": 50, "confidence": 0.85}. '
-        "Если не можешь дать точные числа — используй оценки.\n\n"
+        "Если не можешь дать точные числа — оставь локальную оценку.\n\n"
         f"Данные по товарам:\n\n{data_text}\n\n"
         "Список product_id из данных выше. Верни JSON-массив прогнозов."
     )
@@ -52,28 +127,13 @@ def generate_ai_prognoz():
     groq_key = os.getenv("GROQ_API_KEY")
     deepseek_key = os.getenv("DEEPSEEK_API_KEY")
     prognoz_text = None
-    deepseek_402 = False
 
     if groq_key:
         prognoz_text, _ = _call_api(GROQ_URL, groq_key, GROQ_MODEL, user_input)
     if prognoz_text is None and deepseek_key:
-        prognoz_text, err = _call_api(DEEPSEEK_URL, deepseek_key, DEEPSEEK_MODEL, user_input)
-        if prognoz_text and err and "402" in str(err):
-            deepseek_402 = True
-
+        prognoz_text, _ = _call_api(DEEPSEEK_URL, deepseek_key, DEEPSEEK_MODEL, user_input)
     if prognoz_text is None:
-        # Демо: создаём прогнозы на основе products
-        product_ids = [p.get('id') or p.get('product_id') for p in products if (p.get('id') or p.get('product_id'))]
-        pred_date = date.today()
-        for pid in product_ids[:5]:
-            insert_ai_prediction(
-                product_id=pid,
-                prediction_date=pred_date,
-                days_until_stockout=14,
-                recommended_order=50,
-                confidence_score=0.75
-            )
-        return True, None
+        return forecasts
 
     # Парсим JSON из ответа ИИ
     try:
@@ -88,32 +148,29 @@ def generate_ai_prognoz():
         if not isinstance(predictions, list):
             predictions = [predictions]
     except json.JSONDecodeError:
-        # Fallback: один общий прогноз
-        product_ids = [p.get('id') or p.get('product_id') for p in products if (p.get('id') or p.get('product_id'))]
-        for pid in product_ids[:3]:
-            insert_ai_prediction(pid, date.today(), 14, 50, 0.7)
-        return True, None
+        return forecasts
 
-    pred_date = date.today()
     for p in predictions:
-        pid = p.get('product_id') or p.get('product_name')
-        if not pid:
+        if not isinstance(p, dict):
             continue
-        insert_ai_prediction(
-            product_id=str(pid),
-            prediction_date=pred_date,
-            days_until_stockout=p.get('days_until_stockout'),
-            recommended_order=p.get('recommended_order'),
-            confidence_score=p.get('confidence') or p.get('confidence_score')
-        )
-    return True, None
+        pid = str(p.get('product_id') or p.get('product_name') or '')
+        if pid not in local:
+            continue
+        merged = dict(local[pid])
+        for key, source in (('days_until_stockout', 'days_until_stockout'), ('recommended_order', 'recommended_order'),
+                            ('confidence', 'confidence'), ('confidence', 'confidence_score')):
+            value = p.get(source)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+                merged[key] = min(float(value), 0.99) if key == 'confidence' else int(value)
+        local[pid] = merged
+    return [local[f['product_id']] for f in forecasts]
 
 
 def _call_api(url, api_key, model, user_input):
     try:
         headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
         data = {"model": model, "messages": [{"role": "user", "content": user_input}], "max_tokens": 800}
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        response = ai_session().post(url, headers=headers, json=data, timeout=AI_TIMEOUT)
         response.raise_for_status()
         result = response.json()
         return result["choices"][0]["message"]["content"] or "", None
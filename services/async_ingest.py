@@ -0,0 +1,246 @@
+"""
+Асинхронная запись телеметрии роботов для ingest_asgi.py.
+Запросы не пишут в хранилище по одному: сообщения, пришедшие за INGEST_ASGI_FLUSH_INTERVAL
+(или до INGEST_ASGI_FLUSH_SIZE сообщений), собираются в одну пачку — один upsert robots,
+один insert inventory_history и одно RPC агрегатов, — и каждый запрос получает ответ после
+записи своей пачки. Если хранилище отклонило данные пачки, она делится пополам и пишется заново,
+пока ошибку не получат только запросы с отклонёнными сообщениями. Supabase пишется через httpx.AsyncClient напрямую в PostgREST, не блокируя
+цикл событий; остальные хранилища (sqlite) — в пуле потоков через database.models.
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import httpx
+
+from database.backends.base import is_data_error
+from database.connection import STORAGE_BACKEND, SUPABASE_KEY, SUPABASE_URL
+from database.models import (
+    ROLLUPS_STALE_KEY, inventory_rows, record_telemetry, robot_rows, rollups_stale_marker,
+)
+from database.rollups import ROLLUPS_ENABLED, rollup_rows
+from services.http_clients import (
+    SUPABASE_CONNECT_TIMEOUT, SUPABASE_HTTP2, SUPABASE_KEEPALIVE, SUPABASE_POOL_SIZE,
+    SUPABASE_POOL_TIMEOUT, SUPABASE_READ_TIMEOUT,
+)
+from services.metrics import report_error
+
+# Сообщений в пачке, после которых она пишется не дожидаясь интервала
+INGEST_ASGI_FLUSH_SIZE = int(os.environ.get('INGEST_ASGI_FLUSH_SIZE', 500))
+# Сколько ждать остальных сообщений пачки (секунды)
+INGEST_ASGI_FLUSH_INTERVAL = float(os.environ.get('INGEST_ASGI_FLUSH_INTERVAL', 0.05))
+# Сколько пачек может записываться одновременно
+INGEST_ASGI_CONCURRENCY = int(os.environ.get('INGEST_ASGI_CONCURRENCY', 4))
+# Сообщений, ожидающих записи; сверх этого запросы получают 429
+INGEST_ASGI_PENDING_MAX = int(os.environ.get('INGEST_ASGI_PENDING_MAX', 20000))
+
+
+class IngestBusy(Exception):
+    """Ожидающих записи сообщений больше INGEST_ASGI_PENDING_MAX."""
+
+
+class SupabaseAsyncWriter:
+    """Запись пачки в Supabase через PostgREST на httpx.AsyncClient (пул keep-alive соединений, HTTP/2)."""
+
+    def __init__(self, url=SUPABASE_URL, key=SUPABASE_KEY):
+        self.client = httpx.AsyncClient(
+            base_url=f'{url.rstrip("/")}/rest/v1',
+            headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+            http2=SUPABASE_HTTP2,
+            limits=httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_KEEPALIVE),
+            timeout=httpx.Timeout(SUPABASE_READ_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT, pool=SUPABASE_POOL_TIMEOUT),
+        )
+
+    async def write(self, robots, records):
+        """
+        Как record_telemetry: сначала сканирования и их агрегаты, затем роботы.
+        Ошибка роботов после записанных сканирований не отменяет их (см. _after_insert).
+        """
+        robot_data = robot_rows(robots)
+        rows = inventory_rows(records)
+        inserted = []
+        if rows:
+            r = await self.client.post('/inventory_history', json=rows, headers={'Prefer': 'return=representation'})
+            r.raise_for_status()
+            inserted = r.json()
+        if ROLLUPS_ENABLED and inserted:
+            # Как _merge_rollups: ошибка агрегатов не отменяет записанные сканирования
+            try:
+                r = await self.client.post('/rpc/merge_inventory_rollups', json={'rows': rollup_rows(inserted)})
+                r.raise_for_status()
+            except httpx.HTTPError as e:
+                report_error('ingest_asgi.rollups', 'Агрегаты не записаны, нужна пересборка inventory_rollups')
+                await self._mark_rollups_stale(str(e))
+        if robot_data:
+            with _after_insert(inserted):
+                r = await self.client.post('/robots', params={'on_conflict': 'id'}, json=robot_data,
+                                           headers={'Prefer': 'resolution=merge-duplicates,return=minimal'})
+                r.raise_for_status()
+        return robot_data, inserted
+
+    async def _mark_rollups_stale(self, error):
+        """Отметка в app_state, как mark_rollups_stale: дашборды и прогнозы перестают верить агрегатам."""
+        try:
+            r = await self.client.post(
+                '/app_state', params={'on_conflict': 'key'},
+                json={'key': ROLLUPS_STALE_KEY, 'value': rollups_stale_marker(error),
+                      'updated_at': datetime.utcnow().isoformat()},
+                headers={'Prefer': 'resolution=merge-duplicates,return=minimal'},
+            )
+            r.raise_for_status()
+        except httpx.HTTPError:
+            report_error('ingest_asgi.mark_stale', 'Не удалось отметить агрегаты устаревшими')
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ThreadWriter:
+    """Запись пачки синхронными database.models в пуле потоков (хранилища без асинхронного клиента)."""
+
+    async def write(self, robots, records):
+        return await asyncio.to_thread(self._write, robots, records)
+
+    @staticmethod
+    def _write(robots, records):
+        return record_telemetry(robots, records)
+
+    async def aclose(self):
+        pass
+
+
+@contextmanager
+def _after_insert(inserted):
+    """
+    Запись роботов после сканирований, как в record_telemetry: если сканирования уже записаны,
+    ошибка роботов только логируется — иначе запрос получил бы ошибку, и повтор робота
+    задублировал бы историю. Состояние робота обновит его следующее сообщение.
+    """
+    try:
+        yield
+    except Exception:
+        if not inserted:
+            raise
+        report_error('ingest_asgi.robots', 'Состояние роботов не записано, сканирования пачки записаны')
+
+
+def make_writer():
+    return SupabaseAsyncWriter() if STORAGE_BACKEND == 'supabase' else ThreadWriter()
+
+
+class IngestBatcher:
+    """Собирает сообщения запросов в пачки и пишет их writer-ом, не более concurrency пачек сразу."""
+
+    def __init__(self, writer, flush_size=INGEST_ASGI_FLUSH_SIZE, flush_interval=INGEST_ASGI_FLUSH_INTERVAL,
+                 concurrency=INGEST_ASGI_CONCURRENCY, max_pending=INGEST_ASGI_PENDING_MAX):
+        self.writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []  # (robots, records, future)
+        self._pending_messages = 0
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._flushes = set()
+        self._task = None
+        self.stats = {'messages': 0, 'records': 0, 'batches': 0, 'errors': 0, 'rejected': 0,
+                      'last_batch_ms': None, 'last_error': None}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, robots, records):
+        """Добавляет сообщения в пачку и ждёт её записи. IngestBusy — очередь переполнена."""
+        if self._pending_messages + len(robots) > self.max_pending:
+            self.stats['rejected'] += len(robots)
+            raise IngestBusy()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((robots, records, future))
+        self._pending_messages += len(robots)
+        self._has_items.set()
+        if self._pending_messages >= self.flush_size:
+            self._full.set()
+        await future
+
+    def pending(self):
+        return self._pending_messages
+
+    async def close(self):
+        """Останавливает сборку пачек и дописывает всё, что уже принято."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await self._slots.acquire()
+            await self._flush(self._take())
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.writer.aclose()
+
+    async def _run(self):
+        while True:
+            await self._has_items.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self._slots.acquire()
+            batch = self._take()
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.get_running_loop().create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    def _take(self):
+        batch, self._pending, self._pending_messages = self._pending, [], 0
+        self._has_items.clear()
+        self._full.clear()
+        return batch
+
+    async def _flush(self, batch):
+        """Пишет пачку (слот self._slots уже занят) и отдаёт результат ожидающим запросам."""
+        t0 = time.perf_counter()
+        try:
+            await self._write_isolating(batch)
+        finally:
+            self.stats['last_batch_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+            self._slots.release()
+
+    async def _write_isolating(self, batch):
+        """
+        Пишет часть пачки. Если хранилище отклонило данные, пишет половины по отдельности, и ошибку
+        получают только запросы с отклонёнными сообщениями. Временные ошибки (соединение, 5xx)
+        получают все запросы части: делением их не обойти.
+        """
+        robots = [robot for robot_list, _, _ in batch for robot in robot_list]
+        records = [rec for _, record_list, _ in batch for rec in record_list]
+        try:
+            await self.writer.write(robots, records)
+        except Exception as e:
+            if len(batch) > 1 and is_data_error(e):
+                middle = len(batch) // 2
+                await self._write_isolating(batch[:middle])
+                await self._write_isolating(batch[middle:])
+                return
+            self.stats['errors'] += 1
+            self.stats['last_error'] = str(e) or e.__class__.__name__
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.stats['messages'] += len(robots)
+            self.stats['records'] += len(records)
+            self.stats['batches'] += 1
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
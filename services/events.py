@@ -0,0 +1,126 @@
+"""
+Рассылка изменений склада подключённым дашбордам (Server-Sent Events).
+API приёма данных публикует новые состояния роботов и записи inventory_history,
+каждый открытый поток /dashboard/stream получает только новые события.
+Рассылка работает внутри процесса: у каждого воркера gunicorn свой broadcaster и свои потоки.
+Записи, принятые другим воркером или ingest_asgi.py, воркер получает через догонялку
+services/ingest_tail.py (LIVE_TAIL_INTERVAL > 0), которая публикует их здесь же.
+Остатки товаров пересчитываются фоновым потоком, а не в запросе робота.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from database.models import recompute_products_quantities_and_status
+from services.metrics import report_error
+
+# Сколько событий может ждать отправки одному клиенту; медленный клиент отключается
+SUBSCRIBER_QUEUE_SIZE = 256
+# Как часто пересчитывать остатки товаров для открытых потоков (секунды)
+STOCK_REFRESH_INTERVAL = 2.0
+# Одновременных потоков /dashboard/stream на процесс: каждый занимает поток gunicorn (gthread),
+# остальные потоки остаются приёму данных роботов. По умолчанию — половина GUNICORN_THREADS
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', max(1, int(os.environ.get('GUNICORN_THREADS', 32)) // 2)))
+
+
+class Broadcaster:
+    """Раздаёт события всем подписчикам через ограниченные очереди."""
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, limit=None):
+        """Очередь нового подписчика или None, если подписчиков уже limit."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def publish(self, event, data):
+        """Отправляет событие всем подписчикам. Переполненная очередь получает (None, None) — сигнал переподключиться."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                    q.put_nowait((None, None))
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+broadcaster = Broadcaster()
+
+def sse_format(event, data):
+    """Сообщение в формате text/event-stream."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def publish_ingested(robots, inventory_rows):
+    """
+    Публикует результат записи данных роботов: состояния роботов и новые строки inventory_history;
+    пересчёт остатков товаров поручается фоновому потоку (не чаще раза в STOCK_REFRESH_INTERVAL),
+    поэтому запрос робота не ждёт хранилище. Без открытых потоков ничего не делает.
+    """
+    if not broadcaster.has_subscribers():
+        return
+    if robots:
+        broadcaster.publish('robots', robots)
+    if inventory_rows:
+        broadcaster.publish('inventory', inventory_rows)
+        request_stock_refresh()
+
+
+def request_stock_refresh():
+    """Просит фоновый поток пересчитать остатки товаров (не чаще раза в STOCK_REFRESH_INTERVAL)."""
+    _stock_refresher().set()
+
+
+_refresh_wanted = None
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def _stock_refresher():
+    """Событие «остатки устарели» фонового потока пересчёта (поток один на процесс, создаётся после fork)."""
+    global _refresh_wanted, _refresher_pid
+    if _refresher_pid == os.getpid():
+        return _refresh_wanted
+    with _refresher_lock:
+        if _refresher_pid != os.getpid():
+            _refresh_wanted = threading.Event()
+            threading.Thread(target=_refresh_stock, args=(_refresh_wanted,), name='stock-refresh', daemon=True).start()
+            _refresher_pid = os.getpid()
+        return _refresh_wanted
+
+
+def _refresh_stock(wanted):
+    """Пересчитывает остатки по запросу (новые записи, опрос дашборда) и рассылает изменившиеся товары."""
+    while True:
+        wanted.wait()
+        wanted.clear()
+        try:
+            changed = recompute_products_quantities_and_status()
+            if changed:
+                broadcaster.publish('products', changed)
+        except Exception:
+            # остатки пересчитаются после следующей записи или запроса
+            report_error('publish_ingested.recompute', 'Не удалось пересчитать остатки')
+        time.sleep(STOCK_REFRESH_INTERVAL)
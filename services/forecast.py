@@ -0,0 +1,140 @@
+"""
+Локальный статистический прогноз исчерпания запасов по рядам inventory_history.
+Все товары считаются одним векторизованным проходом NumPy:
+  - ряд товара — средний остаток на одно сканирование полки по часам;
+  - тренд — линейная регрессия с экспоненциальными весами (свежие часы важнее);
+  - скорость расхода — доля запаса, уходящая за сутки (-тренд / текущий уровень);
+  - дней до исчерпания, рекомендуемый заказ и уверенность (объём данных и шум ряда).
+"""
+import math
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database.stock import IDEAL_QUANTITY
+
+# Сколько дней истории брать для прогноза
+FORECAST_WINDOW_DAYS = int(os.environ.get('FORECAST_WINDOW_DAYS', 14))
+# Период полураспада весов регрессии, часы
+FORECAST_HALFLIFE_HOURS = float(os.environ.get('FORECAST_HALFLIFE_HOURS', 72))
+# Срок поставки и период между заказами, дни
+LEAD_TIME_DAYS = float(os.environ.get('FORECAST_LEAD_TIME_DAYS', 7))
+REVIEW_DAYS = float(os.environ.get('FORECAST_REVIEW_DAYS', 14))
+# Коэффициент страхового запаса (≈95% уровень обслуживания)
+SAFETY_Z = 1.65
+# Прогноз дальше этого горизонта не имеет смысла, дни
+MAX_DAYS = 365
+# Сколько часов наблюдений нужно для уверенности ≈63%
+CONFIDENCE_HOURS = 24.0
+
+
+def forecast_window_start(now=None):
+    """Начало окна истории для прогноза (строка ISO, сравнима со scanned_at)."""
+    now = now or datetime.utcnow()
+    return (now - timedelta(days=FORECAST_WINDOW_DAYS)).strftime('%Y-%m-%dT%H')
+
+
+def build_series(hourly_rows, product_ids):
+    """
+    Матрица рядов (товары × часы): средний остаток на сканирование, NaN — нет данных.
+    hourly_rows — строки get_hourly_inventory. Возвращает (matrix, hours).
+    """
+    index = {pid: i for i, pid in enumerate(product_ids)}
+    rows = [r for r in hourly_rows if r.get('product_id') in index and r.get('scans')]
+    if not rows:
+        return np.full((len(product_ids), 0), np.nan), np.zeros(0)
+    # Разбираем только уникальные часы: строк много, часов в окне — сотни
+    keys = [str(r['bucket'])[:13] for r in rows]
+    unique = sorted(set(keys))
+    parsed = np.array(unique, dtype='datetime64[h]')
+    offsets = (parsed - parsed[0]).astype(np.int64)
+    column = dict(zip(unique, offsets.tolist()))
+    matrix = np.full((len(product_ids), int(offsets[-1]) + 1), np.nan)
+    quantity = np.fromiter((float(r['quantity'] or 0) for r in rows), dtype=float, count=len(rows))
+    scans = np.fromiter((float(r['scans']) for r in rows), dtype=float, count=len(rows))
+    matrix[[index[r['product_id']] for r in rows], [column[k] for k in keys]] = quantity / scans
+    return matrix, np.arange(matrix.shape[1], dtype=float)
+
+
+def forecast(stock, matrix, hours, ideal_quantity=IDEAL_QUANTITY):
+    """
+    Прогноз по всем товарам сразу.
+    stock — текущие остатки (products.quantity), matrix/hours — из build_series.
+    Возвращает словарь массивов: days_until_stockout (NaN — нет расхода), recommended_order,
+    confidence, daily_consumption.
+    """
+    stock = np.asarray(stock, dtype=float)
+    n_products, n_hours = matrix.shape
+    observed = ~np.isnan(matrix)
+    y = np.where(observed, matrix, 0.0)
+
+    if n_hours:
+        age = hours[-1] - hours
+        weights = np.where(observed, np.exp(-age * math.log(2) / FORECAST_HALFLIFE_HOURS), 0.0)
+    else:
+        weights = np.zeros_like(y)
+    sw = weights.sum(axis=1)
+    has_data = sw > 0
+    safe_sw = np.where(has_data, sw, 1.0)
+
+    x_mean = (weights * hours).sum(axis=1) / safe_sw
+    y_mean = (weights * y).sum(axis=1) / safe_sw
+    dx = hours[None, :] - x_mean[:, None]
+    dy = y - y_mean[:, None]
+    sxx = (weights * dx * dx).sum(axis=1)
+    slope = np.where(sxx > 0, (weights * dx * dy).sum(axis=1) / np.where(sxx > 0, sxx, 1.0), 0.0)
+    last_hour = hours[-1] if n_hours else 0.0
+    level = y_mean + slope * (last_hour - x_mean)
+    resid = np.where(observed, dy - slope[:, None] * dx, 0.0)
+    sigma = np.sqrt((weights * resid * resid).sum(axis=1) / safe_sw)
+
+    safe_level = np.where(level > 0, level, 1.0)
+    rate = np.where(has_data & (level > 0), np.clip(-slope * 24 / safe_level, 0.0, None), 0.0)
+    daily = rate * np.clip(stock, 0.0, None)
+    with np.errstate(divide='ignore'):
+        days = np.where(stock <= 0, 0.0, np.where(rate > 0, np.minimum(1.0 / np.where(rate > 0, rate, 1.0), MAX_DAYS), np.nan))
+
+    noise = np.where(has_data, sigma / safe_level, 1.0)
+    safety = SAFETY_Z * noise * daily * math.sqrt(LEAD_TIME_DAYS)
+    target = np.maximum(float(ideal_quantity), daily * (LEAD_TIME_DAYS + REVIEW_DAYS) + safety)
+    order = np.ceil(np.clip(target - stock, 0.0, None))
+
+    n_obs = observed.sum(axis=1)
+    confidence = (1 - np.exp(-n_obs / CONFIDENCE_HOURS)) / (1 + noise)
+    confidence = np.clip(np.where(has_data, confidence, 0.1), 0.05, 0.99)
+
+    return {
+        'days_until_stockout': days,
+        'recommended_order': order,
+        'confidence': np.round(confidence, 2),
+        'daily_consumption': daily,
+    }
+
+
+def forecast_products(products, hourly_rows, ideal_quantity=IDEAL_QUANTITY):
+    """
+    Прогнозы для строк products по рядам get_hourly_inventory.
+    Возвращает список {'product_id', 'days_until_stockout', 'recommended_order', 'confidence'}.
+    """
+    product_ids = []
+    stock = []
+    for p in products:
+        pid = p.get('id') or p.get('product_id')
+        if pid:
+            product_ids.append(pid)
+            stock.append(float(p.get('quantity') or 0))
+    if not product_ids:
+        return []
+    matrix, hours = build_series(hourly_rows, product_ids)
+    result = forecast(stock, matrix, hours, ideal_quantity)
+    forecasts = []
+    for i, pid in enumerate(product_ids):
+        days = result['days_until_stockout'][i]
+        forecasts.append({
+            'product_id': pid,
+            'days_until_stockout': None if np.isnan(days) else int(round(days)),
+            'recommended_order': int(result['recommended_order'][i]),
+            'confidence': float(result['confidence'][i]),
+        })
+    return forecasts
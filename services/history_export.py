@@ -0,0 +1,50 @@
+"""
+Потоковая выгрузка inventory_history в CSV или JSONL (/dashboard/data/history/export).
+Строки читаются из хранилища пачками по HISTORY_EXPORT_CHUNK (database.models.iter_inventory_history)
+и сразу отдаются клиенту: память не зависит от размера выгрузки, первые байты уходят после первой пачки.
+"""
+import csv
+import io
+import json
+import os
+
+from database.models import iter_inventory_history
+
+# Строк в одном запросе к хранилищу (в Supabase не больше max-rows PostgREST, по умолчанию 1000)
+HISTORY_EXPORT_CHUNK = int(os.environ.get('HISTORY_EXPORT_CHUNK', 1000))
+
+COLUMNS = ('id', 'robot_id', 'product_id', 'quantity', 'zone', 'row_number', 'shelf_number', 'status',
+           'scanned_at', 'created_at')
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def export_history(fmt, chunk_size=HISTORY_EXPORT_CHUNK, **filters):
+    """Генератор кусков текста выгрузки: по одному на пачку строк хранилища."""
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown export format: {fmt}')
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS, extrasaction='ignore') if fmt == 'csv' else None
+    if writer is not None:
+        writer.writeheader()
+    count = 0
+    for row in iter_inventory_history(chunk_size, **filters):
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        count += 1
+        if count % chunk_size == 0:
+            yield _drain(buffer)
+    chunk = _drain(buffer)
+    if chunk:
+        yield chunk
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
@@ -0,0 +1,139 @@
+"""
+HTTP-клиенты процесса: Supabase (httpx) и внешние ИИ-API (requests.Session).
+Клиенты создаются в каждом процессе заново (после fork воркера gunicorn) и держат
+keep-alive соединения между запросами. Размер пула, тайм-ауты и повторы задаются
+переменными окружения; ожидание свободного соединения ограничено *_POOL_TIMEOUT,
+поэтому один медленный запрос не подвешивает остальные потоки воркера.
+requests импортируется при первом обращении к ИИ-API.
+"""
+import importlib.util
+import os
+import threading
+import time
+
+import httpx
+
+from services.metrics import metrics
+
+# Supabase (PostgREST): соединений в пуле — по умолчанию по числу потоков gunicorn
+SUPABASE_POOL_SIZE = int(os.environ.get('SUPABASE_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 32)))
+SUPABASE_KEEPALIVE = int(os.environ.get('SUPABASE_KEEPALIVE', 16))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_KEEPALIVE_EXPIRY', 30))
+SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', '1') == '1' and importlib.util.find_spec('h2') is not None
+SUPABASE_CONNECT_TIMEOUT = float(os.environ.get('SUPABASE_CONNECT_TIMEOUT', 5))
+SUPABASE_READ_TIMEOUT = float(os.environ.get('SUPABASE_READ_TIMEOUT', 30))
+SUPABASE_POOL_TIMEOUT = float(os.environ.get('SUPABASE_POOL_TIMEOUT', 5))
+SUPABASE_RETRIES = int(os.environ.get('SUPABASE_RETRIES', 2))
+
+# ИИ-API (Groq, DeepSeek)
+AI_POOL_SIZE = int(os.environ.get('AI_POOL_SIZE', 4))
+AI_CONNECT_TIMEOUT = float(os.environ.get('AI_CONNECT_TIMEOUT', 5))
+AI_READ_TIMEOUT = float(os.environ.get('AI_READ_TIMEOUT', 60))
+AI_RETRIES = int(os.environ.get('AI_RETRIES', 2))
+AI_TIMEOUT = (AI_CONNECT_TIMEOUT, AI_READ_TIMEOUT)
+
+# Пауза перед повтором: HTTP_BACKOFF * 2^(номер попытки), секунды
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', 0.3))
+
+# Запросы, которые можно повторить после отправки; POST/PATCH (вставки, RPC) — нет
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# 503 и 520 на GET/HEAD повторяет сам postgrest (send_with_retry, с 2.29): второй слой
+# повторов здесь умножил бы число запросов и паузы
+RETRY_STATUSES = frozenset({502, 504})
+
+
+class RetryTransport(httpx.HTTPTransport):
+    """
+    Повторы с экспоненциальной паузой. Ошибка соединения — для любых запросов (запрос не ушёл);
+    тайм-аут чтения, обрыв и ответы 502/504 — только для GET/HEAD, чтобы не задублировать запись.
+    Ожидание соединения из пула (PoolTimeout) не повторяется.
+    """
+
+    def __init__(self, retries=SUPABASE_RETRIES, backoff=HTTP_BACKOFF, **kwargs):
+        super().__init__(**kwargs)
+        self.retries = retries
+        self.backoff = backoff
+
+    def handle_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = super().handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.retries:
+                    raise
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError):
+                if attempt >= self.retries or request.method not in IDEMPOTENT_METHODS:
+                    raise
+            else:
+                if (response.status_code not in RETRY_STATUSES or request.method not in IDEMPOTENT_METHODS
+                        or attempt >= self.retries):
+                    return response
+                response.close()
+            _count_retry('supabase')
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+
+def supabase_http_client():
+    """httpx-клиент для Supabase: пул keep-alive соединений, HTTP/2, ограниченные тайм-ауты и повторы."""
+    limits = httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_KEEPALIVE,
+        keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+    )
+    return httpx.Client(
+        transport=RetryTransport(http2=SUPABASE_HTTP2, limits=limits),
+        timeout=httpx.Timeout(SUPABASE_READ_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT, pool=SUPABASE_POOL_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+_ai_session = None
+_ai_session_pid = None
+_ai_lock = threading.Lock()
+
+
+def ai_session():
+    """requests.Session для ИИ-API текущего процесса (keep-alive, повтор на 429/5xx с паузой)."""
+    global _ai_session, _ai_session_pid
+    with _ai_lock:
+        if _ai_session is None or _ai_session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            class _AIRetry(Retry):
+                def increment(self, *args, **kwargs):
+                    _count_retry('ai')
+                    return super().increment(*args, **kwargs)
+
+            # read=0: тайм-аут чтения POST значит, что запрос уже мог выполниться — не повторяем
+            retry = _AIRetry(
+                total=AI_RETRIES, read=0, backoff_factor=HTTP_BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset({'POST'}),
+                respect_retry_after_header=True, raise_on_status=False,
+            )
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=AI_POOL_SIZE, max_retries=retry))
+            _ai_session = session
+            _ai_session_pid = os.getpid()
+        return _ai_session
+
+
+def _count_retry(target):
+    metrics.record_error(f'{target}.retry')
+
+
+def status():
+    """Настройки клиентов (для /readyz)."""
+    return {
+        'pid': os.getpid(),
+        'supabase': {
+            'pool_size': SUPABASE_POOL_SIZE, 'keepalive': SUPABASE_KEEPALIVE, 'http2': SUPABASE_HTTP2,
+            'timeouts': {'connect': SUPABASE_CONNECT_TIMEOUT, 'read': SUPABASE_READ_TIMEOUT, 'pool': SUPABASE_POOL_TIMEOUT},
+            'retries': SUPABASE_RETRIES,
+        },
+        'ai': {'pool_size': AI_POOL_SIZE, 'timeouts': {'connect': AI_CONNECT_TIMEOUT, 'read': AI_READ_TIMEOUT},
+               'retries': AI_RETRIES, 'session': _ai_session is not None and _ai_session_pid == os.getpid()},
+    }
@@ -0,0 +1,286 @@
+"""
+Очередь отложенной записи (write-behind) для телеметрии роботов.
+API кладёт разобранное сообщение в очередь и сразу отвечает роботу,
+фоновый поток пачками пишет данные в Supabase:
+  - записи inventory_history — одним multi-row insert на пачку;
+  - upsert_robot — одним upsert, для каждого робота только последнее состояние.
+Каждое принятое сообщение дописывается в spool-файл на диске, поэтому
+подтверждённые данные переживают перезапуск воркера: при старте очередь
+подхватывает spool-файлы завершившихся процессов. Сообщение, которое хранилище
+отклоняет (не временная ошибка), не держит очередь: оно уходит в dead-letter spool.
+"""
+import atexit
+import glob
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки spool-файлов недоступны
+    fcntl = None
+
+from database.backends.base import is_data_error
+from database.models import record_telemetry
+from services.events import publish_ingested
+from services.metrics import report_error
+
+INGEST_QUEUE_ENABLED = os.environ.get('INGEST_QUEUE', '0') == '1'
+INGEST_QUEUE_MAX = int(os.environ.get('INGEST_QUEUE_MAX', 10000))
+INGEST_FLUSH_SIZE = int(os.environ.get('INGEST_FLUSH_SIZE', 500))
+INGEST_FLUSH_INTERVAL = float(os.environ.get('INGEST_FLUSH_INTERVAL', 1.0))
+INGEST_SPOOL_DIR = os.environ.get('INGEST_SPOOL_DIR') or os.path.join(tempfile.gettempdir(), 'rostelekom-ingest')
+INGEST_SPOOL_FSYNC = os.environ.get('INGEST_SPOOL_FSYNC', '0') == '1'
+
+# Пауза после неудачной записи растёт до этого значения (секунды)
+MAX_RETRY_DELAY = 30.0
+# Spool-файл переписывается, когда вырастает больше этого размера (байты)
+SPOOL_COMPACT_BYTES = 16 * 1024 * 1024
+# Сообщения, которые хранилище отклонило (JSONL в INGEST_SPOOL_DIR, общий для воркеров)
+DEAD_LETTER_FILE = 'ingest-dead-letter.jsonl'
+
+
+class IngestQueue:
+    """Ограниченная очередь сообщений роботов с фоновой пакетной записью."""
+
+    def __init__(self, max_messages=INGEST_QUEUE_MAX, flush_size=INGEST_FLUSH_SIZE,
+                 flush_interval=INGEST_FLUSH_INTERVAL, spool_dir=INGEST_SPOOL_DIR):
+        self.max_messages = max_messages
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self._pending = deque()  # (seq, robot, records)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._spool = None
+        self._thread = None
+        self._stopped = False
+        self.stats = {'accepted': 0, 'rejected': 0, 'flushed': 0, 'flush_errors': 0, 'dead_lettered': 0,
+                      'last_error': None}
+
+    def start(self):
+        """Открывает spool-файл, подхватывает сиротские spool-файлы и запускает фоновый поток."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'ingest-{os.getpid()}.spool')
+        self._spool = open(path, 'a+', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(self._spool.fileno(), fcntl.LOCK_EX)
+        self._recover_orphans()
+        self._thread = threading.Thread(target=self._run, name='ingest-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(self, robot, records):
+        """
+        Ставит сообщение в очередь и записывает его в spool.
+        Возвращает False, если очередь заполнена (клиенту нужно ответить 429).
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_messages:
+                self.stats['rejected'] += 1
+                return False
+            self._enqueue_locked(robot, records)
+            self.stats['accepted'] += 1
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify()
+        return True
+
+    def size(self):
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Записывает в базу все сообщения, накопленные на момент вызова. Бросает исключение при
+        временной ошибке хранилища. Если хранилище отклоняет данные, пачка делится пополам,
+        пока отклонённое сообщение не останется одно: оно уходит в dead-letter spool,
+        остальные записываются.
+        """
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = list(itertools.islice(self._pending, self.flush_size))
+                if not batch:
+                    return
+                self._write_isolating(batch)
+
+    def stop(self):
+        """Останавливает фоновый поток и пытается дописать остаток очереди."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        try:
+            self.flush()
+        except Exception:
+            # останется в spool и будет подхвачено следующим процессом
+            report_error('ingest_queue.stop', 'Не удалось дописать очередь при остановке')
+
+    def _run(self):
+        delay = self.flush_interval
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._pending) < self.flush_size:
+                    self._cond.wait(timeout=delay)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+                delay = self.flush_interval
+            except Exception as e:
+                self.stats['flush_errors'] += 1
+                self.stats['last_error'] = str(e)
+                delay = min(max(delay, self.flush_interval) * 2, MAX_RETRY_DELAY)
+                time.sleep(delay)
+
+    def _write_isolating(self, batch):
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            if not is_data_error(e):
+                raise
+            if len(batch) == 1:
+                self._dead_letter(batch[0], e)
+                self._done(batch)
+                return
+            middle = len(batch) // 2
+            self._write_isolating(batch[:middle])
+            self._write_isolating(batch[middle:])
+            return
+        self._done(batch)
+        self.stats['flushed'] += len(batch)
+
+    def _write_batch(self, batch):
+        robots = [robot for _, robot, _ in batch]  # robot_rows оставит последнее состояние робота
+        records = [rec for _, _, recs in batch for rec in recs]
+        written_robots, inserted = record_telemetry(robots, records)
+        publish_ingested(written_robots, inserted)
+
+    def _done(self, batch):
+        """Снимает с головы очереди записанные (или отложенные в dead-letter) сообщения пачки."""
+        with self._cond:
+            for _ in batch:
+                self._pending.popleft()
+            self._ack_locked(batch[-1][0])
+
+    def _dead_letter(self, item, error):
+        """Сообщение, которое хранилище отклоняет, дописывается в dead-letter spool и больше не повторяется."""
+        seq, robot, records = item
+        entry = {
+            'robot': robot, 'records': records, 'error': str(error) or error.__class__.__name__,
+            'failed_at': datetime.now(timezone.utc).isoformat(), 'pid': os.getpid(),
+        }
+        with open(os.path.join(self.spool_dir, DEAD_LETTER_FILE), 'a', encoding='utf-8') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.stats['dead_lettered'] += 1
+        self.stats['last_error'] = entry['error']
+        report_error('ingest_queue.dead_letter', f'Сообщение робота {robot.get("robot_id")} отклонено хранилищем')
+
+    # --- spool ---
+
+    def _enqueue_locked(self, robot, records):
+        self._seq += 1
+        self._pending.append((self._seq, robot, records))
+        self._spool_write({'seq': self._seq, 'robot': robot, 'records': records})
+
+    def _ack_locked(self, seq):
+        if not self._pending:
+            self._spool.seek(0)
+            self._spool.truncate()
+            self._spool_sync()
+        elif self._spool.tell() > SPOOL_COMPACT_BYTES:
+            self._spool.seek(0)
+            self._spool.truncate()
+            for pending_seq, robot, records in self._pending:
+                self._spool_write({'seq': pending_seq, 'robot': robot, 'records': records})
+        else:
+            self._spool_write({'ack': seq})
+
+    def _spool_write(self, entry):
+        self._spool.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._spool_sync()
+
+    def _spool_sync(self):
+        self._spool.flush()
+        if INGEST_SPOOL_FSYNC:
+            os.fsync(self._spool.fileno())
+
+    def _recover_orphans(self):
+        """Переносит в свою очередь неподтверждённые сообщения из spool-файлов завершившихся процессов."""
+        own = os.path.abspath(self._spool.name)
+        self._load_spool(self._spool)  # свой файл с тем же pid — после перезапуска в контейнере
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, 'ingest-*.spool'))):
+            if os.path.abspath(path) == own:
+                continue
+            try:
+                f = open(path, 'r+', encoding='utf-8')
+            except OSError:
+                continue
+            with f:
+                if not self._claim(f, path):
+                    continue
+                self._load_spool(f)
+                f.truncate(0)
+                os.remove(path)
+
+    def _claim(self, f, path):
+        if fcntl is None:
+            try:
+                pid = int(os.path.basename(path)[len('ingest-'):-len('.spool')])
+                os.kill(pid, 0)
+                return False  # процесс жив
+            except (ValueError, OSError):
+                return True
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False  # файл держит живой воркер
+        try:
+            # Файл мог быть уже подхвачен и удалён другим воркером
+            return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+        except OSError:
+            return False
+
+    def _load_spool(self, f):
+        f.seek(0)
+        entries = []
+        acked = 0
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # недописанная строка при аварийном завершении
+            if 'ack' in entry:
+                acked = max(acked, entry['ack'])
+            else:
+                entries.append(entry)
+        if f is self._spool:
+            f.seek(0)
+            f.truncate()
+        with self._cond:
+            for entry in entries:
+                if entry['seq'] > acked:
+                    self._enqueue_locked(entry['robot'], entry['records'])
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue():
+    """Очередь текущего процесса; создаётся при первом обращении (после fork воркера gunicorn)."""
+    global _queue, _queue_pid
+    with _queue_lock:
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = IngestQueue()
+            _queue_pid = os.getpid()
+            _queue.start()
+        return _queue
@@ -0,0 +1,111 @@
+"""
+Догонялка живого состояния, когда данные роботов пишет другой процесс (ingest_asgi.py или
+соседний воркер gunicorn): раз в LIVE_TAIL_INTERVAL секунд читает новые строки inventory_history
+по id, применяет их и состояние роботов из этих строк к живому состоянию процесса и публикует события потокам
+/dashboard/stream. Как StockAggregator, каждый раз перечитывает последние LIVE_TAIL_OVERLAP id:
+строка, закоммиченная позже строки с большим id, не теряется. Строки, которые процесс записал
+и опубликовал сам (live_state.take_applied), повторно не публикуются.
+"""
+import os
+import threading
+
+from database.cache import merge_rows, robots_cache
+from database.connection import get_backend
+from database.live_state import live_state
+from services.events import publish_ingested
+from services.metrics import report_error
+
+# Как часто читать новые записи (секунды); 0 — выключено (данные роботов пишет этот процесс)
+LIVE_TAIL_INTERVAL = float(os.environ.get('LIVE_TAIL_INTERVAL', 0))
+# Строк за один запрос
+LIVE_TAIL_PAGE = 1000
+# Сколько последних id перечитывать повторно (строки, закоммиченные не по порядку id)
+LIVE_TAIL_OVERLAP = int(os.environ.get('LIVE_TAIL_OVERLAP', 200))
+
+
+class LiveTail:
+    """Курсор по inventory_history.id с окном перекрытия и id уже применённых строк в этом окне."""
+
+    def __init__(self, cursor, overlap=LIVE_TAIL_OVERLAP):
+        self.cursor = cursor
+        self.overlap = overlap
+        self._seen = set()
+        live_state.track_applied()
+
+    @classmethod
+    def start(cls, backend, overlap=LIVE_TAIL_OVERLAP):
+        """Курсор на последней записи; строки окна перекрытия уже в загруженном живом состоянии."""
+        latest = backend.recent_inventory(1)
+        tail = cls(latest[0]['id'] if latest else 0, overlap)
+        live_state.ensure_loaded(backend)
+        tail._seen = {row['id'] for row in backend.inventory_after_id(max(tail.cursor - overlap, 0), overlap)
+                      if row['id'] <= tail.cursor}
+        return tail
+
+    def poll(self):
+        """Применяет и публикует строки, которых процесс ещё не видел; возвращает их."""
+        backend = get_backend()
+        start = max(self.cursor - self.overlap, 0)
+        rows = []
+        while True:
+            page = backend.inventory_after_id(start, LIVE_TAIL_PAGE, full=True)
+            rows.extend(page)
+            if len(page) < LIVE_TAIL_PAGE:
+                break
+            start = page[-1]['id']
+        # Свои строки процесс уже применил и опубликовал при записи
+        self._seen |= live_state.take_applied()
+        fresh = []
+        for row in rows:
+            if row['id'] in self._seen:
+                continue
+            self._seen.add(row['id'])
+            fresh.append(row)
+        if rows:
+            self.cursor = max(self.cursor, rows[-1]['id'])
+        floor = self.cursor - self.overlap
+        self._seen = {rid for rid in self._seen if rid > floor}
+        if fresh:
+            # Только роботы из новых строк; запись кэша дополняется, а не сбрасывается
+            robots = backend.list_robots(sorted({row['robot_id'] for row in fresh if row.get('robot_id')}))
+            robots_cache.update('all', lambda rows: merge_rows(rows, robots))
+            live_state.apply_robots(robots)
+            live_state.apply_inventory(fresh)
+            publish_ingested(robots, fresh)
+        return fresh
+
+
+_tail = None
+_tail_pid = None
+_tail_lock = threading.Lock()
+
+
+def start_tail(interval=None):
+    """Запускает догонялку в фоновом потоке процесса (при интервале 0 — ничего)."""
+    global _tail, _tail_pid
+    interval = LIVE_TAIL_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    with _tail_lock:
+        if _tail is None or _tail_pid != os.getpid():
+            _tail = threading.Thread(target=_run_tail, args=(interval,), name='live-tail', daemon=True)
+            _tail_pid = os.getpid()
+            _tail.start()
+        return _tail
+
+
+def _run_tail(interval):
+    stop = threading.Event()
+    tail = None
+    while tail is None:
+        try:
+            tail = LiveTail.start(get_backend())
+        except Exception:
+            report_error('live_tail.start', 'Не удалось прочитать последнюю запись истории')
+            if stop.wait(interval):
+                return
+    while not stop.wait(interval):
+        try:
+            tail.poll()
+        except Exception:
+            report_error('live_tail', 'Не удалось прочитать новые записи истории')
@@ -0,0 +1,129 @@
+"""
+Фоновые задачи (формирование прогнозов и т.п.) в пуле потоков.
+Роут ставит задачу и сразу отвечает; статус задачи опрашивается по её id,
+а по завершении всем открытым потокам /dashboard/stream уходит событие job.
+Одинаковые задачи (один key) не запускаются параллельно: повторный запрос
+получает уже идущую задачу. Последние JOBS_HISTORY задач хранятся в памяти процесса.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.events import broadcaster
+
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_HISTORY = int(os.environ.get('JOBS_HISTORY', 50))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class JobRunner:
+    """Пул потоков с id задач, статусами, дедупликацией по key и историей завершённых задач."""
+
+    def __init__(self, max_workers=JOBS_WORKERS, history=JOBS_HISTORY):
+        self.history_size = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()  # id -> задача, от старых к новым
+        self._active = {}  # key -> id незавершённой задачи
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, key=None, requested_by=None):
+        """
+        Ставит func(*args) в очередь. Возвращает (job, created):
+        если задача с тем же key ещё не завершилась, возвращает её и created=False.
+        """
+        key = key or kind
+        with self._lock:
+            active_id = self._active.get(key)
+            if active_id in self._jobs:
+                return dict(self._jobs[active_id]), False
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'kind': kind,
+                'status': QUEUED,
+                'requested_by': requested_by,
+                'created_at': _now(),
+                'started_at': None,
+                'finished_at': None,
+                'duration_ms': None,
+                'result': None,
+                'error': None,
+            }
+            self._jobs[job['id']] = job
+            self._active[key] = job['id']
+            self._trim()
+            snapshot = dict(job)
+        self._executor.submit(self._run, job['id'], key, func, args)
+        return snapshot, True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def history(self, kind=None, limit=20):
+        """Последние задачи (новые первыми), при kind — только этого вида."""
+        with self._lock:
+            jobs = [dict(j) for j in reversed(self._jobs.values()) if kind is None or j['kind'] == kind]
+        return jobs[:limit]
+
+    def _run(self, job_id, key, func, args):
+        self._update(job_id, status=RUNNING, started_at=_now())
+        t0 = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            changes = {'status': ERROR, 'error': str(e) or e.__class__.__name__}
+        else:
+            changes = {'status': DONE, 'result': result}
+        changes['finished_at'] = _now()
+        changes['duration_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        with self._lock:
+            if self._active.get(key) == job_id:
+                del self._active[key]
+        job = self._update(job_id, **changes)
+        if job:
+            broadcaster.publish('job', job)
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(changes)
+            return dict(job)
+
+    def _trim(self):
+        """Удаляет самые старые завершённые задачи сверх history_size (вызывается под блокировкой)."""
+        active = set(self._active.values())
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.history_size:
+                break
+            if job_id not in active:
+                del self._jobs[job_id]
+
+
+def _now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+_runner = None
+_runner_pid = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Пул задач текущего процесса; создаётся при первом обращении (после fork воркера gunicorn)."""
+    global _runner, _runner_pid
+    with _runner_lock:
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = JobRunner()
+            _runner_pid = os.getpid()
+        return _runner
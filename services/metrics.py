@@ -0,0 +1,339 @@
+"""
+Метрики запросов в памяти процесса, отдаются в текстовом формате Prometheus на /metrics.
+
+По каждому эндпоинту Flask: число запросов и ответов 5xx, гистограмма времени ответа,
+вызовы хранилища (методы StorageBackend) и их время, HTTP-запросы к Supabase (PostgREST)
+и их время, байты запросов и ответов. Отдельно — время каждого метода хранилища
+и число перехваченных ошибок там, где приложение продолжает работу.
+
+При SERVER_TIMING=1 каждый ответ получает заголовок Server-Timing
+(total, db, supabase) — его показывает вкладка Network в DevTools браузера.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get('METRICS', '1') == '1'
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+# Токен для /metrics (Authorization: Bearer ...); без него — только админу (адрес клиента не проверяется)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# Границы гистограммы времени ответа, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Счётчики по эндпоинтам, методам хранилища и запросам к Supabase."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.startup = {}  # шаг старта процесса -> секунды (services/startup.py; reset() не сбрасывает)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.endpoints = {}  # (endpoint, method) -> счётчики
+            self.storage = {}  # (backend, operation) -> [calls, errors, seconds]
+            self.supabase = {}  # (HTTP-метод, ресурс) -> [requests, errors, seconds, bytes]
+            self.errors = {}  # место -> число перехваченных ошибок
+            self.payloads = {}  # формат тела телеметрии -> [payloads, bytes, readings, seconds]
+
+    # --- текущий запрос ---
+
+    def begin_request(self):
+        self._local.request = {'t0': time.perf_counter(), 'db_calls': 0, 'db_seconds': 0.0,
+                               'http_calls': 0, 'http_seconds': 0.0, 'http_bytes': 0}
+
+    def current(self):
+        """Счётчики запроса, обрабатываемого в этом потоке (None вне запроса и в фоновых потоках)."""
+        return getattr(self._local, 'request', None)
+
+    def end_request(self, endpoint, method, status, request_bytes, response_bytes):
+        """Закрывает запрос потока и возвращает его счётчики с полем seconds."""
+        req = self.current()
+        if req is None:
+            return None
+        self._local.request = None
+        req['seconds'] = time.perf_counter() - req['t0']
+        with self._lock:
+            entry = self.endpoints.get((endpoint, method))
+            if entry is None:
+                entry = self.endpoints[(endpoint, method)] = {
+                    'requests': 0, 'server_errors': 0, 'seconds': 0.0, 'buckets': [0] * len(BUCKETS),
+                    'db_calls': 0, 'db_seconds': 0.0, 'http_calls': 0, 'http_seconds': 0.0,
+                    'http_bytes': 0, 'request_bytes': 0, 'response_bytes': 0,
+                }
+            entry['requests'] += 1
+            entry['server_errors'] += status >= 500
+            entry['seconds'] += req['seconds']
+            for i, bound in enumerate(BUCKETS):
+                if req['seconds'] <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            for name in ('db_calls', 'db_seconds', 'http_calls', 'http_seconds', 'http_bytes'):
+                entry[name] += req[name]
+            entry['request_bytes'] += request_bytes or 0
+            entry['response_bytes'] += response_bytes or 0
+        return req
+
+    # --- хранилище и Supabase ---
+
+    def record_storage(self, backend, operation, seconds, failed, outermost):
+        with self._lock:
+            entry = self.storage.setdefault((backend, operation), [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += seconds
+        req = self.current()
+        # Вложенные вызовы (метод хранилища через другой метод) уже учтены во внешнем
+        if req is not None and outermost:
+            req['db_calls'] += 1
+            req['db_seconds'] += seconds
+
+    def record_http(self, method, resource, seconds, failed, size):
+        with self._lock:
+            entry = self.supabase.setdefault((method, resource), [0, 0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += seconds
+            entry[3] += size
+        req = self.current()
+        if req is not None:
+            req['http_calls'] += 1
+            req['http_seconds'] += seconds
+            req['http_bytes'] += size
+
+    def record_payload(self, fmt, size, readings, seconds):
+        """Разобранное тело телеметрии роботов: формат (json, binary, +gzip), байты, сканирования, время разбора."""
+        with self._lock:
+            entry = self.payloads.setdefault(fmt, [0, 0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += size
+            entry[2] += readings
+            entry[3] += seconds
+
+    def payload_stats(self):
+        """Сводка по форматам телеметрии с байтами на сканирование и временем разбора на тело."""
+        with self._lock:
+            payloads = {fmt: list(values) for fmt, values in self.payloads.items()}
+        return {
+            fmt: {
+                'payloads': count, 'bytes': size, 'readings': readings,
+                'bytes_per_reading': round(size / readings, 1) if readings else None,
+                'decode_us_per_payload': round(seconds / count * 1e6, 1) if count else None,
+            }
+            for fmt, (count, size, readings, seconds) in payloads.items()
+        }
+
+    def record_startup(self, phase, seconds):
+        with self._lock:
+            self.startup[phase] = seconds
+
+    def record_error(self, where):
+        """Ошибка, после которой приложение продолжает работу (пишется и в лог вызывающим)."""
+        with self._lock:
+            self.errors[where] = self.errors.get(where, 0) + 1
+
+    # --- вывод ---
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            endpoints = {key: dict(value, buckets=list(value['buckets'])) for key, value in self.endpoints.items()}
+            storage = {key: list(value) for key, value in self.storage.items()}
+            supabase = {key: list(value) for key, value in self.supabase.items()}
+            errors = dict(self.errors)
+            payloads = {key: list(value) for key, value in self.payloads.items()}
+            startup = dict(self.startup)
+            started = self.started
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def sample(name, labels, value):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f'{name}{{{label_text}}} {_number(value)}' if label_text else f'{name} {_number(value)}')
+
+        family('rostelekom_process_start_time_seconds', 'gauge', 'Время запуска счётчиков (unix)')
+        sample('rostelekom_process_start_time_seconds', {}, started)
+
+        family('rostelekom_startup_seconds', 'gauge', 'Длительность шагов старта воркера (импорт, create_app, прогрев)')
+        for phase, seconds in startup.items():
+            sample('rostelekom_startup_seconds', {'phase': phase}, seconds)
+
+        family('rostelekom_http_request_duration_seconds', 'histogram', 'Время ответа по эндпоинтам')
+        for (endpoint, method), e in sorted(endpoints.items()):
+            labels = {'endpoint': endpoint, 'method': method}
+            total = 0
+            for bound, count in zip(BUCKETS, e['buckets']):
+                total += count
+                sample('rostelekom_http_request_duration_seconds_bucket', dict(labels, le=_number(bound)), total)
+            sample('rostelekom_http_request_duration_seconds_bucket', dict(labels, le='+Inf'), e['requests'])
+            sample('rostelekom_http_request_duration_seconds_sum', labels, e['seconds'])
+            sample('rostelekom_http_request_duration_seconds_count', labels, e['requests'])
+
+        per_endpoint = (
+            ('rostelekom_http_server_errors_total', 'server_errors', 'Ответы 5xx'),
+            ('rostelekom_http_storage_calls_total', 'db_calls', 'Вызовы хранилища из запросов'),
+            ('rostelekom_http_storage_seconds_total', 'db_seconds', 'Время в хранилище из запросов'),
+            ('rostelekom_http_supabase_requests_total', 'http_calls', 'HTTP-запросы к Supabase из запросов'),
+            ('rostelekom_http_supabase_seconds_total', 'http_seconds', 'Время HTTP-запросов к Supabase из запросов'),
+            ('rostelekom_http_supabase_response_bytes_total', 'http_bytes', 'Байты ответов Supabase из запросов'),
+            ('rostelekom_http_request_bytes_total', 'request_bytes', 'Байты тел запросов'),
+            ('rostelekom_http_response_bytes_total', 'response_bytes', 'Байты тел ответов'),
+        )
+        for name, field, help_text in per_endpoint:
+            family(name, 'counter', help_text)
+            for (endpoint, method), e in sorted(endpoints.items()):
+                sample(name, {'endpoint': endpoint, 'method': method}, e[field])
+
+        for name, index, help_text in (
+            ('rostelekom_storage_calls_total', 0, 'Вызовы методов хранилища'),
+            ('rostelekom_storage_errors_total', 1, 'Вызовы методов хранилища с исключением'),
+            ('rostelekom_storage_seconds_total', 2, 'Время методов хранилища'),
+        ):
+            family(name, 'counter', help_text)
+            for (backend, operation), values in sorted(storage.items()):
+                sample(name, {'backend': backend, 'operation': operation}, values[index])
+
+        for name, index, help_text in (
+            ('rostelekom_supabase_requests_total', 0, 'HTTP-запросы к Supabase'),
+            ('rostelekom_supabase_errors_total', 1, 'HTTP-запросы к Supabase с ошибкой или статусом >= 400'),
+            ('rostelekom_supabase_seconds_total', 2, 'Время HTTP-запросов к Supabase'),
+            ('rostelekom_supabase_response_bytes_total', 3, 'Байты ответов Supabase (по Content-Length)'),
+        ):
+            family(name, 'counter', help_text)
+            for (method, resource), values in sorted(supabase.items()):
+                sample(name, {'method': method, 'resource': resource}, values[index])
+
+        for name, index, help_text in (
+            ('rostelekom_telemetry_payloads_total', 0, 'Тела запросов телеметрии роботов по форматам'),
+            ('rostelekom_telemetry_bytes_total', 1, 'Байты тел телеметрии (как пришли по сети)'),
+            ('rostelekom_telemetry_readings_total', 2, 'Сканирования в телах телеметрии'),
+            ('rostelekom_telemetry_decode_seconds_total', 3, 'Время разбора тел телеметрии'),
+        ):
+            family(name, 'counter', help_text)
+            for fmt, values in sorted(payloads.items()):
+                sample(name, {'format': fmt}, values[index])
+
+        family('rostelekom_handled_errors_total', 'counter', 'Перехваченные ошибки, после которых работа продолжилась')
+        for where, count in sorted(errors.items()):
+            sample('rostelekom_handled_errors_total', {'where': where}, count)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+
+
+def report_error(where, message=None):
+    """Записывает перехваченное исключение в лог и в счётчик rostelekom_handled_errors_total."""
+    metrics.record_error(where)
+    log.exception('%s [%s]', message or 'Перехвачена ошибка', where)
+
+
+def instrument_backend(backend):
+    """Оборачивает публичные методы хранилища замером времени (на экземпляре, класс не меняется)."""
+    if not METRICS_ENABLED or getattr(backend, '_instrumented', False):
+        return backend
+    from database.backends.base import StorageBackend
+    local = threading.local()
+    for name, attr in vars(StorageBackend).items():
+        if name.startswith('_') or not callable(attr):
+            continue
+        setattr(backend, name, _timed(backend.name, name, getattr(backend, name), local))
+    backend._instrumented = True
+    return backend
+
+
+def _timed(backend_name, operation, method, local):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        t0 = time.perf_counter()
+        failed = False
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            local.depth = depth
+            metrics.record_storage(backend_name, operation, time.perf_counter() - t0, failed, depth == 0)
+    return wrapper
+
+
+def instrument_http_client(session):
+    """Хуки httpx-клиента PostgREST: каждый HTTP-запрос к Supabase — время, статус, размер ответа."""
+    if not METRICS_ENABLED:
+        return session
+    local = threading.local()
+
+    def on_request(request):
+        local.t0 = time.perf_counter()
+
+    def on_response(response):
+        seconds = time.perf_counter() - getattr(local, 't0', time.perf_counter())
+        request = response.request
+        size = int(response.headers.get('content-length') or 0)
+        metrics.record_http(request.method, _resource(request.url.path), seconds, response.status_code >= 400, size)
+
+    session.event_hooks['request'].append(on_request)
+    session.event_hooks['response'].append(on_response)
+    return session
+
+
+def _resource(path):
+    """/rest/v1/rpc/inventory_latest_scans -> rpc/inventory_latest_scans, /rest/v1/products -> products."""
+    parts = [p for p in path.split('/') if p]
+    if len(parts) >= 2 and parts[0] == 'rest':
+        parts = parts[2:]
+    return '/'.join(parts[:2]) if parts[:1] == ['rpc'] else (parts[0] if parts else '')
+
+
+def init_app(app):
+    """Хуки before/after_request: счётчики запроса и заголовок Server-Timing."""
+    if not METRICS_ENABLED:
+        return
+    from flask import request
+
+    @app.before_request
+    def _begin_request_metrics():
+        metrics.begin_request()
+
+    @app.after_request
+    def _end_request_metrics(response):
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        size = None if response.is_streamed else response.calculate_content_length()
+        req = metrics.end_request(endpoint, request.method, response.status_code, request.content_length, size)
+        if req is not None and SERVER_TIMING:
+            response.headers['Server-Timing'] = (
+                f'total;dur={req["seconds"] * 1000:.1f}, '
+                f'db;dur={req["db_seconds"] * 1000:.1f};desc="{req["db_calls"]} calls", '
+                f'supabase;dur={req["http_seconds"] * 1000:.1f};desc="{req["http_calls"]} requests"'
+            )
+        return response
+
+    @app.teardown_request
+    def _drop_request_metrics(exc):
+        # Необработанное исключение: after_request не вызывался, ответ 500 отдаст Flask
+        if metrics.current() is not None:
+            metrics.end_request(request.url_rule.rule if request.url_rule else 'unmatched',
+                                request.method, 500, request.content_length, None)
@@ -0,0 +1,296 @@
+"""
+Хранение сырой истории: строки inventory_history старше RETENTION_DAYS переносятся
+в сжатый архив на диске, а из базы удаляются. Суммы quantity удалённых строк
+сохраняются в inventory_baseline, поэтому остатки товаров не меняются.
+
+Архив — gzip JSONL по дням сканирования:
+    ARCHIVE_DIR/inventory_history/day=YYYY-MM-DD/part-<время запуска>-<первый id>-<последний id>.jsonl.gz
+Агрегаты inventory_rollups не архивируются: прогнозы и графики по старым периодам продолжают работать,
+а rebuild_inventory_rollups пересобирает только корзины позже горизонта архива.
+
+    python -m services.retention compact [--days 90] [--dry-run]
+    python -m services.retention restore --since 2024-01-01 --until 2024-01-31 --out audit.jsonl
+    python -m services.retention restore --since 2024-01-01 --until 2024-01-01 --into-db
+    python -m services.retention status
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка архива между процессами недоступна
+    fcntl = None
+
+from database.connection import get_backend
+from database.rollups import bucket_of
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 90))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(PROJECT_DIR, 'archive')
+# Как часто запускать архивацию в процессе приложения (часы); 0 — только вручную
+RETENTION_INTERVAL_HOURS = float(os.environ.get('RETENTION_INTERVAL_HOURS', 0))
+# Строк за один запрос к базе
+RETENTION_PAGE = int(os.environ.get('RETENTION_PAGE', 1000))
+
+# Сколько дневных файлов держать открытыми одновременно
+MAX_OPEN_PARTS = 32
+# Задержка первого запуска по расписанию после старта процесса (секунды)
+SCHEDULER_START_DELAY = 60
+
+# Последний запуск по расписанию (для /dashboard/data/retention)
+retention_state = {'last_run': None, 'last_result': None, 'last_error': None}
+
+
+def compact(days=None, archive_dir=None, now=None, dry_run=False):
+    """
+    Архивирует строки inventory_history с scanned_at старше days дней и удаляет их из базы.
+    Возвращает сводку: cutoff, archived, deleted, files (или skipped, если архивирует другой процесс).
+    """
+    days = RETENTION_DAYS if days is None else days
+    archive_dir = archive_dir or ARCHIVE_DIR
+    now = now or datetime.utcnow()
+    cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
+    summary = {'cutoff': cutoff, 'archived': 0, 'deleted': 0, 'files': [], 'dry_run': dry_run}
+
+    with _ArchiveLock(archive_dir) as locked:
+        if not locked:
+            summary['skipped'] = True
+            return summary
+        backend = get_backend()
+        writer = None if dry_run else _ArchiveWriter(archive_dir, now.strftime('%Y%m%dT%H%M%S'))
+        after_id = 0
+        ranges = []  # [первый id, последний id] подряд выгруженных строк
+        try:
+            while True:
+                rows = backend.archive_candidates(cutoff, after_id, RETENTION_PAGE)
+                if not rows:
+                    break
+                if writer:
+                    writer.write(rows)
+                summary['archived'] += len(rows)
+                for row in rows:
+                    if ranges and ranges[-1][1] + 1 == row['id']:
+                        ranges[-1][1] = row['id']
+                    else:
+                        ranges.append([row['id'], row['id']])
+                after_id = rows[-1]['id']
+                if len(rows) < RETENTION_PAGE:
+                    break
+            if writer:
+                summary['files'] = writer.close()
+        except Exception:
+            if writer:
+                writer.abort()
+            raise
+        # Файлы уже на диске: удаляем ровно выгруженные id. Строка, закоммиченная позже с меньшим id,
+        # в архив не попала — она попадёт в следующий запуск, а не пропадёт
+        if summary['archived'] and not dry_run:
+            for start in range(0, len(ranges), RETENTION_PAGE):
+                summary['deleted'] += backend.compact_inventory(ranges[start:start + RETENTION_PAGE], cutoff)
+    return summary
+
+
+def iter_archive(since=None, until=None, archive_dir=None, product_id=None):
+    """Строки архива за дни since..until включительно (YYYY-MM-DD), без повторов по id, по дням."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    seen = set()
+    for day in archive_days(archive_dir):
+        if (since and day < since) or (until and day > until):
+            continue
+        for path in sorted(glob.glob(os.path.join(_day_dir(archive_dir, day), 'part-*.jsonl.gz'))):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    if row['id'] in seen or (product_id and row.get('product_id') != product_id):
+                        continue
+                    seen.add(row['id'])
+                    yield row
+
+
+def archive_days(archive_dir=None):
+    """Дни, за которые в архиве есть файлы, по возрастанию."""
+    root = os.path.join(archive_dir or ARCHIVE_DIR, 'inventory_history')
+    return sorted(name[len('day='):] for name in os.listdir(root) if name.startswith('day=')) if os.path.isdir(root) else []
+
+
+def restore(since=None, until=None, archive_dir=None, product_id=None, out=None, into_db=False):
+    """
+    Восстановление архива для проверок: out — файл JSONL ('-' — stdout),
+    into_db — вернуть строки в inventory_history (остатки при этом не меняются).
+    Возвращает {'rows': прочитано, 'restored': возвращено в базу}.
+    """
+    result = {'rows': 0, 'restored': 0}
+    f = None
+    if out:
+        f = sys.stdout if out == '-' else open(out, 'w', encoding='utf-8')
+    batch = []
+    try:
+        for row in iter_archive(since, until, archive_dir, product_id):
+            result['rows'] += 1
+            if f:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            if into_db:
+                batch.append(row)
+                if len(batch) >= RETENTION_PAGE:
+                    result['restored'] += get_backend().restore_inventory(batch)
+                    batch = []
+        if batch:
+            result['restored'] += get_backend().restore_inventory(batch)
+    finally:
+        if f and f is not sys.stdout:
+            f.close()
+    return result
+
+
+def status(archive_dir=None):
+    """Дни в архиве и суммы inventory_baseline."""
+    return {'archive_dir': archive_dir or ARCHIVE_DIR, 'days': archive_days(archive_dir),
+            'baseline': get_backend().inventory_baseline()}
+
+
+def _day_dir(archive_dir, day):
+    return os.path.join(archive_dir, 'inventory_history', f'day={day}')
+
+
+class _ArchiveWriter:
+    """Пишет строки в дневные gzip-файлы; файл получает окончательное имя только после fsync."""
+
+    def __init__(self, archive_dir, stamp):
+        self.archive_dir = archive_dir
+        self.stamp = stamp
+        self._open = OrderedDict()  # day -> [tmp_path, gzip, first_id, last_id]
+        self._files = []
+
+    def write(self, rows):
+        for row in rows:
+            day = bucket_of(row['scanned_at'], 'day')
+            part = self._open.get(day)
+            if part is None:
+                if len(self._open) >= MAX_OPEN_PARTS:
+                    self._finish(*self._open.popitem(last=False))
+                directory = _day_dir(self.archive_dir, day)
+                os.makedirs(directory, exist_ok=True)
+                tmp_path = os.path.join(directory, f'.part-{self.stamp}-{row["id"]}.tmp')
+                part = self._open[day] = [tmp_path, gzip.open(tmp_path, 'wt', encoding='utf-8'), row['id'], row['id']]
+            part[1].write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            part[3] = row['id']
+
+    def close(self):
+        while self._open:
+            self._finish(*self._open.popitem(last=False))
+        return self._files
+
+    def abort(self):
+        """Удаляет недописанные файлы; уже завершённые части остаются (при повторе дубли отсеет restore)."""
+        for tmp_path, gz, _, _ in self._open.values():
+            gz.close()
+            os.remove(tmp_path)
+        self._open.clear()
+
+    def _finish(self, day, part):
+        tmp_path, gz, first_id, last_id = part
+        gz.close()
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        base = os.path.join(os.path.dirname(tmp_path), f'part-{self.stamp}-{first_id}-{last_id}')
+        path, n = base + '.jsonl.gz', 1
+        while os.path.exists(path):  # повторный запуск в ту же секунду с теми же id
+            path, n = f'{base}.{n}.jsonl.gz', n + 1
+        os.replace(tmp_path, path)
+        self._files.append(path)
+
+
+class _ArchiveLock:
+    """Не даёт двум процессам архивировать одновременно (flock на ARCHIVE_DIR/.lock)."""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self._f = None
+
+    def __enter__(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._f = open(os.path.join(self.archive_dir, '.lock'), 'w')
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def __exit__(self, exc_type, exc, tb):
+        self._f.close()  # закрытие снимает flock
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(interval_hours=None):
+    """Запускает архивацию раз в interval_hours в фоновом потоке процесса (при 0 — ничего)."""
+    global _scheduler, _scheduler_pid
+    interval_hours = RETENTION_INTERVAL_HOURS if interval_hours is None else interval_hours
+    if interval_hours <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = threading.Thread(target=_run_scheduler, args=(interval_hours,),
+                                          name='retention', daemon=True)
+            _scheduler_pid = os.getpid()
+            _scheduler.start()
+        return _scheduler
+
+
+def _run_scheduler(interval_hours):
+    stop = threading.Event()
+    delay = SCHEDULER_START_DELAY
+    while not stop.wait(delay):
+        delay = interval_hours * 3600
+        retention_state['last_run'] = datetime.utcnow().isoformat() + 'Z'
+        try:
+            retention_state['last_result'] = compact()
+            retention_state['last_error'] = None
+        except Exception as e:
+            retention_state['last_error'] = str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Архивация и восстановление inventory_history')
+    parser.add_argument('--archive-dir', default=None, help=f'каталог архива (по умолчанию {ARCHIVE_DIR})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('compact', help='архивировать и удалить строки старше --days дней')
+    p.add_argument('--days', type=int, default=RETENTION_DAYS)
+    p.add_argument('--dry-run', action='store_true', help='только посчитать строки')
+    p = sub.add_parser('restore', help='прочитать архив за период')
+    p.add_argument('--since', help='первый день, YYYY-MM-DD')
+    p.add_argument('--until', help='последний день, YYYY-MM-DD')
+    p.add_argument('--product', help='только этот product_id')
+    p.add_argument('--out', help="файл JSONL ('-' — stdout)")
+    p.add_argument('--into-db', action='store_true', help='вернуть строки в inventory_history')
+    sub.add_parser('status', help='дни в архиве и архивные суммы')
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        result = compact(args.days, args.archive_dir, dry_run=args.dry_run)
+    elif args.command == 'restore':
+        if not args.out and not args.into_db:
+            parser.error('укажите --out и/или --into-db')
+        result = restore(args.since, args.until, args.archive_dir, args.product, args.out, args.into_db)
+    else:
+        result = status(args.archive_dir)
+    # При выгрузке в stdout сводка уходит в stderr, чтобы не смешиваться с JSONL
+    out = sys.stderr if args.command == 'restore' and args.out == '-' else sys.stdout
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str), file=out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Отчёт о холодном старте воркера: время импорта app.py, create_app по шагам и прогрева
+(services/warmup.py). Отчёт — в /readyz и /metrics (rostelekom_startup_seconds), итог пишется в лог.
+
+Время импорта по модулям (-X importtime в отдельном процессе, как при старте воркера):
+    python -m services.startup --top 30
+    python -m services.startup --json > startup_report.json
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from services.metrics import metrics
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_PACKAGES = ('app', 'database', 'routes', 'services', 'ingest_asgi')
+
+log = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Длительности шагов старта процесса (секунды) в порядке записи."""
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.warmup = None
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = seconds
+        metrics.record_startup(phase, seconds)
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def report(self):
+        with self._lock:
+            phases = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+            warmup = dict(self.warmup) if self.warmup else None
+        return {'pid': os.getpid(), 'phases_ms': phases, 'warmup': warmup}
+
+    def log_summary(self):
+        log.info('Старт воркера %s: %s', os.getpid(), ', '.join(
+            f'{name} {ms} мс' for name, ms in self.report()['phases_ms'].items()
+        ))
+
+
+startup = StartupReport()
+
+
+# --- время импорта по модулям ---
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$')
+
+
+def import_profile(module='app', env=None):
+    """
+    Импортирует module в отдельном интерпретаторе с -X importtime и разбирает вывод:
+    [{'module', 'self_ms', 'cumulative_ms', 'depth'}] в порядке завершения импорта.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_DIR, env=dict(os.environ, **(env or {})), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                'module': name, 'self_ms': round(int(self_us) / 1000, 2),
+                'cumulative_ms': round(int(cumulative_us) / 1000, 2), 'depth': len(indent) // 2,
+            })
+    return modules
+
+
+def summarize(modules, top=30):
+    """Итог: общее время, модули проекта, самые долгие модули и сторонние пакеты верхнего уровня."""
+    total = sum(m['self_ms'] for m in modules)
+    packages = {}
+    for m in modules:
+        package = m['module'].split('.')[0]
+        if package not in PROJECT_PACKAGES:
+            packages[package] = packages.get(package, 0) + m['self_ms']
+    return {
+        'total_ms': round(total, 1),
+        'modules': len(modules),
+        'project': [m for m in modules if m['module'].split('.')[0] in PROJECT_PACKAGES],
+        'slowest': sorted(modules, key=lambda m: m['cumulative_ms'], reverse=True)[:top],
+        'packages_ms': dict(sorted(((k, round(v, 1)) for k, v in packages.items()),
+                                   key=lambda kv: kv[1], reverse=True)[:top]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта модулей при старте воркера')
+    parser.add_argument('--module', default='app', help='что импортировать (по умолчанию app)')
+    parser.add_argument('--top', type=int, default=25, help='сколько самых долгих модулей показать')
+    parser.add_argument('--json', action='store_true', help='вывести отчёт в JSON')
+    args = parser.parse_args()
+
+    report = summarize(import_profile(args.module), args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"import {args.module}: {report['total_ms']} мс, модулей: {report['modules']}")
+    print('\nМодули проекта (мс, с вложенными импортами):')
+    for m in report['project']:
+        print(f"  {m['cumulative_ms']:>9.1f}  {m['module']}")
+    print('\nСторонние пакеты (мс, собственное время всех модулей пакета):')
+    for package, ms in report['packages_ms'].items():
+        print(f'  {ms:>9.1f}  {package}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Контракт сообщений роботов (POST /api/robots/data и /api/robots/data/batch): разбор тела
+(JSON или двоичный формат services/wire.py, по желанию gzip), проверка и разбор в строки
+robots и inventory_history. Общий для Flask API (routes/api.py) и асинхронного приёма
+телеметрии (ingest_asgi.py).
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from database.live_state import LOCATION_MAX
+from services.metrics import metrics
+from services.wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, decode_batch, gunzip
+
+# Максимум сообщений в одном запросе /robots/data/batch
+MAX_BATCH_MESSAGES = 500
+# Максимальный размер тела после распаковки gzip, байты
+MAX_DECODED_BODY = int(os.environ.get('TELEMETRY_MAX_DECODED_BODY', 8 * 1024 * 1024))
+
+
+class PayloadError(ValueError):
+    """Запрос отклонён целиком; status — HTTP-код ответа."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class BatchError(PayloadError):
+    """Пачка отклонена целиком."""
+
+
+def decode_body(body, content_type, content_encoding=None, batch=False):
+    """
+    Тело запроса -> данные в формате JSON API: сообщение (batch=False) или {'messages': [...]}.
+    JSON (application/json) или двоичный формат (application/x-robot-telemetry), тело — как есть
+    или gzip. Тело JSON, которое не разобрать, даёт None (как request.get_json(silent=True)).
+    Размер тела, число сканирований и время разбора по форматам пишутся в /metrics.
+    """
+    t0 = time.perf_counter()
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    encoding = (content_encoding or '').strip().lower()
+    if encoding not in ('', 'identity', 'gzip'):
+        raise PayloadError(f'unsupported Content-Encoding: {encoding}', 415)
+    raw_size = len(body)
+    if encoding == 'gzip':
+        body = gunzip(body, MAX_DECODED_BODY)
+    if mimetype == WIRE_CONTENT_TYPE:
+        fmt = 'binary'
+        messages = decode_batch(body)
+        if batch:
+            data = {'messages': messages}
+        elif len(messages) == 1:
+            data = messages[0]
+        else:
+            raise PayloadError('exactly one message expected, use /robots/data/batch')
+    elif mimetype == 'application/json' or mimetype.endswith('+json'):
+        fmt = 'json'
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+    else:
+        return None
+    if encoding == 'gzip':
+        fmt += '+gzip'
+    metrics.record_payload(fmt, raw_size, _readings(data), time.perf_counter() - t0)
+    return data
+
+
+def _readings(data):
+    messages = data.get('messages') if isinstance(data, dict) and 'messages' in data else data
+    if isinstance(messages, dict):
+        messages = [messages]
+    if not isinstance(messages, list):
+        return 0
+    return sum(len(m.get('scan_results') or []) for m in messages if isinstance(m, dict))
+
+
+def parse_message(data):
+    """
+    Проверяет сообщение робота и приводит его к (robot, records):
+    robot — аргументы upsert_robot, records — строки для inventory_history.
+    При некорректных данных бросает ValueError: в хранилище попадают только значения,
+    которые оно примет (типы, длины строк, диапазон INTEGER), поэтому одно сообщение
+    не может сорвать запись общей пачки.
+    """
+    if not data or not isinstance(data, dict):
+        raise ValueError('JSON required')
+
+    robot_id = data.get('robot_id')
+    timestamp = data.get('timestamp')
+    location = data.get('location') or {}
+    scan_results = data.get('scan_results') or []
+    battery_level = data.get('battery_level')
+
+    if not robot_id or not timestamp:
+        raise ValueError('robot_id and timestamp required')
+    robot_id = _text(robot_id, 'robot_id', 50, coerce=True)
+    _timestamp(timestamp)
+    if not isinstance(location, dict):
+        raise ValueError('location must be an object')
+    if not isinstance(scan_results, list):
+        raise ValueError('scan_results must be a list')
+    if battery_level is not None:
+        if (not isinstance(battery_level, (int, float)) or isinstance(battery_level, bool)
+                or not 0 <= battery_level <= 100):
+            raise ValueError('battery_level must be a number from 0 to 100')
+
+    zone = _text(location.get('zone', 'A'), 'location.zone', 10, coerce=True)
+    try:
+        row = _integer(location.get('row', 1))
+        shelf = _integer(location.get('shelf', 1))
+    except (TypeError, ValueError):
+        raise ValueError('location.row and location.shelf must be integers')
+    if not (0 <= row <= LOCATION_MAX and 0 <= shelf <= LOCATION_MAX):
+        raise ValueError(f'location.row and location.shelf must be from 0 to {LOCATION_MAX}')
+
+    robot = {
+        'robot_id': robot_id,
+        'status': 'active',
+        'battery_level': battery_level,
+        'current_zone': zone,
+        'current_row': row,
+        'current_shelf': shelf
+    }
+    records = []
+    for index, scan in enumerate(scan_results):
+        if not isinstance(scan, dict):
+            raise ValueError(f'scan_results[{index}] must be an object')
+        try:
+            quantity = _integer(scan.get('quantity', 0))
+        except (TypeError, ValueError):
+            raise ValueError(f'scan_results[{index}].quantity must be an integer')
+        if quantity < 0:
+            raise ValueError(f'scan_results[{index}].quantity must not be negative')
+        records.append({
+            'robot_id': robot_id,
+            'product_id': _text(scan.get('product_id', scan.get('product_name', 'UNKNOWN')),
+                                f'scan_results[{index}].product_id', 50, coerce=True),
+            'quantity': quantity,
+            'zone': zone,
+            'row_number': row,
+            'shelf_number': shelf,
+            'status': _text(scan.get('status', 'OK'), f'scan_results[{index}].status', 50),
+            'scanned_at': timestamp
+        })
+    return robot, records
+
+
+# Диапазон колонок INTEGER в хранилище
+_INT_MIN, _INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _integer(value):
+    """int из числа или строки с числом; bool, None, дробные строки и выход за INTEGER — ValueError/TypeError."""
+    if isinstance(value, bool):
+        raise TypeError('bool is not an integer')
+    try:
+        value = int(value)
+    except OverflowError:
+        raise ValueError('integer out of range') from None
+    if not _INT_MIN <= value <= _INT_MAX:
+        raise ValueError('integer out of range')
+    return value
+
+
+def _text(value, field, max_length, coerce=False):
+    """Непустая строка не длиннее max_length (coerce: числа приводятся к строке)."""
+    if coerce and isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f'{field} must be a non-empty string')
+    if len(value) > max_length:
+        raise ValueError(f'{field} is too long (max {max_length} characters)')
+    return value
+
+
+def _timestamp(value):
+    """timestamp — строка ISO 8601 (как отправляют роботы); иначе ValueError."""
+    if not isinstance(value, str):
+        raise ValueError('timestamp must be an ISO 8601 string')
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('timestamp must be an ISO 8601 string') from None
+
+
+def batch_messages(data):
+    """Список сообщений из тела /robots/data/batch ({"messages": [...]} или JSON-массив); иначе BatchError."""
+    messages = data.get('messages') if isinstance(data, dict) else data
+    if not isinstance(messages, list) or not messages:
+        raise BatchError('messages list required')
+    if len(messages) > MAX_BATCH_MESSAGES:
+        raise BatchError(f'too many messages (max {MAX_BATCH_MESSAGES})', 413)
+    return messages
+
+
+def parse_batch(messages):
+    """
+    Разбирает сообщения пачки. Возвращает (results, parsed): results — статус по каждому сообщению
+    (index, robot_id, status, error), parsed — (индекс в results, robot, records) для корректных.
+    """
+    results = []
+    parsed = []
+    for index, message in enumerate(messages):
+        robot_id = message.get('robot_id') if isinstance(message, dict) else None
+        try:
+            robot, message_records = parse_message(message)
+        except ValueError as e:
+            results.append({'index': index, 'robot_id': robot_id, 'status': 'error', 'error': str(e)})
+            continue
+        parsed.append((len(results), robot, message_records))
+        results.append({'index': index, 'robot_id': robot_id, 'status': 'ok'})
+    return results, parsed
+
+
+def fail_parsed(results, parsed, error):
+    """Помечает все разобранные сообщения пачки ошибкой записи."""
+    for i, _, _ in parsed:
+        results[i]['status'] = 'error'
+        results[i]['error'] = error
+
+
+def batch_summary(results):
+    """Тело ответа на пачку: общий статус (ok, partial, error), принято, отклонено и результаты."""
+    ok_count = sum(1 for r in results if r['status'] != 'error')
+    if ok_count == len(results):
+        batch_status = 'ok'
+    elif ok_count == 0:
+        batch_status = 'error'
+    else:
+        batch_status = 'partial'
+    return {
+        'status': batch_status,
+        'accepted': ok_count,
+        'rejected': len(results) - ok_count,
+        'results': results
+    }
@@ -0,0 +1,68 @@
+"""
+Прогрев воркера после fork (WARMUP=1): соединения с хранилищем, пользователь admin, кэши
+товаров, роботов и прогнозов, живое состояние склада и модуль прогноза загружаются
+в фоне сразу после старта, а не на первых запросах пользователей.
+Запускается хуком post_worker_init из gunicorn.conf.py (и при python app.py).
+"""
+import os
+import threading
+import time
+
+from services.metrics import report_error
+from services.startup import startup
+
+WARMUP = os.environ.get('WARMUP', '0') == '1'
+
+
+def _steps():
+    from database.connection import ensure_admin, get_backend
+    from database.live_state import LIVE_STATE_ENABLED, live_state
+    from database.models import get_ai_predictions, get_products, get_robots
+
+    steps = [
+        ('storage', lambda: get_backend().ping()),
+        ('admin', ensure_admin),
+        ('products', get_products),
+        ('robots', get_robots),
+        ('predictions', lambda: get_ai_predictions(20)),
+    ]
+    if LIVE_STATE_ENABLED:
+        steps.append(('live_state', lambda: live_state.ensure_loaded(get_backend())))
+    steps.append(('prognoz_module', lambda: __import__('services.ai_prognoz')))
+    return steps
+
+
+def warm_up():
+    """Выполняет шаги прогрева по очереди; ошибка шага пишется в лог и не останавливает остальные."""
+    t0 = time.perf_counter()
+    result = {}
+    for name, step in _steps():
+        t = time.perf_counter()
+        try:
+            step()
+            result[name] = round((time.perf_counter() - t) * 1000, 1)
+        except Exception as e:
+            report_error(f'warmup.{name}', 'Шаг прогрева не выполнен')
+            result[name] = f'error: {e}'
+    startup.warmup = result
+    startup.record('warmup', time.perf_counter() - t0)
+    startup.log_summary()
+    return result
+
+
+_warmup = None
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+
+def start_warmup(force=False):
+    """Запускает прогрев в фоновом потоке процесса (один раз на pid; без WARMUP=1 — ничего)."""
+    global _warmup, _warmup_pid
+    if not (WARMUP or force):
+        return None
+    with _warmup_lock:
+        if _warmup is None or _warmup_pid != os.getpid():
+            _warmup = threading.Thread(target=warm_up, name='warmup', daemon=True)
+            _warmup_pid = os.getpid()
+            _warmup.start()
+        return _warmup
@@ -0,0 +1,156 @@
+"""
+Компактный двоичный формат сообщений роботов (только стандартная библиотека —
+им пользуется и эмулятор). Content-Type: application/x-robot-telemetry,
+по желанию с Content-Encoding: gzip. Сервер по-прежнему принимает JSON.
+
+Пачка (little-endian):
+    b'RT', версия u8
+    u16 число строк, затем строки: u8 длина + UTF-8 (id роботов, зоны, товары, статусы — каждая один раз)
+    u16 число сообщений, каждое:
+        u16 робот, u16 зона (индексы строк), u16 ряд, u16 полка,
+        i64 время сканирования (микросекунды UTC), u16 заряд × 10 (0xFFFF — нет), u8 число сканирований
+        сканирование: u16 товар, i32 количество, u16 статус (индекс строки)
+Версия 1 хранила статус как u8 и ломалась на пачках больше чем с 255 строками; сервер по-прежнему
+её читает, эмулятор пишет версию 2.
+Имя товара, next_checkpoint и прочие поля JSON не передаются: сервер их не хранит.
+"""
+import gzip
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+
+CONTENT_TYPE = 'application/x-robot-telemetry'
+MAGIC = b'RT'
+VERSION = 2
+
+_HEADER = struct.Struct('<2sB')
+_COUNT = struct.Struct('<H')
+_MESSAGE = struct.Struct('<HHHHqHB')
+_SCAN = struct.Struct('<HiH')
+# Формат сканирования по версии пачки
+_SCANS = {1: struct.Struct('<HiB'), 2: _SCAN}
+_NO_BATTERY = 0xFFFF
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_batch(messages, compress=False):
+    """Сообщения в формате JSON API (robot_id, timestamp, location, scan_results, battery_level) -> bytes."""
+    if len(messages) > 0xFFFF:
+        raise ValueError('too many messages in batch (max 65535)')
+    strings = {}
+
+    def ref(value):
+        value = str(value)
+        index = strings.get(value)
+        if index is None:
+            if len(strings) >= 0xFFFF:
+                raise ValueError('too many distinct strings in batch')
+            index = strings[value] = len(strings)
+        return index
+
+    body = bytearray()
+    try:
+        _encode_messages(messages, ref, body)
+    except struct.error as e:  # ряд, полка, заряд или количество вне диапазона поля
+        raise ValueError(f'value out of range for wire format: {e}') from None
+
+    out = bytearray(_HEADER.pack(MAGIC, VERSION))
+    out += _COUNT.pack(len(strings))
+    for value in strings:
+        raw = value.encode('utf-8')
+        if len(raw) > 255:
+            raise ValueError('string too long for wire format (max 255 bytes)')
+        out += bytes((len(raw),)) + raw
+    out += _COUNT.pack(len(messages))
+    out += body
+    return gzip.compress(bytes(out), compresslevel=6) if compress else bytes(out)
+
+
+def _encode_messages(messages, ref, body):
+    for message in messages:
+        location = message.get('location') or {}
+        scans = message.get('scan_results') or []
+        if len(scans) > 255:
+            raise ValueError('too many scan_results in message (max 255)')
+        battery = message.get('battery_level')
+        body += _MESSAGE.pack(
+            ref(message['robot_id']), ref(location.get('zone', 'A')),
+            int(location.get('row', 1)), int(location.get('shelf', 1)),
+            _to_micros(message['timestamp']),
+            _NO_BATTERY if battery is None else int(round(float(battery) * 10)),
+            len(scans),
+        )
+        for scan in scans:
+            body += _SCAN.pack(ref(scan.get('product_id', 'UNKNOWN')), int(scan.get('quantity', 0)),
+                               ref(scan.get('status', 'OK')))
+
+
+def decode_batch(data):
+    """bytes (без gzip) -> список сообщений в формате JSON API. Любое несоответствие формату — ValueError."""
+    view = memoryview(data)
+    try:
+        magic, version = _HEADER.unpack_from(view, 0)
+        scan_struct = _SCANS.get(version)
+        if magic != MAGIC or scan_struct is None:
+            raise ValueError('unsupported telemetry format')
+        offset = _HEADER.size
+        (n_strings,) = _COUNT.unpack_from(view, offset)
+        offset += _COUNT.size
+        strings = []
+        for _ in range(n_strings):
+            length = view[offset]
+            strings.append(bytes(view[offset + 1:offset + 1 + length]).decode('utf-8'))
+            offset += 1 + length
+            if offset > len(view):
+                raise ValueError('truncated telemetry payload')
+        (n_messages,) = _COUNT.unpack_from(view, offset)
+        offset += _COUNT.size
+
+        messages = []
+        for _ in range(n_messages):
+            robot, zone, row, shelf, micros, battery, n_scans = _MESSAGE.unpack_from(view, offset)
+            offset += _MESSAGE.size
+            scans = []
+            for product, quantity, status in scan_struct.iter_unpack(view[offset:offset + n_scans * scan_struct.size]):
+                scans.append({'product_id': strings[product], 'quantity': quantity, 'status': strings[status]})
+            if len(scans) != n_scans:
+                raise ValueError('truncated telemetry payload')
+            offset += n_scans * scan_struct.size
+            messages.append({
+                'robot_id': strings[robot],
+                'timestamp': _from_micros(micros),
+                'location': {'zone': strings[zone], 'row': row, 'shelf': shelf},
+                'scan_results': scans,
+                'battery_level': None if battery == _NO_BATTERY else battery / 10,
+            })
+    except (struct.error, IndexError, UnicodeDecodeError, OverflowError) as e:
+        raise ValueError(f'malformed telemetry payload: {e}') from None
+    if offset != len(view):
+        raise ValueError('trailing bytes in telemetry payload')
+    return messages
+
+
+def gunzip(data, limit):
+    """Распаковка gzip не больше limit байт (защита от «zip-бомбы»); иначе ValueError."""
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    try:
+        out = decompressor.decompress(data, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f'malformed gzip body: {e}') from None
+    if len(out) > limit:
+        raise ValueError(f'decompressed body too large (max {limit} bytes)')
+    if not decompressor.eof:
+        raise ValueError('truncated gzip body')
+    return out
+
+
+def _to_micros(value):
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _from_micros(micros):
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat() + 'Z'
@@ -3,10 +3,28 @@
 # Render: PORT задаётся платформой
 
 PORT=${PORT:-10000}
+
+# INGEST_ASGI=1: телеметрию роботов принимает асинхронный ingest_asgi.py на INGEST_PORT,
+# дашборд догоняет его записи раз в LIVE_TAIL_INTERVAL секунд
+if [ "${INGEST_ASGI:-0}" = "1" ]; then
+    INGEST_PORT=${INGEST_PORT:-10001}
+    export LIVE_TAIL_INTERVAL="${LIVE_TAIL_INTERVAL:-1}"
+    export API_URL="${API_URL:-http://127.0.0.1:${INGEST_PORT}}"
+    nohup uvicorn ingest_asgi:app --host 0.0.0.0 --port ${INGEST_PORT} --no-access-log >> /tmp/ingest_asgi.log 2>&1 &
+fi
 export API_URL="${API_URL:-http://127.0.0.1:${PORT}}"
 
 # Эмулятор роботов в фоне
 nohup python robot_emulator.py >> /tmp/robot_emulator.log 2>&1 &
 
-# Gunicorn (основной процесс)
-exec gunicorn -b 0.0.0.0:${PORT} app:app
+# Gunicorn (основной процесс): по умолчанию один воркер с потоками — потоки /dashboard/stream
+# и рассылка событий работают внутри одного процесса. При GUNICORN_WORKERS > 1 кэши чтения
+# воркеров общие (SHARED_STATE=1, database/shared_state.py), а живое состояние и поток событий
+# каждого воркера догоняют записи соседей раз в LIVE_TAIL_INTERVAL секунд (services/ingest_tail.py).
+# Фоновые задачи и лимит STREAM_MAX_CLIENTS остаются у каждого воркера свои (см. README)
+GUNICORN_WORKERS=${GUNICORN_WORKERS:-1}
+if [ "${GUNICORN_WORKERS}" -gt 1 ]; then
+    export SHARED_STATE="${SHARED_STATE:-1}"
+    export LIVE_TAIL_INTERVAL="${LIVE_TAIL_INTERVAL:-1}"
+fi
+exec gunicorn -b 0.0.0.0:${PORT} --workers ${GUNICORN_WORKERS} --worker-class gthread --threads ${GUNICORN_THREADS:-32} app:app
@@ -27,9 +27,15 @@ CREATE TABLE IF NOT EXISTS products (
     name VARCHAR(255) NOT NULL,
     category VARCHAR(100),
     min_stock INTEGER DEFAULT 10,
-    optimal_stock INTEGER DEFAULT 100
+    optimal_stock INTEGER DEFAULT 100,
+    quantity INTEGER DEFAULT 0,
+    status VARCHAR(50)
 );
 
+-- Остатки, которые пересчитывает приложение (для таблиц, созданных до появления колонок)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS quantity INTEGER DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS status VARCHAR(50);
+
 -- История инвентаризации
 CREATE TABLE IF NOT EXISTS inventory_history (
     id SERIAL PRIMARY KEY,
@@ -44,6 +50,124 @@ CREATE TABLE IF NOT EXISTS inventory_history (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Агрегаты inventory_history по минутам, часам и дням (товар × зона).
+-- bucket — префикс scanned_at: 'YYYY-MM-DDTHH:MI', 'YYYY-MM-DDTHH' или 'YYYY-MM-DD'
+CREATE TABLE IF NOT EXISTS inventory_rollups (
+    granularity VARCHAR(10) NOT NULL,
+    bucket VARCHAR(16) NOT NULL,
+    product_id VARCHAR(50) NOT NULL,
+    zone VARCHAR(10) NOT NULL DEFAULT '',
+    quantity_sum BIGINT NOT NULL DEFAULT 0,
+    quantity_min INTEGER,
+    quantity_max INTEGER,
+    scans INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket, product_id, zone)
+);
+
+-- Прибавляет пачку агрегатов к inventory_rollups (вызывается приложением при записи сканирований)
+CREATE OR REPLACE FUNCTION merge_inventory_rollups(rows jsonb) RETURNS void
+LANGUAGE sql AS $$
+    INSERT INTO inventory_rollups AS r (granularity, bucket, product_id, zone, quantity_sum, quantity_min, quantity_max, scans)
+    SELECT x.granularity, x.bucket, x.product_id, x.zone, x.quantity_sum, x.quantity_min, x.quantity_max, x.scans
+    FROM jsonb_to_recordset(rows) AS x(granularity text, bucket text, product_id text, zone text,
+                                      quantity_sum bigint, quantity_min integer, quantity_max integer, scans integer)
+    ON CONFLICT (granularity, bucket, product_id, zone) DO UPDATE SET
+        quantity_sum = r.quantity_sum + EXCLUDED.quantity_sum,
+        quantity_min = LEAST(r.quantity_min, EXCLUDED.quantity_min),
+        quantity_max = GREATEST(r.quantity_max, EXCLUDED.quantity_max),
+        scans = r.scans + EXCLUDED.scans;
+$$;
+
+-- Пересобирает inventory_rollups по истории (после восстановления данных или сбоя записи агрегатов).
+-- Заархивированные строки (services/retention.py) из истории удалены, поэтому пересобираются только
+-- корзины позже горизонта архива — последнего scanned_at в inventory_baseline; более ранние
+-- агрегаты (в том числе корзина самого горизонта) остаются как есть.
+CREATE OR REPLACE FUNCTION rebuild_inventory_rollups() RETURNS void
+LANGUAGE sql AS $$
+    DELETE FROM inventory_rollups r
+    USING (VALUES ('minute', 16), ('hour', 13), ('day', 10)) AS g(granularity, len)
+    WHERE r.granularity = g.granularity
+      AND r.bucket > COALESCE((SELECT left(to_char(MAX(archived_until), 'YYYY-MM-DD"T"HH24:MI'), g.len) FROM inventory_baseline), '');
+    INSERT INTO inventory_rollups (granularity, bucket, product_id, zone, quantity_sum, quantity_min, quantity_max, scans)
+    SELECT g.granularity, left(to_char(h.scanned_at, 'YYYY-MM-DD"T"HH24:MI'), g.len), h.product_id, COALESCE(h.zone, ''),
+           SUM(h.quantity), MIN(h.quantity), MAX(h.quantity), COUNT(*)
+    FROM inventory_history h
+    CROSS JOIN (VALUES ('minute', 16), ('hour', 13), ('day', 10)) AS g(granularity, len)
+    WHERE h.product_id IS NOT NULL
+      AND left(to_char(h.scanned_at, 'YYYY-MM-DD"T"HH24:MI'), g.len)
+          > COALESCE((SELECT left(to_char(MAX(archived_until), 'YYYY-MM-DD"T"HH24:MI'), g.len) FROM inventory_baseline), '')
+    GROUP BY 1, 2, 3, 4;
+$$;
+
+-- Суммы quantity заархивированных строк inventory_history (services/retention.py):
+-- остаток товара = inventory_baseline.quantity + сумма оставшихся строк истории
+CREATE TABLE IF NOT EXISTS inventory_baseline (
+    product_id VARCHAR(50) PRIMARY KEY,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    archived_rows BIGINT NOT NULL DEFAULT 0,
+    archived_until TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Переносит суммы выгруженных в архив строк в inventory_baseline и удаляет их одной транзакцией.
+-- p_ranges — [[первый id, последний id], ...] подряд идущих выгруженных id: строка, закоммиченная
+-- позже с id внутри уже прочитанного диапазона, в архив не попала и не удаляется.
+CREATE OR REPLACE FUNCTION compact_inventory_ranges(p_ranges jsonb, p_cutoff timestamp) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    removed integer;
+BEGIN
+    WITH deleted AS (
+        DELETE FROM inventory_history h
+        USING jsonb_array_elements(p_ranges) AS r
+        WHERE h.id BETWEEN (r->>0)::bigint AND (r->>1)::bigint AND h.scanned_at < p_cutoff
+        RETURNING h.product_id, h.quantity, h.scanned_at
+    ), sums AS (
+        SELECT product_id, SUM(quantity) AS quantity, COUNT(*) AS n, MAX(scanned_at) AS last_at
+        FROM deleted WHERE product_id IS NOT NULL GROUP BY product_id
+    ), merged AS (
+        INSERT INTO inventory_baseline AS b (product_id, quantity, archived_rows, archived_until, updated_at)
+        SELECT product_id, quantity, n, last_at, now() FROM sums
+        ON CONFLICT (product_id) DO UPDATE SET
+            quantity = b.quantity + EXCLUDED.quantity,
+            archived_rows = b.archived_rows + EXCLUDED.archived_rows,
+            archived_until = GREATEST(b.archived_until, EXCLUDED.archived_until),
+            updated_at = now()
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO removed FROM deleted;
+    RETURN removed;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS compact_inventory_history(bigint, timestamp);
+
+-- Возвращает строки из архива в inventory_history (с исходными id) и вычитает их из inventory_baseline
+CREATE OR REPLACE FUNCTION restore_inventory_rows(p_rows jsonb) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    restored integer;
+BEGIN
+    WITH inserted AS (
+        INSERT INTO inventory_history (id, robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at, created_at)
+        SELECT id, robot_id, product_id, quantity, zone, row_number, shelf_number, status, scanned_at, created_at
+        FROM jsonb_populate_recordset(NULL::inventory_history, p_rows)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING product_id, quantity
+    ), sums AS (
+        SELECT product_id, SUM(quantity) AS quantity, COUNT(*) AS n
+        FROM inserted WHERE product_id IS NOT NULL GROUP BY product_id
+    ), updated AS (
+        UPDATE inventory_baseline b
+        SET quantity = b.quantity - s.quantity, archived_rows = b.archived_rows - s.n, updated_at = now()
+        FROM sums s WHERE b.product_id = s.product_id
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO restored FROM inserted;
+    RETURN restored;
+END;
+$$;
+
 -- Прогнозы ИИ
 CREATE TABLE IF NOT EXISTS ai_predictions (
     id SERIAL PRIMARY KEY,
@@ -61,18 +185,24 @@ ALTER TABLE robots ENABLE ROW LEVEL SECURITY;
 ALTER TABLE products ENABLE ROW LEVEL SECURITY;
 ALTER TABLE inventory_history ENABLE ROW LEVEL SECURITY;
 ALTER TABLE ai_predictions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE inventory_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE inventory_baseline ENABLE ROW LEVEL SECURITY;
 
 DROP POLICY IF EXISTS "Allow all" ON users;
 DROP POLICY IF EXISTS "Allow all" ON robots;
 DROP POLICY IF EXISTS "Allow all" ON products;
 DROP POLICY IF EXISTS "Allow all" ON inventory_history;
 DROP POLICY IF EXISTS "Allow all" ON ai_predictions;
+DROP POLICY IF EXISTS "Allow all" ON inventory_rollups;
+DROP POLICY IF EXISTS "Allow all" ON inventory_baseline;
 
 CREATE POLICY "Allow all" ON users FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON robots FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON products FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON inventory_history FOR ALL USING (true) WITH CHECK (true);
 CREATE POLICY "Allow all" ON ai_predictions FOR ALL USING (true) WITH CHECK (true);
+CREATE POLICY "Allow all" ON inventory_rollups FOR ALL USING (true) WITH CHECK (true);
+CREATE POLICY "Allow all" ON inventory_baseline FOR ALL USING (true) WITH CHECK (true);
 
 -- Начальные товары (для эмулятора роботов)
 INSERT INTO products (id, name, category) VALUES
@@ -0,0 +1,37 @@
+"""
+Тесты работают без Supabase: хранилище — SQLite в памяти (как в benchmarks/bench_hot_paths.py).
+    python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['STORAGE_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = ':memory:'
+os.environ['INGEST_QUEUE'] = '0'
+os.environ['SHARED_STATE'] = '0'
+os.environ.pop('GROQ_API_KEY', None)
+os.environ.pop('DEEPSEEK_API_KEY', None)
+
+from database.backends.sqlite_backend import SQLiteBackend  # noqa: E402
+from database.connection import set_backend  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    """Чистая база SQLite в памяти, подставленная в database.models."""
+    backend = SQLiteBackend(':memory:')
+    set_backend(backend)
+    return backend
+
+
+def robot_message(robot_id='RB-001', quantity=10, timestamp='2026-01-05T10:00:00Z', zone='A', product_id='TEL-4567'):
+    return {
+        'robot_id': robot_id,
+        'timestamp': timestamp,
+        'location': {'zone': zone, 'row': 3, 'shelf': 2},
+        'scan_results': [{'product_id': product_id, 'quantity': quantity, 'status': 'OK'}],
+        'battery_level': 87.5,
+    }
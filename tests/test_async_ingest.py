@@ -0,0 +1,58 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database.models import get_inventory_history
+from services.async_ingest import IngestBatcher, ThreadWriter
+
+
+class RejectingWriter:
+    """Отклоняет любую пачку, в которой есть сообщение робота RB-BAD, как хранилище с ограничением."""
+
+    def __init__(self):
+        self.written = []
+
+    async def write(self, robots, records):
+        if any(robot['robot_id'] == 'RB-BAD' for robot in robots):
+            raise sqlite3.IntegrityError('rejected')
+        self.written.extend(robot['robot_id'] for robot in robots)
+
+    async def aclose(self):
+        pass
+
+
+def _submit_all(batcher, robot_ids):
+    async def run():
+        batcher.start()
+        results = await asyncio.gather(
+            *(batcher.submit([{'robot_id': robot_id}], []) for robot_id in robot_ids), return_exceptions=True
+        )
+        await batcher.close()
+        return results
+    return asyncio.run(run())
+
+
+def test_rejected_message_fails_only_its_request():
+    writer = RejectingWriter()
+    batcher = IngestBatcher(writer, flush_size=100, flush_interval=0.01)
+    results = _submit_all(batcher, ['RB-001', 'RB-002', 'RB-BAD', 'RB-003'])
+
+    assert [type(r) for r in results] == [type(None), type(None), sqlite3.IntegrityError, type(None)]
+    assert sorted(writer.written) == ['RB-001', 'RB-002', 'RB-003']
+
+
+def test_robot_failure_does_not_fail_written_scans(backend, monkeypatch):
+    def broken(rows):
+        raise RuntimeError('robots unavailable')
+
+    monkeypatch.setattr(backend, 'upsert_robots', broken)
+    record = {'robot_id': 'RB-001', 'product_id': 'TEL-4567', 'quantity': 5, 'zone': 'A', 'row_number': 1,
+              'shelf_number': 1, 'status': 'OK', 'scanned_at': '2026-01-05T10:00:00'}
+    robots, inserted = ThreadWriter._write([{'robot_id': 'RB-001'}], [record])
+    assert robots == [] and len(inserted) == 1
+    assert len(get_inventory_history(10)) == 1
+
+    # Без записанных сканирований ошибка роботов доходит до запроса
+    with pytest.raises(RuntimeError):
+        ThreadWriter._write([{'robot_id': 'RB-001'}], [])
@@ -0,0 +1,63 @@
+from datetime import date
+
+from app import app
+from database.cache import users_cache
+from database.models import create_user, get_ai_predictions, insert_ai_prediction, record_telemetry
+from conftest import robot_message
+from services.telemetry import parse_message
+
+
+def _client(role):
+    users_cache.invalidate()
+    user = create_user(f'user-{role}', 'secret', role)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+
+def _record(**kwargs):
+    robot, records = parse_message(robot_message(**kwargs))
+    return record_telemetry([robot], records)[1]
+
+
+def test_unchanged_warehouse_data_answers_304(backend):
+    _record()
+    client = _client('Начальник склада')
+    # Первый ответ загружает каталог товаров в кэш; ETag по версиям данных — со второго
+    client.get('/dashboard/data/warehouse')
+    etag = client.get('/dashboard/data/warehouse').headers['ETag']
+
+    repeat = client.get('/dashboard/data/warehouse', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.data == b''
+
+    _record(quantity=3, timestamp='2026-01-05T11:00:00Z')
+    changed = client.get('/dashboard/data/warehouse', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_since_returns_only_newer_rows(backend):
+    [first] = _record()
+    [second] = _record(quantity=3, timestamp='2026-01-05T11:00:00Z')
+    client = _client('Начальник склада')
+
+    data = client.get(f'/dashboard/data/warehouse?since={first["id"]}').get_json()
+    assert [inv['id'] for inv in data['inventory']] == [second['id']]
+    assert data['cursor'] == second['id']
+
+    data = client.get(f'/dashboard/data/warehouse?since={second["id"]}').get_json()
+    assert data['inventory'] == []
+    assert data['cursor'] == second['id']
+
+
+def test_product_names_do_not_leak_into_cached_rows(backend):
+    insert_ai_prediction('TEL-4567', date(2026, 1, 10), days_until_stockout=3)
+    get_ai_predictions(20)
+
+    data = _client('Логист').get('/dashboard/data/logist').get_json()
+
+    assert data['predictions'][0]['product_name'] == 'Роутер RT-AC68U'
+    assert all('product_name' not in p for p in get_ai_predictions(20))
@@ -0,0 +1,35 @@
+import threading
+import time
+
+import services.events as events
+from services.events import Broadcaster
+
+
+def test_subscribe_limit():
+    broadcaster = Broadcaster()
+    first = broadcaster.subscribe(limit=1)
+    assert first is not None
+    assert broadcaster.subscribe(limit=1) is None
+    broadcaster.unsubscribe(first)
+    assert broadcaster.subscribe(limit=1) is not None
+
+
+def test_stock_recompute_runs_outside_ingest(monkeypatch):
+    recomputed = threading.Event()
+
+    def slow_recompute():
+        time.sleep(0.5)
+        recomputed.set()
+        return [{'id': 'TEL-4567', 'quantity': 10}]
+
+    monkeypatch.setattr(events, 'recompute_products_quantities_and_status', slow_recompute)
+    subscription = events.broadcaster.subscribe()
+    try:
+        t0 = time.perf_counter()
+        events.publish_ingested([{'id': 'RB-001'}], [{'id': 1, 'product_id': 'TEL-4567'}])
+        assert time.perf_counter() - t0 < 0.1
+        assert recomputed.wait(5)
+        received = [subscription.get(timeout=5)[0] for _ in range(3)]
+        assert received == ['robots', 'inventory', 'products']
+    finally:
+        events.broadcaster.unsubscribe(subscription)
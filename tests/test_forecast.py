@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from services.forecast import build_series, forecast, forecast_products
+
+
+def _hourly(product_id, values, scans=2, day='2026-01-05'):
+    """Строки get_hourly_inventory: values — средний остаток на сканирование по часам подряд с 00:00."""
+    rows = []
+    for i, value in enumerate(values):
+        hour = f'{day}T{i:02d}' if i < 24 else f'2026-01-06T{i - 24:02d}'
+        rows.append({'product_id': product_id, 'bucket': hour, 'quantity': value * scans, 'scans': scans})
+    return rows
+
+
+def test_build_series_averages_per_scan_and_keeps_gaps():
+    rows = [
+        {'product_id': 'A', 'bucket': '2026-01-05T10', 'quantity': 30, 'scans': 3},
+        {'product_id': 'A', 'bucket': '2026-01-05T13', 'quantity': 8, 'scans': 2},
+        {'product_id': 'B', 'bucket': '2026-01-05T11', 'quantity': 5, 'scans': 1},
+        {'product_id': 'X', 'bucket': '2026-01-05T12', 'quantity': 99, 'scans': 1},
+        {'product_id': 'B', 'bucket': '2026-01-05T12', 'quantity': 7, 'scans': 0},
+    ]
+    matrix, hours = build_series(rows, ['A', 'B'])
+
+    assert hours.tolist() == [0.0, 1.0, 2.0, 3.0]
+    np.testing.assert_array_equal(matrix, [[10, np.nan, np.nan, 4], [np.nan, 5, np.nan, np.nan]])
+
+
+def test_linear_decline_gives_days_until_stockout():
+    # Остаток на сканирование падает на 10 в час: к последнему часу уровень 1000 - 47 * 10 = 530
+    rows = _hourly('A', [1000 - 10 * h for h in range(48)])
+    matrix, hours = build_series(rows, ['A'])
+    result = forecast([530.0], matrix, hours, ideal_quantity=0)
+
+    assert result['daily_consumption'][0] == pytest.approx(240.0)
+    assert result['days_until_stockout'][0] == pytest.approx(530 / 240)
+    # Запас на срок поставки и период заказа; ряд без шума — страховой запас нулевой
+    assert result['recommended_order'][0] == pytest.approx(240 * 21 - 530, abs=1)
+    assert 0.8 < result['confidence'][0] <= 0.99
+
+
+def test_empty_history_gives_no_stockout_date():
+    [product] = forecast_products([{'id': 'A', 'quantity': 100}], [], ideal_quantity=500)
+
+    assert product == {'product_id': 'A', 'days_until_stockout': None, 'recommended_order': 400, 'confidence': 0.1}
+    assert forecast_products([], []) == []
+
+
+def test_single_bucket_has_no_trend():
+    products = [{'id': 'A', 'quantity': 100}, {'id': 'B', 'quantity': 0}]
+    rows = _hourly('A', [50]) + _hourly('B', [50])
+    by_id = {p['product_id']: p for p in forecast_products(products, rows, ideal_quantity=100)}
+
+    assert by_id['A']['days_until_stockout'] is None
+    assert by_id['A']['recommended_order'] == 0
+    assert by_id['A']['confidence'] == 0.05
+    # Товара нет на складе — исчерпан уже сейчас
+    assert by_id['B']['days_until_stockout'] == 0
+    assert by_id['B']['recommended_order'] == 100
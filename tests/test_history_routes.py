@@ -0,0 +1,48 @@
+import pytest
+
+from app import app
+from database.cache import users_cache
+from database.models import create_user, insert_inventory_records
+from conftest import robot_message
+from services.telemetry import parse_message
+
+
+def _client(role):
+    users_cache.invalidate()
+    user = create_user(f'user-{role}', 'secret', role)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def history(backend):
+    for timestamp in ('2026-01-05T10:00:00Z', '2026-01-06T10:00:00Z'):
+        _, records = parse_message(robot_message(timestamp=timestamp))
+        insert_inventory_records(records)
+
+
+def test_history_rejects_malformed_dates(history):
+    client = _client('admin')
+    for query in ('since=yesterday', 'until=2026-13-01', 'since=2026-01-05T10:00:00%27%20or%201=1'):
+        response = client.get(f'/dashboard/data/history?{query}')
+        assert response.status_code == 400
+        assert 'ISO 8601' in response.get_json()['error']
+        assert client.get(f'/dashboard/data/history/export?{query}').status_code == 400
+
+
+def test_history_normalizes_dates_to_utc(history):
+    page = _client('admin').get('/dashboard/data/history?since=2026-01-06T12:00:00%2B03:00').get_json()
+    assert page['filters'] == {'since': '2026-01-06T09:00:00'}
+    assert [row['scanned_at'][:10] for row in page['rows']] == ['2026-01-06']
+
+
+def test_history_export_is_admin_only(history):
+    response = _client('logist').get('/dashboard/data/history/export')
+    assert response.status_code == 403
+    assert response.get_json() == {'error': 'Доступ запрещён'}
+    response = _client('admin').get('/dashboard/data/history/export?format=jsonl&since=2026-01-06')
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 1
@@ -0,0 +1,137 @@
+import atexit
+import json
+import os
+import sqlite3
+
+import pytest
+
+from database.backends.base import is_data_error
+from conftest import robot_message
+from services.ingest_queue import DEAD_LETTER_FILE, IngestQueue
+from services.telemetry import parse_message
+
+
+def history_count(backend):
+    return len(backend.recent_inventory(10000))
+
+
+@pytest.fixture
+def queue(tmp_path, backend):
+    q = IngestQueue(max_messages=5, flush_size=500, flush_interval=3600, spool_dir=str(tmp_path))
+    q.start()
+    yield q
+    q.stop()
+
+
+def poison():
+    """Сообщение, которое прошло бы мимо проверки, но отклоняется хранилищем (quantity NOT NULL)."""
+    robot, records = parse_message(robot_message('RB-BAD'))
+    records[0]['quantity'] = None
+    return robot, records
+
+
+def test_flush_writes_and_acks_spool(queue, backend, tmp_path):
+    for i in range(3):
+        assert queue.put(*parse_message(robot_message(f'RB-{i}')))
+    queue.flush()
+    assert history_count(backend) == 3
+    assert queue.size() == 0
+    assert os.path.getsize(queue._spool.name) == 0
+
+
+def test_poison_message_goes_to_dead_letter(queue, backend, tmp_path):
+    queue.put(*parse_message(robot_message('RB-1')))
+    queue.put(*parse_message(robot_message('RB-2')))
+    queue.put(*poison())
+    queue.put(*parse_message(robot_message('RB-3')))
+    queue.put(*parse_message(robot_message('RB-4')))
+    assert not queue.put(*parse_message(robot_message('RB-5')))  # очередь заполнена
+
+    queue.flush()
+
+    assert history_count(backend) == 4
+    assert queue.size() == 0
+    assert queue.stats['dead_lettered'] == 1
+    assert queue.stats['flushed'] == 4
+    with open(tmp_path / DEAD_LETTER_FILE, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [e['robot']['robot_id'] for e in entries] == ['RB-BAD']
+    assert 'NOT NULL' in entries[0]['error']
+    # очередь снова принимает сообщения
+    assert queue.put(*parse_message(robot_message('RB-5')))
+
+
+def test_transient_error_keeps_messages(queue, backend, tmp_path, monkeypatch):
+    def locked(rows):
+        raise sqlite3.OperationalError('database is locked')
+
+    queue.put(*parse_message(robot_message('RB-1')))
+    monkeypatch.setattr(backend, 'insert_inventory', locked)
+    with pytest.raises(sqlite3.OperationalError):
+        queue.flush()
+    assert queue.size() == 1
+    assert queue.stats['dead_lettered'] == 0
+    assert not (tmp_path / DEAD_LETTER_FILE).exists()
+
+    monkeypatch.undo()
+    queue.flush()
+    assert history_count(backend) == 1
+
+
+def test_unacked_messages_recovered_after_crash(tmp_path, backend):
+    crashed = IngestQueue(flush_interval=3600, spool_dir=str(tmp_path))
+    crashed.start()
+    crashed.put(*parse_message(robot_message('RB-1')))
+    crashed.put(*parse_message(robot_message('RB-2')))
+    crashed.flush()
+    crashed.put(*parse_message(robot_message('RB-3')))
+    # аварийное завершение: поток остановлен, очередь не дописана, spool-файл закрыт
+    with crashed._cond:
+        crashed._stopped = True
+        crashed._cond.notify()
+    crashed._thread.join()
+    crashed._spool.close()
+    atexit.unregister(crashed.stop)
+
+    restarted = IngestQueue(flush_interval=3600, spool_dir=str(tmp_path))
+    restarted.start()
+    try:
+        assert restarted.size() == 1
+        restarted.flush()
+    finally:
+        restarted.stop()
+    robots = sorted(row['robot_id'] for row in backend.recent_inventory(100))
+    assert robots == ['RB-1', 'RB-2', 'RB-3']
+
+
+def test_overflowing_message_goes_to_dead_letter(queue, backend, tmp_path):
+    robot, records = parse_message(robot_message('RB-BIG'))
+    records[0]['quantity'] = 2 ** 63  # SQLite: OverflowError при привязке параметра
+    queue.put(*parse_message(robot_message('RB-1')))
+    queue.put(robot, records)
+    queue.flush()
+    assert queue.size() == 0
+    assert queue.stats['dead_lettered'] == 1
+    assert history_count(backend) == 1
+
+
+class _Status(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.response = type('Response', (), {'status_code': status})()
+
+
+@pytest.mark.parametrize('exc, expected', [
+    (OverflowError('int too large'), True),
+    (sqlite3.IntegrityError('NOT NULL'), True),
+    (_Status(400), True),
+    (_Status(422), True),
+    (sqlite3.OperationalError('database is locked'), False),
+    (TypeError('bug'), False),
+    (KeyError('quantity'), False),
+    (_Status(401), False),
+    (_Status(403), False),
+    (_Status(503), False),
+])
+def test_is_data_error(exc, expected):
+    assert is_data_error(exc) is expected
@@ -0,0 +1,69 @@
+from database.live_state import live_state
+from database.cache import robots_cache
+from database.models import get_robots, inventory_rows, record_telemetry
+from conftest import robot_message
+from services import ingest_tail
+from services.ingest_tail import LiveTail
+from services.telemetry import parse_message
+
+
+def _foreign(backend, robot_id, n=1):
+    """Строки соседнего воркера: записаны в хранилище мимо живого состояния этого процесса."""
+    records = [parse_message(robot_message(robot_id=robot_id, quantity=i))[1][0] for i in range(n)]
+    return backend.insert_inventory(inventory_rows(records))
+
+
+def _published(monkeypatch):
+    published = []
+    monkeypatch.setattr(ingest_tail, 'publish_ingested', lambda robots, rows: published.extend(rows))
+    return published
+
+
+def test_tail_publishes_only_rows_of_other_processes(backend, monkeypatch):
+    published = _published(monkeypatch)
+    tail = LiveTail.start(backend)
+
+    # Строки этого воркера — больше, чем помещается в ленту последних сканирований
+    robot, records = parse_message(robot_message(robot_id='RB-001'))
+    record_telemetry([robot], records * (live_state.recent_size + 50))
+    foreign = _foreign(backend, 'RB-002')
+
+    assert [row['id'] for row in tail.poll()] == [foreign[0]['id']]
+    assert [row['robot_id'] for row in published] == ['RB-002']
+    assert tail.poll() == []
+
+
+def test_tail_picks_up_rows_committed_out_of_order(backend, monkeypatch):
+    published = _published(monkeypatch)
+    tail = LiveTail.start(backend)
+    rows = _foreign(backend, 'RB-002', 3)
+    # Строка со средним id ещё не закоммичена, когда догонялка читает соседние
+    late = rows[1]
+    with backend._tx() as conn:
+        conn.execute('DELETE FROM inventory_history WHERE id = ?', (late['id'],))
+    assert [row['id'] for row in tail.poll()] == [rows[0]['id'], rows[2]['id']]
+
+    backend.restore_inventory([late])
+    assert [row['id'] for row in tail.poll()] == [late['id']]
+    assert sorted(row['id'] for row in published) == [row['id'] for row in rows]
+
+
+def test_tail_reads_only_robots_of_new_rows_and_keeps_cache(backend, monkeypatch):
+    _published(monkeypatch)
+    backend.upsert_robots([{'id': 'RB-001', 'status': 'active'}, {'id': 'RB-002', 'status': 'active'}])
+    robots_cache.invalidate()
+    get_robots()
+    tail = LiveTail.start(backend)
+    requested = []
+    list_robots = backend.list_robots
+    monkeypatch.setattr(backend, 'list_robots', lambda ids=None: requested.append(ids) or list_robots(ids))
+
+    _foreign(backend, 'RB-002')
+    backend.upsert_robots([{'id': 'RB-002', 'status': 'charging'}])
+    tail.poll()
+
+    assert requested == [['RB-002']]
+    cached = {robot['id']: robot['status'] for robot in get_robots()}
+    # Запись кэша дополнена, а не сброшена: get_robots не перечитал всех роботов
+    assert requested == [['RB-002']]
+    assert cached == {'RB-001': 'active', 'RB-002': 'charging'}
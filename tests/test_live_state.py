@@ -0,0 +1,74 @@
+import pytest
+
+from database.live_state import KEY_BITS, LOCATION_MAX, LiveState, location_key
+
+
+def _scan(rid, quantity, scanned_at, zone='A', row=3, shelf=2, product_id='TEL-4567', status='OK'):
+    return {'id': rid, 'robot_id': 'RB-001', 'zone': zone, 'row_number': row, 'shelf_number': shelf,
+            'product_id': product_id, 'quantity': quantity, 'status': status, 'scanned_at': scanned_at}
+
+
+@pytest.fixture
+def state(backend):
+    state = LiveState(recent_size=3)
+    state.ensure_loaded(backend)
+    return state
+
+
+def test_newer_scan_replaces_cell_and_moves_aggregates(state):
+    state.apply_inventory([_scan(1, 10, '2026-01-05T10:00:00Z')])
+    state.apply_inventory([_scan(2, 4, '2026-01-05T11:00:00Z', status='CRITICAL')])
+    # Более старое сканирование той же ячейки пришло позже — ячейку не меняет
+    state.apply_inventory([_scan(3, 99, '2026-01-05T09:00:00Z')])
+
+    [cell] = state.shelf('A', 3, 2)
+    assert (cell['id'], cell['quantity'], cell['status']) == (2, 4, 'CRITICAL')
+    [zone] = state.heatmap()['zones']
+    assert (zone['cells'], zone['quantity'], zone['ok'], zone['critical']) == (1, 4, 0, 1)
+    assert zone['last_scan'] == '2026-01-05T11:00:00Z'
+
+
+def test_recent_feed_dedupes_by_id_within_its_size(state):
+    rows = [_scan(i, i, f'2026-01-05T1{i}:00:00Z', shelf=i) for i in range(1, 5)]
+    assert state.apply_inventory(rows) == rows
+    assert state.apply_inventory(rows[2:]) == []
+    assert [r['id'] for r in state.recent_inventory(10)] == [4, 3, 2]
+
+    # id 1 вытеснен из ленты — повтор снова считается новым
+    assert state.apply_inventory(rows[:1]) == rows[:1]
+
+
+def test_take_applied_returns_ids_since_previous_call(state):
+    state.apply_inventory([_scan(1, 1, '2026-01-05T10:00:00Z')])
+    state.track_applied()
+    assert state.take_applied() == set()
+    state.apply_inventory([_scan(2, 1, '2026-01-05T10:00:00Z'), _scan(3, 1, '2026-01-05T10:00:00Z')])
+    assert state.take_applied() == {2, 3}
+    assert state.take_applied() == set()
+
+
+def test_location_keys_do_not_collide_at_the_bounds():
+    keys = {
+        location_key(zone, row, shelf)
+        for zone in (0, 1, 2)
+        for row in (-1, 0, LOCATION_MAX)
+        for shelf in (-1, 0, LOCATION_MAX)
+    }
+    assert len(keys) == 27
+    assert location_key(0, LOCATION_MAX, LOCATION_MAX) < 1 << 2 * KEY_BITS
+
+
+def test_cells_at_the_bounds_stay_on_their_shelves(state):
+    state.apply_inventory([
+        _scan(1, 5, '2026-01-05T10:00:00Z', row=LOCATION_MAX, shelf=LOCATION_MAX),
+        _scan(2, 6, '2026-01-05T10:00:00Z', zone='B', row=0, shelf=0),
+        # Вне диапазона ключа: пропускается, а не попадает на чужую полку
+        _scan(3, 7, '2026-01-05T10:00:00Z', row=LOCATION_MAX + 1, shelf=0),
+        _scan(4, 8, '2026-01-05T10:00:00Z', row=-5, shelf=0),
+    ])
+
+    assert [c['id'] for c in state.shelf('A', LOCATION_MAX, LOCATION_MAX)] == [1]
+    assert [c['id'] for c in state.shelf('B', 0, 0)] == [2]
+    assert state.shelf('A', LOCATION_MAX + 1, 0) == []
+    assert state.shelf('A', -5, 0) == []
+    assert state.stats()['cells'] == 2
@@ -0,0 +1,7 @@
+from app import app
+
+
+def test_metrics_require_admin_even_from_localhost(backend):
+    # За reverse proxy все запросы приходят с адреса прокси — он не должен открывать метрики
+    response = app.test_client().get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 403
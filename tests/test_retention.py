@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from database import models
+from database.models import insert_inventory_records, rebuild_inventory_rollups
+from conftest import robot_message
+from services import retention
+from services.telemetry import parse_message
+
+
+def _ingest(timestamp, quantity=10):
+    _, records = parse_message(robot_message(quantity=quantity, timestamp=timestamp))
+    insert_inventory_records(records)
+
+
+def test_rebuild_keeps_rollups_of_archived_days(backend, tmp_path):
+    _ingest('2026-01-05T10:00:00Z', 10)
+    _ingest('2026-03-05T10:00:00Z', 7)
+
+    summary = retention.compact(days=30, archive_dir=str(tmp_path), now=datetime(2026, 3, 10))
+    assert summary['archived'] == summary['deleted'] == 1
+
+    rebuild_inventory_rollups()
+    days = models.get_inventory_rollups('day', since='2026-01-01')
+    assert [(r['bucket'], r['quantity_sum']) for r in days] == [('2026-01-05', 10), ('2026-03-05', 7)]
+
+
+def test_compact_deletes_only_archived_ids(backend, tmp_path, monkeypatch):
+    for day in ('01', '02', '03'):
+        _ingest(f'2026-01-{day}T10:00:00Z')
+    ids = [r['id'] for r in backend.archive_candidates('2026-02-01', 0, 10)]
+
+    # Строка с id в середине закоммичена после того, как архивация её прочитала бы
+    candidates = backend.archive_candidates
+    monkeypatch.setattr(backend, 'archive_candidates', lambda cutoff, after_id, limit: [
+        row for row in candidates(cutoff, after_id, limit) if row['id'] != ids[1]
+    ])
+    summary = retention.compact(days=30, archive_dir=str(tmp_path), now=datetime(2026, 3, 10))
+
+    assert summary['archived'] == summary['deleted'] == 2
+    assert [r['id'] for r in candidates('2026-02-01', 0, 10)] == [ids[1]]
+    assert [r['archived_rows'] for r in backend.inventory_baseline()] == [2]
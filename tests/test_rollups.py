@@ -0,0 +1,26 @@
+from database.rollups import bucket_of, rollup_rows
+
+
+def test_bucket_of_converts_offset_timestamps_to_utc():
+    assert bucket_of('2026-01-05T01:30:00+03:00', 'day') == '2026-01-04'
+    assert bucket_of('2026-01-05T01:30:00+03:00', 'hour') == '2026-01-04T22'
+    assert bucket_of('2026-01-04T22:30:00Z', 'minute') == '2026-01-04T22:30'
+    assert bucket_of('2026-01-04 22:30:00', 'minute') == '2026-01-04T22:30'
+
+
+def test_offset_and_utc_scans_share_rollups_with_sqlite_rebuild(backend):
+    rows = backend.insert_inventory([
+        {'robot_id': 'RB-001', 'product_id': 'TEL-4567', 'quantity': 5, 'zone': 'A',
+         'scanned_at': '2026-01-05T01:30:00+03:00'},
+        {'robot_id': 'RB-001', 'product_id': 'TEL-4567', 'quantity': 7, 'zone': 'A',
+         'scanned_at': '2026-01-04T22:45:00Z'},
+    ])
+    hours = [r for r in rollup_rows(rows) if r['granularity'] == 'hour']
+    assert [(r['bucket'], r['quantity_sum'], r['scans']) for r in hours] == [('2026-01-04T22', 12, 2)]
+
+    backend.rebuild_rollups()
+    with backend._tx() as conn:
+        rebuilt = conn.execute(
+            "SELECT bucket, quantity_sum, scans FROM inventory_rollups WHERE granularity = 'hour'"
+        ).fetchall()
+    assert [tuple(r) for r in rebuilt] == [('2026-01-04T22', 12, 2)]
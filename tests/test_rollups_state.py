@@ -0,0 +1,51 @@
+from database import models
+from database.backends.sqlite_backend import SQLiteBackend
+from database.connection import set_backend
+from database.models import (
+    ROLLUPS_STALE_KEY, get_hourly_inventory, insert_inventory_records, rebuild_inventory_rollups, rollups_stale,
+)
+from conftest import robot_message
+from services.telemetry import parse_message
+
+
+def test_rollup_failure_is_visible_to_other_processes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'shared.db')
+    backend = SQLiteBackend(path)
+    set_backend(backend)
+    _, records = parse_message(robot_message())
+
+    def broken(rows):
+        raise RuntimeError('rpc failed')
+
+    monkeypatch.setattr(backend, 'merge_rollups', broken)
+    insert_inventory_records(records)
+    assert rollups_stale()
+    assert backend.get_state(ROLLUPS_STALE_KEY) is not None
+
+    # Другой процесс: своё подключение, чистое состояние процесса
+    set_backend(SQLiteBackend(path))
+    assert rollups_stale()
+    # агрегаты пусты, прогноз читает сырую историю
+    assert models.get_inventory_rollups('hour', since='2026-01-01') == []
+    assert get_hourly_inventory('2026-01-01') == [
+        {'product_id': 'TEL-4567', 'bucket': '2026-01-05T10', 'quantity': 10, 'scans': 1}
+    ]
+
+    rebuild_inventory_rollups()
+    assert not rollups_stale()
+    assert len(models.get_inventory_rollups('hour', since='2026-01-01')) == 1
+
+
+def test_unreachable_marker_is_remembered_in_process(backend, monkeypatch):
+    def broken(*args):
+        raise RuntimeError('storage down')
+
+    monkeypatch.setattr(backend, 'merge_rollups', broken)
+    monkeypatch.setattr(backend, 'set_state', broken)
+    insert_inventory_records(parse_message(robot_message())[1])
+    assert rollups_stale()
+    monkeypatch.undo()
+    # следующая успешная запись переносит отметку в хранилище
+    insert_inventory_records(parse_message(robot_message('RB-002'))[1])
+    assert backend.get_state(ROLLUPS_STALE_KEY) is not None
+    assert not models.rollup_state['unmarked']
@@ -0,0 +1,70 @@
+import pytest
+
+from database import shared_state
+from database.cache import SharedCache
+from database.shared_state import SharedStore
+
+
+@pytest.fixture
+def storage_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, 'SHARED_STATE_DIR', str(tmp_path / 'shm'))
+    shared_state.default_directory.cache_clear()
+    yield 'sqlite:test'
+    shared_state.default_directory.cache_clear()
+
+
+def _worker(name, storage_id):
+    """Кэш «другого воркера»: своя копия значений процесса поверх того же каталога."""
+    return SharedCache(name, 60, storage_id=storage_id)
+
+
+def test_store_round_trip_and_versions(tmp_path):
+    store = SharedStore(str(tmp_path / 'shm'))
+    assert store.read('missing.bin') is None
+    store.write('value.bin', 3, 7, 123.5, {'rows': [1, 2]})
+    assert store.read('value.bin') == (3, 7, 123.5, {'rows': [1, 2]})
+
+    first, second = store.next_version(), store.next_version()
+    assert second > first
+    assert store.bump(5) > second and store.version(5) == store.version(0)
+
+
+def test_private_directory_is_required(tmp_path):
+    directory = tmp_path / 'shm'
+    directory.mkdir(mode=0o755)
+    directory.chmod(0o755)
+    with pytest.raises(PermissionError):
+        SharedStore(str(directory))
+
+
+def test_writes_and_invalidation_are_seen_by_other_workers(storage_id):
+    a, b = _worker('products', storage_id), _worker('products', storage_id)
+    loads = []
+    assert a.get_or_load('all', lambda: loads.append(1) or [1]) == [1]
+    assert b.get_or_load('all', lambda: loads.append(1) or [2]) == [1]
+    assert loads == [1]
+
+    a.update('all', lambda rows: rows + [3])
+    assert b.get('all') == [1, 3]
+    assert b.version('all') == a.version('all')
+
+    b.invalidate('all')
+    assert a.get('all') is None
+    a.set('all', [4])
+    b.invalidate()
+    assert a.get('all') is None
+
+
+def test_update_racing_full_invalidate_does_not_resurrect_value(storage_id):
+    a, b = _worker('robots', storage_id), _worker('robots', storage_id)
+    a.set('all', ['stale'])
+
+    def concurrent_invalidate(rows):
+        # Другой воркер сбрасывает весь кэш, пока update держит прочитанное значение
+        b.invalidate()
+        return rows + ['updated']
+
+    a.update('all', concurrent_invalidate)
+    assert _worker('robots', storage_id).get('all') is None
+    assert b.get('all') is None
+    assert a.get('all') is None
@@ -0,0 +1,70 @@
+import pytest
+
+from database import stock
+from database.stock import StockAggregator
+
+
+def _scans(backend, *quantities, product_id='TEL-4567', scanned_at='2026-01-05T10:00:00Z'):
+    return backend.insert_inventory([
+        {'robot_id': 'RB-001', 'product_id': product_id, 'quantity': q, 'zone': 'A', 'scanned_at': scanned_at}
+        for q in quantities
+    ])
+
+
+@pytest.fixture
+def aggregator(backend):
+    aggregator = StockAggregator()
+    aggregator.rebuild()
+    return aggregator
+
+
+def test_overlap_window_is_not_counted_twice(backend, aggregator, monkeypatch):
+    monkeypatch.setattr(stock, 'FETCH_CHUNK', 2)
+    base = aggregator.totals().get('TEL-4567', 0)
+    _scans(backend, 1, 2, 3)
+    aggregator.refresh()
+    assert aggregator.totals()['TEL-4567'] == base + 6
+
+    # Повторное чтение окна перекрытия ничего не добавляет
+    aggregator.refresh()
+    _scans(backend, 4)
+    aggregator.refresh()
+    assert aggregator.totals()['TEL-4567'] == base + 10
+
+
+def test_row_committed_out_of_order_is_counted_once(backend, aggregator):
+    base = aggregator.totals().get('TEL-4567', 0)
+    rows = _scans(backend, 1, 10, 100)
+    late = rows[1]
+    # Строка со средним id ещё не закоммичена, когда агрегатор читает соседние
+    with backend._tx() as conn:
+        conn.execute('DELETE FROM inventory_history WHERE id = ?', (late['id'],))
+    aggregator.refresh()
+    assert aggregator.totals()['TEL-4567'] == base + 101
+
+    with backend._tx() as conn:
+        conn.execute(
+            'INSERT INTO inventory_history (id, robot_id, product_id, quantity, zone, scanned_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (late['id'], late['robot_id'], late['product_id'], late['quantity'], late['zone'], late['scanned_at'])
+        )
+    aggregator.refresh()
+    aggregator.refresh()
+    assert aggregator.totals()['TEL-4567'] == base + 111
+
+
+def test_totals_include_archived_baseline(backend, aggregator):
+    base = aggregator.totals().get('TEL-4567', 0)
+    old = _scans(backend, 5, 7, scanned_at='2025-01-01T10:00:00Z')
+    _scans(backend, 11)
+    aggregator.refresh()
+
+    archived = backend.compact_inventory([(old[0]['id'], old[-1]['id'])], '2025-06-01T00:00:00Z')
+    assert archived == 2
+    # Полный пересчёт: базовые остатки архива плюс оставшаяся история
+    rebuilt = StockAggregator()
+    rebuilt.rebuild()
+    assert rebuilt.totals()['TEL-4567'] == base + 23
+    # Инкрементальный агрегатор после архивации не теряет и не удваивает сумму
+    aggregator.refresh()
+    assert aggregator.totals()['TEL-4567'] == base + 23
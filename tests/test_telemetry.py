@@ -0,0 +1,48 @@
+import pytest
+
+from app import app
+from database.live_state import live_state
+from database.models import get_inventory_history, get_robots
+from conftest import robot_message
+from services.telemetry import parse_message
+
+
+@pytest.mark.parametrize('battery', [40000, -1, 100.5, True, '50'])
+def test_battery_out_of_range_is_rejected(battery):
+    message = robot_message()
+    message['battery_level'] = battery
+    with pytest.raises(ValueError):
+        parse_message(message)
+
+
+def test_rejected_message_writes_nothing(backend):
+    live_state.ensure_loaded(backend)
+    message = robot_message()
+    message['battery_level'] = 40000
+    response = app.test_client().post('/api/robots/data', json=message)
+    assert response.status_code == 400
+    assert get_robots() == [] and get_inventory_history(10) == []
+
+
+def test_message_updates_storage_and_live_state(backend):
+    live_state.ensure_loaded(backend)
+    response = app.test_client().post('/api/robots/data', json=robot_message())
+    assert response.status_code == 200
+    [robot] = live_state.robots()
+    assert robot['id'] == 'RB-001' and robot['battery_level'] == 87
+    assert [row['robot_id'] for row in live_state.recent_inventory(10)] == ['RB-001']
+    assert len(get_inventory_history(10)) == 1
+
+
+def test_live_state_ignores_battery_outside_its_column(backend):
+    live_state.ensure_loaded(backend)
+    live_state.apply_robots([{'id': 'RB-OLD', 'battery_level': 40000, 'status': 'active'}])
+    assert live_state.robots()[0]['battery_level'] is None
+
+
+@pytest.mark.parametrize('row, shelf', [(-1, 1), (1, -1), (2 ** 20 - 1, 1), (1, 2 ** 20)])
+def test_location_outside_cell_key_is_rejected(row, shelf):
+    message = robot_message()
+    message['location'].update(row=row, shelf=shelf)
+    with pytest.raises(ValueError):
+        parse_message(message)
@@ -0,0 +1,14 @@
+from database.cache import users_cache
+from database.models import get_user_by_id, get_user_by_name
+
+
+def test_user_miss_is_not_cached(backend):
+    users_cache.invalidate()
+    assert get_user_by_name('new-user') is None
+
+    # Пользователя создал другой воркер: кэш этого процесса не сброшен
+    row = backend.create_user({'name': 'new-user', 'password': 'secret', 'role': 'Логист'})
+
+    assert get_user_by_name('new-user').id == row['id']
+    assert get_user_by_id(row['id']).name == 'new-user'
+    assert users_cache.get(('name', 'new-user')) is not None
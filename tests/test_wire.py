@@ -0,0 +1,50 @@
+import struct
+
+import pytest
+
+from services import wire
+from services.wire import decode_batch, encode_batch, gunzip
+
+
+def _message(i, scans=3):
+    return {
+        'robot_id': f'RB-{i:03d}',
+        'timestamp': '2026-01-05T10:00:00.123456Z',
+        'location': {'zone': 'ABCDE'[i % 5], 'row': i % 20 + 1, 'shelf': i % 10 + 1},
+        'scan_results': [
+            {'product_id': f'TEL-{i}-{j}', 'quantity': i * 10 + j - 5, 'status': f'STATUS-{i}-{j}'}
+            for j in range(scans)
+        ],
+        'battery_level': None if i % 7 == 0 else 12.5 + i % 80,
+    }
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip_with_more_than_255_strings(compress):
+    messages = [_message(i) for i in range(120)]  # 120 роботов + 360 товаров + 360 статусов + зоны
+    data = encode_batch(messages, compress=compress)
+    if compress:
+        data = gunzip(data, 10 * 1024 * 1024)
+    assert decode_batch(data) == messages
+
+
+def test_decodes_version_1_payloads():
+    # Пачка версии 1: статус сканирования — u8
+    strings = ['RB-001', 'A', 'TEL-4567', 'OK']
+    data = bytearray(struct.pack('<2sB', wire.MAGIC, 1))
+    data += struct.pack('<H', len(strings))
+    for value in strings:
+        data += bytes((len(value),)) + value.encode()
+    data += struct.pack('<H', 1)
+    data += struct.pack('<HHHHqHB', 0, 1, 2, 3, 0, 0xFFFF, 1)
+    data += struct.pack('<HiB', 2, 7, 3)
+    [message] = decode_batch(bytes(data))
+    assert message['scan_results'] == [{'product_id': 'TEL-4567', 'quantity': 7, 'status': 'OK'}]
+    assert message['location'] == {'zone': 'A', 'row': 2, 'shelf': 3}
+
+
+def test_out_of_range_values_raise_value_error():
+    message = _message(1)
+    message['location']['row'] = 70000
+    with pytest.raises(ValueError):
+        encode_batch([message])